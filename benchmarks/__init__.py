@@ -0,0 +1 @@
+"""Offline benchmarks, run them from project root, e.g. ``python -m benchmarks.bench_connection_reuse``."""
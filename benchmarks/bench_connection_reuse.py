@@ -0,0 +1,48 @@
+"""Latency of sequential HTTPS requests with and without connection reuse.
+
+Usage: ``python -m benchmarks.bench_connection_reuse [requests] [latency_seconds]``
+"""
+import statistics
+import sys
+import time
+
+import requests
+
+from benchmarks.stubs import StubServer, json_route
+from explore_gen_ai_apis import clients
+
+
+def measure(send, count: int) -> list[float]:
+    """Call `send` `count` times and return latencies in milliseconds."""
+    latencies = []
+    for __ in range(count):
+        start = time.perf_counter()
+        send()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<20} mean={statistics.mean(latencies):7.2f}ms p50={quantiles[49]:7.2f}ms "
+        f"p95={quantiles[94]:7.2f}ms p99={quantiles[98]:7.2f}ms"
+    )
+
+
+def main(count: int = 200, latency: float = 0.0) -> None:
+    with StubServer({"/": json_route({"ok": True})}, latency=latency, tls=True) as stub:
+        url = f"{stub.url}/v1/echo"
+        session = clients.new_session()
+
+        no_reuse = measure(lambda: requests.post(url, json={"prompt": "x"}, verify=stub.cert), count)
+        reuse = measure(lambda: session.post(url, json={"prompt": "x"}, verify=stub.cert), count)
+
+    print(f"{count} sequential POST requests to {url}, server latency {latency * 1000:.0f}ms")
+    report("requests.post", no_reuse)
+    report("pooled session", reuse)
+    print(f"speedup (mean): {statistics.mean(no_reuse) / statistics.mean(reuse):.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(cast(arg) for cast, arg in zip((int, float), sys.argv[1:])))
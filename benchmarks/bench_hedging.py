@@ -0,0 +1,84 @@
+"""Tail latency of streamed summarization with and without hedging against stubs with occasional slow responses.
+
+Both OpenAI and Anthropic stubs answer after `--latency` seconds, but a `--slow-share` of responses start only after
+`--slow-seconds`, independently per request. Calls are made from `--concurrency` threads, plain and hedged, and
+time to first token and total time of each are compared.
+
+Usage: ``python -m benchmarks.bench_hedging [--calls N] [--slow-share 0.03] [--slow-seconds 1.0]``
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stubs import (
+    Route, StubServer, anthropic_messages_route, chat_completions_route, configure_providers, uncached_summarizer
+)
+
+
+def with_tail(route: Route, latency: float, slow_share: float, slow_seconds: float, seed: int) -> Route:
+    """`route` answering after `latency` seconds, or `slow_seconds` for a `slow_share` of requests."""
+    generator = random.Random(seed)
+    lock = threading.Lock()
+
+    def slow_route(method, path, body):
+        with lock:
+            slow = generator.random() < slow_share
+        time.sleep(slow_seconds if slow else latency)
+        return route(method, path, body)
+
+    return slow_route
+
+
+def percentiles(values: list[float]) -> str:
+    cuts = statistics.quantiles(values, n=100)
+    return f"p50 {cuts[49] * 1000:7.1f}ms  p95 {cuts[94] * 1000:7.1f}ms  p99 {cuts[98] * 1000:7.1f}ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slow-share", type=float, default=0.03)
+    parser.add_argument("--slow-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    tail = args.latency, args.slow_share, args.slow_seconds
+    routes = {
+        "/v1/chat/completions": with_tail(chat_completions_route(400), *tail, seed=1),
+        "/v1/messages": with_tail(anthropic_messages_route(400), *tail, seed=2),
+    }
+    with StubServer(routes) as stub:
+        configure_providers(stub.url)
+        from explore_gen_ai_apis import hedging
+
+        generator = uncached_summarizer()
+
+        def call(hedge: bool) -> tuple[float, float]:
+            start = time.perf_counter()
+            chunks = generator.execute_stream("Some text.", "OpenAI", hedge=hedge)
+            next(chunks)
+            ttft = time.perf_counter() - start
+            for __ in chunks:
+                pass
+            return ttft, time.perf_counter() - start
+
+        for hedge in (False, True):
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                results = list(pool.map(lambda __: call(hedge), range(args.calls)))
+            label = "hedged" if hedge else "plain "
+            print(f"{label}  first token {percentiles([ttft for ttft, __ in results])}")
+            print(f"{label}  total       {percentiles([total for __, total in results])}")
+        for row in hedging.report("text_summarization"):
+            print(
+                f"hedging fired in {row['fired %']}% of {row['calls']} calls, backup won {row['backup won']}, "
+                f"p99 first token {row['p99 alone ms']}ms alone vs {row['p99 hedged ms']}ms hedged, "
+                f"saved {row['p99 saved ms']}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Wall time of generating many variants of an image at once versus a single image, per provider.
+
+Stability AI and getimg.ai stubs answer after `--latency` seconds, replicate.com predictions succeed `--render-seconds`
+after they are created and are polled by the shared poller. Every variant has its own seed, so none is a cache hit.
+
+Usage: ``python -m benchmarks.bench_image_variants [--variants 16] [--latency 1.0] [--render-seconds 2.0]``
+"""
+import argparse
+import base64
+import os
+import tempfile
+import time
+
+from benchmarks.stubs import FakeReplicate, StubServer, configure_providers, file_route, json_route
+
+
+def delayed(route, seconds: float):
+    def slow_route(method, path, body):
+        time.sleep(seconds)
+        return route(method, path, body)
+
+    return slow_route
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--variants", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--render-seconds", type=float, default=2.0)
+    parser.add_argument("--payload-size", type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    getimg = json_route({"image": base64.b64encode(os.urandom(args.payload_size)).decode()})
+    with StubServer({}) as stub:
+        replicate = FakeReplicate(f"{stub.url}/files/replicate.webp", args.render_seconds)
+        stub.add_routes({
+            "/files/": file_route(args.payload_size, "image/webp"),
+            "/v2beta/stable-image/generate/": delayed(file_route(args.payload_size, "image/webp"), args.latency),
+            "/v1/models/": replicate.route,
+            "/v1/predictions/": replicate.route,
+            "/v1/flux-schnell/text-to-image": delayed(getimg, args.latency),
+        })
+        configure_providers(stub.url)
+        from explore_gen_ai_apis import image_cache
+        from explore_gen_ai_apis.image_generation import Generator
+
+        generator = Generator(image_cache.ImageCache(tempfile.mkdtemp(prefix="bench-images-"), 1 << 30))
+        for provider in Generator.MODELS:
+            timings = {}
+            for count in (1, args.variants):
+                start = time.perf_counter()
+                images = generator.variants("A cave", provider, count)
+                failed = sum(isinstance(image, Exception) for __, image, __ in images)
+                timings[count] = time.perf_counter() - start, failed
+            (one, __), (many, failed) = timings[1], timings[args.variants]
+            print(
+                f"{provider:<13} 1 image {one:5.2f}s  {args.variants} variants {many:5.2f}s "
+                f"({many / one:.2f}x, {failed} failed)"
+            )
+        print(f"replicate.com predictions polled {replicate.polls} times")
+
+
+if __name__ == "__main__":
+    main()
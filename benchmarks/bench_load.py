@@ -0,0 +1,369 @@
+"""Many concurrent browser sessions submitting forms on every page of a running app, against local provider stubs.
+
+The app is started with ``streamlit run`` in a subprocess, the way it is deployed, with every provider pointed to one
+stub server. A simulated session is a headless websocket client that speaks Streamlit's protocol: for each page it
+loads the page, submits its form with the page's default text, and reruns the result fragment on the interval the
+server asks for, like a browser does, until the result is shown. Words of the text are shuffled on every submission,
+so summary cache and translation memory miss, ``--repeat-text`` sends the text as is.
+
+Levels of concurrency run one after another on the same server, every level's sessions go through all pages
+``--rounds`` times on fresh connections. Reported per level:
+
+* server-side latency of script runs (page loads, form submissions and fragment reruns), measured from sending a rerun
+  to its ``script_finished`` message over loopback, and time from submitting a form to its result;
+* forms completed per second and failed ones;
+* peak thread count and resident memory of the server, and memory left after sessions disconnected.
+
+Saturation point is the first level at which throughput grows by less than ``--saturation`` (10%) over the previous
+level, sessions past it only wait longer.
+
+Usage: ``python -m benchmarks.bench_load [--levels 1,2,4,8,16,32] [--rounds 1] [--latency 0.2] [--pages SUBSTRING]
+[--repeat-text] [--timeout 120]``
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass, field
+
+from benchmarks.stubs import StubServer, configure_providers, provider_routes
+
+
+ENTRYPOINT = "st_entrypoint.py"
+# Texts of elements shown while a call is still running, by `workers.show` and by the video page
+PENDING = ("Waiting for ", "Video ")
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class ServerProcess:
+    """``streamlit run`` of the app in a subprocess, with its thread count and memory sampled in background."""
+    def __init__(self, environment: dict[str, str], interval: float = 0.1):
+        self.port = free_port()
+        self.interval = interval
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", ENTRYPOINT, "--server.headless", "true",
+                "--server.port", str(self.port), "--browser.gatherUsageStats", "false",
+            ],
+            env=environment, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        self.peak_threads = self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+    def status(self) -> tuple[int, int]:
+        """Thread count and resident set size in bytes."""
+        threads = rss = 0
+        try:
+            with open(f"/proc/{self.process.pid}/status") as status:
+                for line in status:
+                    if line.startswith("Threads:"):
+                        threads = int(line.split()[1])
+                    elif line.startswith("VmRSS:"):
+                        rss = int(line.split()[1]) * 1024
+        except OSError:
+            # Not Linux, sizes of the server can't be read, of this process are no substitute
+            pass
+        return threads, rss
+
+    def reset_peaks(self) -> None:
+        self.peak_threads, self.peak_rss = self.status()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            threads, rss = self.status()
+            self.peak_threads = max(self.peak_threads, threads)
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def __enter__(self) -> "ServerProcess":
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=1)
+                break
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"Streamlit didn't start:\n{self.output()}")
+                time.sleep(0.2)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self.process.terminate()
+        self.process.wait()
+        self.log.close()
+
+    def output(self) -> str:
+        self.log.seek(0)
+        return self.log.read().decode(errors="replace")
+
+
+@dataclass
+class Run:
+    """What a browser would show after a script run."""
+    seconds: float
+    pages: dict[str, str] = field(default_factory=dict)
+    texts: list[str] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+    # Widget id and default value of the form's text area
+    text_area: tuple[str, str] | None = None
+    submit: str | None = None
+    # Fragment id -> seconds between its reruns
+    fragments: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def pending(self) -> bool:
+        return any(text.startswith(PENDING) for text in self.texts)
+
+
+class Session:
+    """Headless browser tab, a websocket connection to the app that sends reruns and reads what they render."""
+    def __init__(self, url: str):
+        self.url = url
+        self.connection = None
+        self.pages: dict[str, str] = {}
+
+    async def __aenter__(self) -> "Session":
+        from tornado.websocket import websocket_connect
+
+        self.connection = await websocket_connect(self.url, subprotocols=["streamlit"], max_message_size=1 << 28)
+        self.pages = (await self.run("")).pages
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.connection.close()
+
+    async def run(self, page: str, widgets: list | None = None, fragment: str = "") -> Run:
+        """Rerun page, or only its fragment, with widget states, and collect its output."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        state = message.rerun_script
+        state.page_script_hash = page
+        state.fragment_id = fragment
+        state.is_auto_rerun = bool(fragment)
+        state.widget_states.widgets.extend(widgets or [])
+        start = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        run = Run(0.0)
+        while True:
+            raw = await self.connection.read_message()
+            if raw is None:
+                raise ConnectionError("Server closed connection")
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            match forward.WhichOneof("type"):
+                case "new_session":
+                    # Full rerun, e.g. one started by `st.rerun` in a fragment, replaces the page
+                    run = Run(0.0, {page.page_name: page.page_script_hash for page in forward.new_session.app_pages})
+                case "auto_rerun":
+                    run.fragments[forward.auto_rerun.fragment_id] = forward.auto_rerun.interval
+                case "delta" if forward.delta.WhichOneof("type") == "new_element":
+                    self._read_element(forward.delta.new_element, run)
+                case "script_finished":
+                    if forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                        run.seconds = time.perf_counter() - start
+                        return run
+
+    @staticmethod
+    def _read_element(element, run: Run) -> None:
+        from streamlit.proto.Alert_pb2 import Alert
+
+        match element.WhichOneof("type"):
+            case "markdown":
+                run.texts.append(element.markdown.body)
+            case "alert":
+                run.texts.append(element.alert.body)
+                if element.alert.format == Alert.ERROR:
+                    run.errors.append(element.alert.body)
+            case "exception":
+                run.errors.append(f"{element.exception.type}: {element.exception.message}")
+            case "text_area" if element.text_area.form_id:
+                run.text_area = element.text_area.id, element.text_area.default
+            case "button" if element.button.is_form_submitter:
+                run.submit = element.button.id
+
+
+@dataclass
+class Form:
+    """Form submitted on a page."""
+    page: str
+    runs: list[float]
+    # Seconds from submission to result, None if page has no form
+    seconds: float | None
+    error: str | None = None
+
+
+def _text(default: str, repeat: bool, generator: random.Random) -> str:
+    if repeat:
+        return default
+    words = default.split()
+    generator.shuffle(words)
+    return " ".join(words)
+
+
+async def submit_form(session: Session, page: str, args, generator: random.Random) -> Form:
+    """Load page, submit its form and rerun result fragments until result is shown."""
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    loaded = await session.run(session.pages[page])
+    runs = [loaded.seconds]
+    if loaded.submit is None:
+        return Form(page, runs, None, loaded.errors[0] if loaded.errors else None)
+    widgets = [WidgetState(id=loaded.submit, trigger_value=True)]
+    if loaded.text_area is not None:
+        text_area, default = loaded.text_area
+        widgets.append(WidgetState(id=text_area, string_value=_text(default, args.repeat_text, generator)))
+    start = time.perf_counter()
+    run = await session.run(session.pages[page], widgets)
+    runs.append(run.seconds)
+    fragments = run.fragments
+    while run.pending and not run.errors:
+        if time.perf_counter() - start > args.timeout:
+            return Form(page, runs, None, f"No result in {args.timeout}s")
+        # A browser reruns every fragment on its own interval, the first one due is enough to see the result
+        fragment, interval = min(fragments.items(), key=lambda item: item[1], default=("", 0.5))
+        await asyncio.sleep(interval)
+        run = await session.run(session.pages[page], fragment=fragment)
+        runs.append(run.seconds)
+        fragments = run.fragments or fragments
+    return Form(page, runs, time.perf_counter() - start, run.errors[0] if run.errors else None)
+
+
+async def simulate(url: str, pages: list[str], index: int, args) -> list[Form]:
+    """One user going through all pages, starting at a different one than the other users."""
+    generator = random.Random(index)
+    forms = []
+    order = pages[index % len(pages):] + pages[:index % len(pages)]
+    for __ in range(args.rounds):
+        try:
+            async with Session(url) as session:
+                for page in order:
+                    forms.append(await submit_form(session, page, args, generator))
+        except Exception as error:
+            forms.append(Form("connection", [], None, f"{type(error).__name__}: {error}"))
+    return forms
+
+
+async def load_level(url: str, pages: list[str], sessions: int, args) -> tuple[list[Form], float]:
+    start = time.perf_counter()
+    results = await asyncio.gather(*(simulate(url, pages, index, args) for index in range(sessions)))
+    return [form for forms in results for form in forms], time.perf_counter() - start
+
+
+def percentile(values: list[float], share: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else float("nan")
+    return statistics.quantiles(values, n=100, method="inclusive")[round(share * 100) - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="comma separated numbers of concurrent sessions")
+    parser.add_argument("--rounds", type=int, default=1, help="times every session goes through all pages")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds every stub response takes")
+    parser.add_argument("--payload-size", type=int, default=64 * 1024)
+    parser.add_argument("--pages", default="", help="only pages whose name contains this")
+    parser.add_argument("--repeat-text", action="store_true", help="submit default texts, so caches hit")
+    parser.add_argument("--timeout", type=float, default=120, help="max seconds to wait for a result")
+    parser.add_argument("--saturation", type=float, default=0.1, help="min throughput growth between levels")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+    # Every session holds a websocket, and the server a socket of each
+    __, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    directory = tempfile.mkdtemp(prefix="bench-load-")
+    with StubServer({}, latency=args.latency) as stub:
+        stub.add_routes(provider_routes(stub.url, args.payload_size, render_seconds=3.0))
+        configure_providers(stub.url)
+        environment = {
+            **os.environ,
+            "METRICS_PORT": "0",
+            "IMAGE_SERVER_PORT": "0",
+            "MEDIA_SERVER_PORT": "0",
+            "AUDIO_SPOOL_PORT": "0",
+            "IMAGE_CACHE_DIR": os.path.join(directory, "images"),
+            "MEDIA_CACHE_DIR": os.path.join(directory, "media"),
+            "AUDIO_SPOOL_DIR": os.path.join(directory, "audio"),
+            "SUMMARY_CACHE_PATH": os.path.join(directory, "summaries.sqlite3"),
+            "TRANSLATION_MEMORY_PATH": os.path.join(directory, "translation_memory.sqlite3"),
+        }
+        with ServerProcess(environment) as server:
+            async def warm_up() -> list[str]:
+                async with Session(server.url) as session:
+                    return [page for page in session.pages if page != "st entrypoint" and args.pages in page]
+
+            pages = asyncio.run(warm_up())
+            # First forms import provider SDKs and start shared servers, that's startup cost, not load
+            asyncio.run(load_level(server.url, pages, 1, args))
+            __, baseline = server.status()
+            print(f"{len(pages)} pages: {', '.join(pages)}, server RSS after warm-up {baseline / 2 ** 20:.1f}MiB")
+            print(
+                f"{'sessions':>8} {'forms':>6} {'failed':>6} {'forms/s':>8} {'run p50':>8} {'run p95':>8} "
+                f"{'run p99':>8} {'result p50':>10} {'result p95':>10} {'threads':>7} {'peak RSS':>9} {'RSS after':>9}"
+            )
+            throughputs = []
+            failures = []
+            for sessions in levels:
+                server.reset_peaks()
+                forms, seconds = asyncio.run(load_level(server.url, pages, sessions, args))
+                # Sessions are gone, what's left is kept by the server, e.g. caches, or leaked
+                time.sleep(1.0)
+                __, rss = server.status()
+                runs = [run for form in forms for run in form.runs]
+                results = [form.seconds for form in forms if form.seconds is not None and form.error is None]
+                failed = [form for form in forms if form.error is not None]
+                failures.extend(failed)
+                throughputs.append((sessions, len(results) / seconds))
+                print(
+                    f"{sessions:>8} {len(forms):>6} {len(failed):>6} {throughputs[-1][1]:>8.2f} "
+                    f"{percentile(runs, 0.5) * 1000:>6.0f}ms {percentile(runs, 0.95) * 1000:>6.0f}ms "
+                    f"{percentile(runs, 0.99) * 1000:>6.0f}ms {percentile(results, 0.5):>9.2f}s "
+                    f"{percentile(results, 0.95):>9.2f}s {server.peak_threads:>7} "
+                    f"{server.peak_rss / 2 ** 20:>7.1f}Mi {rss / 2 ** 20:>7.1f}Mi"
+                )
+
+            saturated = next(
+                (
+                    (previous, current) for previous, current in zip(throughputs, throughputs[1:])
+                    if current[1] < previous[1] * (1 + args.saturation)
+                ),
+                None
+            )
+            if saturated is None:
+                print(f"Throughput still grows at {levels[-1]} sessions, try more")
+            else:
+                (sessions, throughput), (more, __) = saturated
+                print(
+                    f"Saturated at {sessions} sessions, {throughput:.2f} forms/s, {more} sessions don't complete "
+                    f"{args.saturation:.0%} more"
+                )
+            print(f"Server RSS grew by {(rss - baseline) / 2 ** 20:.1f}MiB over all levels")
+            for form in failures[:10]:
+                print(f"  failed {form.page}: {form.error[:100]}")
+
+
+if __name__ == "__main__":
+    main()
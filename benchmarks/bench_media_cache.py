@@ -0,0 +1,64 @@
+"""Replays of generated audio and video straight from the provider versus from the local media cache.
+
+Every file of `--files` is played `--replays` times, a play is a request of the first 64 KiB followed by a seek, a
+``Range`` request of a random 64 KiB further on. The stub provider answers after `--latency` seconds and ignores
+``Range``, like storage behind expiring urls often does, so players download whole files from it.
+
+Usage: ``python -m benchmarks.bench_media_cache [--files 20] [--replays 5] [--size 4194304] [--latency 0.1]``
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import requests
+
+from benchmarks.stubs import StubServer, configure_providers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--replays", type=int, default=5)
+    parser.add_argument("--size", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    contents = {f"/files/{i}.mp4": os.urandom(args.size) for i in range(args.files)}
+    served = 0
+
+    def provider(method, path, body):
+        nonlocal served
+        served += args.size
+        return 200, "video/mp4", contents[path]
+
+    generator = random.Random(0)
+    with StubServer({"/files/": provider}, latency=args.latency) as stub:
+        configure_providers(stub.url)
+        from explore_gen_ai_apis import media_cache
+
+        cache = media_cache.MediaCache(tempfile.mkdtemp(prefix="bench-media-"), 1 << 34, 3600)
+        session = requests.Session()
+        for mode in ("provider", "media cache"):
+            served = 0
+            timings = []
+            for __ in range(args.replays):
+                for path in contents:
+                    start = time.perf_counter()
+                    url = stub.url + path if mode == "provider" else media_cache.url(stub.url + path, cache=cache)
+                    offset = generator.randrange(65536, args.size - 65536)
+                    for first in (0, offset):
+                        response = session.get(url, headers={"Range": f"bytes={first}-{first + 65535}"})
+                        response.raise_for_status()
+                    timings.append(time.perf_counter() - start)
+            cuts = statistics.quantiles(timings, n=100)
+            print(
+                f"{mode:<12} play p50 {cuts[49] * 1000:7.1f}ms p99 {cuts[98] * 1000:7.1f}ms, "
+                f"{served / 2 ** 20:7.1f} MiB from provider"
+            )
+
+
+if __name__ == "__main__":
+    main()
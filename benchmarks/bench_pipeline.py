@@ -0,0 +1,96 @@
+"""Time to first audio and end-to-end time of the summarize -> translate -> TTS chain, pipelined versus back to back.
+
+Summary of `--sentences` sentences is streamed over `--stream-seconds`. Translation (deepl) and TTS (murf) stubs take
+a fixed time per request plus a time per character, so one request for a whole text costs about as much as requests
+for each of its sentences. Back to back run summarizes, then translates and voices the whole summary at once.
+
+Usage: ``python -m benchmarks.bench_pipeline [--sentences 8] [--stream-seconds 2.0] [--runs 3]``
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.stubs import (
+    StubServer, chat_completions_route, configure_providers, deepl_route, file_route, json_route
+)
+
+
+def paced(route, seconds: float, seconds_per_char: float, field: str):
+    def slow_route(method, path, body):
+        value = json.loads(body)[field]
+        chars = sum(map(len, value)) if isinstance(value, list) else len(value)
+        time.sleep(seconds + chars * seconds_per_char)
+        return route(method, path, body)
+
+    return slow_route
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sentences", type=int, default=8)
+    parser.add_argument("--stream-seconds", type=float, default=2.0)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    summary = " ".join(
+        f"Sentence {i} of the summary says something about the input text." for i in range(args.sentences)
+    )
+    pieces = len(summary) // 16 + 1
+    with StubServer({}) as stub:
+        stub.add_routes({
+            "/v1/chat/completions": chat_completions_route(0, summary, args.stream_seconds / pieces),
+            "/v2/translate": paced(deepl_route, 0.15, 0.0005, "text"),
+            "/v1/speech/generate": paced(
+                json_route({"audioFile": f"{stub.url}/files/murf.mp3"}), 0.3, 0.003, "text"
+            ),
+            # Audio is downloaded into the media cache
+            "/files/": file_route(64 * 1024, "audio/mpeg"),
+        })
+        configure_providers(stub.url)
+        from explore_gen_ai_apis import summary_cache, translation, translation_memory
+        from explore_gen_ai_apis.pipeline import Pipeline
+
+        results = {"pipelined": [], "back to back": []}
+        for run in range(args.runs):
+            pipeline = Pipeline("OpenAI", "deepl", "murf")
+            # Fresh caches, so every run calls providers
+            pipeline.summarizer.cache = summary_cache.SummaryCache(":memory:")
+            pipeline.translator = translation.Generator(translation_memory.TranslationMemory(":memory:"))
+            text = f"Article number {run}."
+
+            start = time.perf_counter()
+            segments = pipeline.run(text)
+            first = next(segments).ready
+            while True:
+                try:
+                    next(segments)
+                except StopIteration as stop:
+                    report = stop.value
+                    break
+            results["pipelined"].append((first, time.perf_counter() - start))
+
+            pipeline.summarizer.cache = summary_cache.SummaryCache(":memory:")
+            pipeline.translator = translation.Generator(translation_memory.TranslationMemory(":memory:"))
+            start = time.perf_counter()
+            # Whole summary is there once its stream ends
+            summarized = "".join(pipeline.summarizer.execute_stream(text, "OpenAI"))
+            translated = pipeline.translator.execute(summarized, "deepl")
+            pipeline.speaker.execute(translated, "murf")
+            total = time.perf_counter() - start
+            results["back to back"].append((total, total))
+
+    for mode, timings in results.items():
+        first = statistics.median(first for first, __ in timings)
+        total = statistics.median(total for __, total in timings)
+        print(f"{mode:<13} first audio {first:5.2f}s  end to end {total:5.2f}s")
+    print(f"Stages of the last pipelined run, {report.sequential:.2f}s of provider time in {report.total:.2f}s:")
+    for stage in report.rows():
+        print(
+            f"  {stage['stage']:<13} {stage['items']} outputs, first {stage['first']:5.2f}s, "
+            f"last {stage['last']:5.2f}s, busy {stage['busy']:5.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Latency, throughput and memory of every provider's ``generate_*`` against local HTTPS stubs.
+
+Each case calls one generate method the way pages do, including download of the returned image or audio url, so
+regressions in client setup, pooling, streaming or parsing show up without real API keys. Results are saved as JSON,
+give previous results as ``--baseline`` to compare commits.
+
+Usage: ``python -m benchmarks.bench_providers [--requests N] [--concurrency N] [--latency S] [--payload-size BYTES]
+[--error-rate P] [--only SUBSTRING] [--output FILE] [--baseline FILE]``
+"""
+import argparse
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from benchmarks.stubs import StubServer, configure_providers, provider_routes
+
+
+PROMPT = "The quarterly report shows steady growth in every region. Costs went down. Customers are happy."
+
+
+class PeakRSS:
+    """Samples resident set size in background, `ru_maxrss` only ever grows, so it can't be used per case."""
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = self.start = self.current()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * resource.getpagesize()
+        except OSError:
+            # Not Linux, peak of the whole process is the best available
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self) -> "PeakRSS":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def cases() -> dict[str, Callable[[str], Any]]:
+    """Benchmark case name to a function of prompt, imported after providers are pointed to the stub."""
+    from explore_gen_ai_apis import clients
+    from explore_gen_ai_apis.image_generation import Generator as Image
+    from explore_gen_ai_apis.text_summarization_api import Generator as Summarization
+    from explore_gen_ai_apis.translation import Generator as Translation
+    from explore_gen_ai_apis.tts import Generator as TTS
+    from explore_gen_ai_apis.video_tts import Generator as Video
+
+    def download(url: str) -> bytes:
+        return clients.get_session("benchmark").get(url).content
+
+    def consume(stream) -> str:
+        return "".join(chunk or "" for chunk in stream)
+
+    return {
+        "image/stability": Image.generate_stability,
+        "image/replicate": Image.generate_replicate,
+        "image/getimg": Image.generate_getimg_ai,
+        "summarization/openai": Summarization.generate_openai,
+        "summarization/anthropic": Summarization.generate_anhtropic,
+        "summarization/together": Summarization.generate_together,
+        "summarization/openai-stream": lambda prompt: consume(Summarization.stream_openai(prompt)),
+        "summarization/anthropic-stream": lambda prompt: consume(Summarization.stream_anthropic(prompt)),
+        "summarization/together-stream": lambda prompt: consume(Summarization.stream_together(prompt)),
+        "translation/rapidapi": Translation.generate_rapidapi,
+        "translation/deepl": Translation.generate_deepl,
+        "tts/elevenlabs": lambda prompt: download(TTS.generate_elevenlabs(prompt)),
+        "tts/lovo": lambda prompt: download(TTS.generate_lovo(prompt)),
+        "tts/murf": lambda prompt: download(TTS.generate_murf(prompt)),
+        "video/tavus": Video.video_generate_tavus,
+    }
+
+
+def percentile(values: list[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else float("nan")
+
+
+def run_case(generate: Callable[[str], Any], requests: int, concurrency: int) -> dict:
+    """Call `generate` `requests` times from `concurrency` threads.
+
+    Returns
+    -------
+    dict
+        Latency percentiles in milliseconds, throughput, errors and RSS in MiB.
+    """
+    latencies: list[float] = []
+    errors: list[str] = []
+
+    def call(__):
+        start = time.perf_counter()
+        try:
+            generate(PROMPT)
+        except Exception as error:
+            errors.append(f"{type(error).__name__}: {error}"[:200])
+            return
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    with PeakRSS() as rss, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(call, range(requests)))
+        wall = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_ms": statistics.mean(latencies) if latencies else float("nan"),
+        "throughput_rps": len(latencies) / wall,
+        "peak_rss_mib": rss.peak / 2 ** 20,
+        "rss_growth_mib": (rss.peak - rss.start) / 2 ** 20,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> None:
+    print(f"\nchange against {baseline.get('commit') or 'baseline'}:")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        changes = [
+            f"{key}={(result[key] - before[key]) / before[key] * 100:+6.1f}%"
+            for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "peak_rss_mib")
+            if before[key]
+        ]
+        print(f"{name:<32} {' '.join(changes)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=40, help="requests per case")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel callers per case")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds stub waits before every response")
+    parser.add_argument("--payload-size", type=int, default=256 * 1024, help="bytes of generated image or audio")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of responses replaced by 500")
+    parser.add_argument("--render-seconds", type=float, default=0.0, help="seconds fake tavus video renders")
+    parser.add_argument("--only", action="append", help="run only cases containing this substring")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to save results to")
+    parser.add_argument("--baseline", help="JSON file of earlier results to compare with")
+    args = parser.parse_args()
+
+    stub = StubServer({}, latency=args.latency, tls=True, error_rate=args.error_rate)
+    with stub:
+        stub.add_routes(provider_routes(stub.url, args.payload_size, args.render_seconds))
+        configure_providers(stub.url, stub.cert)
+        selected = {
+            name: generate for name, generate in cases().items()
+            if not args.only or any(part in name for part in args.only)
+        }
+        results = {}
+        print(
+            f"{args.requests} requests x {args.concurrency} callers, latency {args.latency * 1000:.0f}ms, "
+            f"payload {args.payload_size} bytes, error rate {args.error_rate:.0%}"
+        )
+        for name, generate in selected.items():
+            # One warm-up call, so client creation isn't mixed into percentiles
+            try:
+                generate(PROMPT)
+            except Exception:
+                pass
+            results[name] = result = run_case(generate, args.requests, args.concurrency)
+            print(
+                f"{name:<32} p50={result['p50_ms']:8.1f}ms p95={result['p95_ms']:8.1f}ms "
+                f"p99={result['p99_ms']:8.1f}ms {result['throughput_rps']:7.1f} req/s "
+                f"errors={result['errors']:<3} peak RSS={result['peak_rss_mib']:6.1f}MiB"
+            )
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"saved to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
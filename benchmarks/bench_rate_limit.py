@@ -0,0 +1,77 @@
+"""Sustained throughput of summarization calls against a stub that enforces a request quota.
+
+Many threads call `Generator.execute` for as long as given, with client side rate limiting on and off, against a quota
+that is announced in headers and one that is only enforced by 429. Without limiting, calls past the quota fail, with it
+they are paced and retried and the goodput should sit at the quota.
+
+Usage: ``python -m benchmarks.bench_rate_limit [--seconds S] [--threads N] [--quota Q]``
+"""
+import argparse
+import math
+import statistics
+import threading
+import time
+
+from benchmarks.stubs import StubServer, chat_completions_route, configure_providers, uncached_summarizer
+
+
+def hammer(seconds: float, threads: int) -> tuple[int, int, list[float]]:
+    """Call summarization from `threads` threads for `seconds`, returns successes, failures and latencies."""
+    generator = uncached_summarizer()
+    deadline = time.perf_counter() + seconds
+    latencies: list[float] = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                generator.execute("Some text.", "OpenAI")
+            except Exception:
+                with lock:
+                    failures[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker) for __ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(latencies), failures[0], latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--quota", type=int, default=20, help="requests per second the stub allows")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds of stub response time")
+    args = parser.parse_args()
+
+    from explore_gen_ai_apis import clients, rate_limit
+
+    for headers in (True, False):
+        for enabled in (False, True):
+            routes = {"/v1/chat/completions": chat_completions_route(400)}
+            with StubServer(routes, latency=args.latency, quota=args.quota, quota_headers=headers) as stub:
+                configure_providers(stub.url)
+                clients.reset()
+                rate_limit.reset()
+                rate_limit.ENABLED = enabled
+                elapsed = time.perf_counter()
+                ok, failed, latencies = hammer(args.seconds, args.threads)
+                elapsed = time.perf_counter() - elapsed
+                percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [math.nan] * 99
+                p50, p99 = percentiles[49], percentiles[98]
+                print(
+                    f"quota headers {'on ' if headers else 'off'}  limiter {'on ' if enabled else 'off'}  "
+                    f"goodput {ok / elapsed:6.1f}/s (quota {args.quota}/s)  failed {failed:5d}  "
+                    f"429s {stub.throttled:5d}  p50 {p50 * 1000:7.0f}ms  p99 {p99 * 1000:7.0f}ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""CPU time and allocations per summarization rerun, with chat model and chain rebuilt versus shared.
+
+Rebuilt is what the LangChain page used to do on every rerun: a new chat model and a new chain. Each rerun also
+streams one summary from a local stub, so the saving can be compared with the cost of the call itself.
+
+Usage: ``python -m benchmarks.bench_rerun_cache [reruns]``
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.stubs import StubServer, anthropic_messages_route, chat_completions_route, configure_providers
+
+
+def measure(rerun, reruns: int) -> tuple[float, float, float]:
+    """Mean CPU milliseconds, mean peak KiB allocated and mean wall milliseconds of `rerun`."""
+    rerun()
+    tracemalloc.start()
+    cpu = wall = peak = 0.0
+    for __ in range(reruns):
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        start_cpu, start_wall = time.process_time(), time.perf_counter()
+        rerun()
+        cpu += time.process_time() - start_cpu
+        wall += time.perf_counter() - start_wall
+        peak += tracemalloc.get_traced_memory()[1] - start_memory
+    tracemalloc.stop()
+    return cpu / reruns * 1000, peak / reruns / 1024, wall / reruns * 1000
+
+
+def main(reruns: int = 50) -> None:
+    routes = {"/v1/chat/completions": chat_completions_route(400), "/v1/messages": anthropic_messages_route(400)}
+    with StubServer(routes) as stub:
+        configure_providers(stub.url)
+        os.environ["ANTHROPIC_API_URL"] = stub.url
+        from explore_gen_ai_apis import text_summarization_langchain as summarization
+
+        for provider in ("OpenAI", "Anthropic"):
+            def rebuilt(stream: bool):
+                model = summarization._new_chat_model(provider)
+                chain = summarization._new_chain(model, 'Summarize this:\n{input_text}')
+                if stream:
+                    "".join(chain.stream({'input_text': "Some text."}))
+
+            def shared(stream: bool):
+                model = summarization.get_chat_model(provider)
+                chain = summarization._chain(model)
+                if stream:
+                    "".join(chain.stream({'input_text': "Some text."}))
+
+            for stream in (False, True):
+                label = "setup + streamed call" if stream else "setup only"
+                for name, rerun in (("rebuilt", rebuilt), ("shared", shared)):
+                    cpu, peak, wall = measure(lambda: rerun(stream), reruns)
+                    print(
+                        f"{provider:<10} {label:<22} {name:<8} CPU {cpu:7.2f}ms   "
+                        f"peak allocated {peak:8.1f}KiB   wall {wall:7.2f}ms"
+                    )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,73 @@
+"""Latency and failures of summarization with a fixed provider versus ``auto`` routing while a provider degrades.
+
+OpenAI, Anthropic and TogetherAI stubs answer after different latencies. After the first third of calls TogetherAI,
+the fastest, starts failing every request, and it recovers for the last third. The same sequence of calls is made with
+TogetherAI selected by hand and with ``auto``.
+
+Usage: ``python -m benchmarks.bench_routing [--calls N]``
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.stubs import (
+    Route, StubServer, anthropic_messages_route, chat_completions_route, configure_providers, uncached_summarizer
+)
+
+
+class Degrading:
+    """Route wrapper that answers after `latency` seconds, or with 503 while `failing`."""
+    def __init__(self, route: Route, latency: float):
+        self.route = route
+        self.latency = latency
+        self.failing = False
+
+    def __call__(self, method, path, body):
+        time.sleep(self.latency)
+        if self.failing:
+            return 503, "application/json", b'{"error": "overloaded"}'
+        return self.route(method, path, body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=150)
+    args = parser.parse_args()
+
+    openai, together = Degrading(chat_completions_route(400), 0.12), Degrading(chat_completions_route(400), 0.03)
+
+    def completions(method, path, body):
+        # OpenAI and TogetherAI share the path, models tell them apart
+        return together(method, path, body) if b"meta-llama" in body else openai(method, path, body)
+
+    routes = {"/v1/chat/completions": completions, "/v1/messages": Degrading(anthropic_messages_route(400), 0.08)}
+    with StubServer(routes) as stub:
+        configure_providers(stub.url)
+        from explore_gen_ai_apis import rate_limit
+        from explore_gen_ai_apis.text_summarization_api import ROUTER
+
+        # Failures should be seen by the router, not hidden by retries
+        rate_limit.MAX_RETRIES = 0
+        generator = uncached_summarizer()
+        for provider in ("TogetherAI", "auto"):
+            latencies, failures, served = [], 0, {}
+            for i in range(args.calls):
+                together.failing = args.calls // 3 <= i < 2 * args.calls // 3
+                start = time.perf_counter()
+                try:
+                    generator.execute("Some text.", provider)
+                except Exception:
+                    failures += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if provider == "auto":
+                    served[ROUTER.last()] = served.get(ROUTER.last(), 0) + 1
+            cuts = statistics.quantiles(latencies, n=100)
+            print(
+                f"{provider:<11} failed {failures:4d}/{args.calls}  p50 {cuts[49] * 1000:6.1f}ms  "
+                f"p99 {cuts[98] * 1000:6.1f}ms" + (f"  served by {served}" if served else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Import cost of provider SDKs and time to first render of every page, each measured in a fresh interpreter.
+
+Import cost is taken from ``python -X importtime``, first render is the first ``AppTest`` run of a page after
+Streamlit itself is imported, as it is in a running server.
+
+Usage: ``python -m benchmarks.bench_startup [repeat]``
+"""
+import glob
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULES = [
+    "dotenv", "requests", "httpx", "openai", "anthropic", "together", "replicate", "deepl", "tiktoken",
+    "langchain_core", "langchain_openai", "langchain_anthropic", "langchain_google_vertexai",
+    "explore_gen_ai_apis.clients", "explore_gen_ai_apis.image_generation", "explore_gen_ai_apis.text_summarization_api",
+    "explore_gen_ai_apis.text_summarization_langchain", "explore_gen_ai_apis.translation", "explore_gen_ai_apis.tts",
+    "explore_gen_ai_apis.video_tts",
+]
+
+_RENDER = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - start
+print(json.dumps({"first": first, "rerun": rerun, "exceptions": [e.message for e in app.exception]}))
+"""
+
+
+def _environment() -> dict[str, str]:
+    # Pages must not touch real caches or ports of a running app
+    directory = tempfile.mkdtemp(prefix="bench-startup-")
+    return {
+        **os.environ,
+        "METRICS_PORT": "0",
+        "IMAGE_SERVER_PORT": "0",
+        "AUDIO_SPOOL_PORT": "0",
+        "MEDIA_SERVER_PORT": "0",
+        "IMAGE_CACHE_DIR": os.path.join(directory, "images"),
+        "MEDIA_CACHE_DIR": os.path.join(directory, "media"),
+        "AUDIO_SPOOL_DIR": os.path.join(directory, "audio"),
+        "SUMMARY_CACHE_PATH": os.path.join(directory, "summaries.sqlite3"),
+        "TRANSLATION_MEMORY_PATH": os.path.join(directory, "translation_memory.sqlite3"),
+    }
+
+
+def import_seconds(module: str) -> float:
+    """Cumulative import time of `module` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True, env=_environment()
+    )
+    for line in reversed(result.stderr.splitlines()):
+        # "import time: self [us] | cumulative | imported package", nested imports are indented
+        __, cumulative, name = line.split("|")
+        if name.strip() == module and not name[1:].startswith(" "):
+            return int(cumulative) / 1e6
+    raise ValueError(f"{module} not found in import times")
+
+
+def render_seconds(page: str) -> dict:
+    """First render and rerun of `page` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-c", _RENDER, page], capture_output=True, text=True, check=True, env=_environment()
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main(repeat: int = 3) -> None:
+    print("import cost (median of fresh interpreters)")
+    for module in MODULES:
+        if importlib.util.find_spec(module.split(".")[0]) is None:
+            print(f"  {module:<50} not installed")
+            continue
+        seconds = statistics.median(import_seconds(module) for __ in range(repeat))
+        print(f"  {module:<50} {seconds * 1000:8.0f}ms")
+
+    print("time to first render (median of fresh interpreters)")
+    for page in sorted(glob.glob("pages/*.py")):
+        runs = [render_seconds(page) for __ in range(repeat)]
+        first = statistics.median(run["first"] for run in runs)
+        rerun = statistics.median(run["rerun"] for run in runs)
+        exceptions = runs[-1]["exceptions"]
+        print(
+            f"  {page:<50} first {first * 1000:8.0f}ms   rerun {rerun * 1000:6.0f}ms"
+            + (f"   raised: {exceptions[0][:60]}" if exceptions else "")
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,91 @@
+"""Provider calls saved by the near-duplicate summary cache on a stream of edited articles, and its lookup cost.
+
+`--articles` synthetic articles are summarized, then each comes back `--edits` times with a small edit: reflowed
+whitespace, a tracking footer or one sentence replaced. Unrelated articles of the same vocabulary are sent too, any
+cache hit on them is a false hit. Summaries go through `text_summarization_api.Generator` against a counting stub.
+
+Usage: ``python -m benchmarks.bench_summary_cache [--articles 500] [--edits 3] [--threshold 0.8]``
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.stubs import StubServer, chat_completions_route, configure_providers
+
+
+def article(generator: random.Random, vocabulary: list[str], sentences: int = 12) -> list[str]:
+    return [
+        " ".join(generator.choices(vocabulary, k=generator.randint(12, 25))).capitalize() + "."
+        for __ in range(sentences)
+    ]
+
+
+def edit(generator: random.Random, vocabulary: list[str], sentences: list[str]) -> str:
+    match generator.randrange(3):
+        case 0:
+            return "\n\n".join(sentences).replace(" ", "  ")
+        case 1:
+            footer = f"Read more at example.com/?utm_source=news&utm_id={generator.randrange(10 ** 6)}."
+            return " ".join(sentences) + " " + footer
+    changed = list(sentences)
+    changed[generator.randrange(len(changed))] = article(generator, vocabulary, 1)[0]
+    return " ".join(changed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--articles", type=int, default=500)
+    parser.add_argument("--edits", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    generator = random.Random(0)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    originals = [article(generator, vocabulary) for __ in range(args.articles)]
+    edited = [edit(generator, vocabulary, sentences) for sentences in originals for __ in range(args.edits)]
+    unrelated = [" ".join(article(generator, vocabulary)) for __ in range(args.articles)]
+
+    calls = 0
+    completions = chat_completions_route(200)
+
+    def counting(method, path, body):
+        nonlocal calls
+        calls += 1
+        return completions(method, path, body)
+
+    with StubServer({"/v1/chat/completions": counting}) as stub:
+        configure_providers(stub.url)
+        from explore_gen_ai_apis import summary_cache
+        from explore_gen_ai_apis.text_summarization_api import Generator
+
+        cache = summary_cache.SummaryCache(tempfile.mktemp(suffix=".sqlite3"), args.threshold, 100_000)
+        summarizer = Generator(cache)
+        for sentences in originals:
+            summarizer.execute(" ".join(sentences), "OpenAI")
+        calls = 0
+        hits = []
+        for text in edited:
+            start = time.perf_counter()
+            summarizer.execute(text, "OpenAI")
+            if cache.last() is not None:
+                hits.append(time.perf_counter() - start)
+        edited_calls, entries = calls, cache.stats()["entries"]
+        calls = 0
+        for text in unrelated:
+            summarizer.execute(text, "OpenAI")
+        false_hits = len(unrelated) - calls
+
+    print(
+        f"{len(edited)} edited articles: {edited_calls} provider calls, {len(edited) - edited_calls} served from "
+        f"cache ({100 * (1 - edited_calls / len(edited)):.1f}%), exact match cache would serve none"
+    )
+    print(f"{len(unrelated)} unrelated articles: {false_hits} false hits")
+    if len(hits) > 1:
+        cuts = statistics.quantiles(hits, n=100)
+        print(f"cache hit with {entries} entries: p50 {cuts[49] * 1000:.2f}ms p99 {cuts[98] * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Translation throughput, one request per text versus batch path, against local deepl and rapidapi stubs.
+
+Batch path is run twice, second run is served from translation memory.
+
+Usage: ``python -m benchmarks.bench_translation_batch [sentences] [latency_seconds]``
+"""
+import os
+import random
+import sys
+import time
+
+from benchmarks.stubs import StubServer, deepl_route, rapidapi_translate_route
+
+
+BOILERPLATE = [
+    "All rights reserved.",
+    "Terms and conditions apply.",
+    "Contact our support team for more details.",
+    "Prices include VAT.",
+]
+
+
+def corpus(sentences: int, per_document: int = 20, seed: int = 0) -> list[str]:
+    """Documents where about a third of sentences is repeated boilerplate."""
+    rng = random.Random(seed)
+    words = ["product", "order", "delivery", "customer", "price", "quality", "service", "update", "account", "team"]
+    lines = [
+        rng.choice(BOILERPLATE) if rng.random() < 0.35 else f"The {' '.join(rng.choices(words, k=6))} is ready."
+        for __ in range(sentences)
+    ]
+    return [" ".join(lines[start:start + per_document]) for start in range(0, sentences, per_document)]
+
+
+def main(sentences: int = 10_000, latency: float = 0.005) -> None:
+    counter = {"requests": 0}
+
+    def counted(route):
+        def handler(method, path, body):
+            counter["requests"] += 1
+            return route(method, path, body)
+        return handler
+
+    documents = corpus(sentences)
+    with StubServer(
+        {"/v2/translate": counted(deepl_route), "/v1/translate": counted(rapidapi_translate_route)},
+        latency=latency
+    ) as stub:
+        os.environ["DEEPL_SERVER_URL"] = stub.url
+        os.environ["RAPIDAPI_BASE_URL"] = stub.url
+        os.environ.setdefault("DEEPL_API_KEY", "fake:fx")
+        os.environ.setdefault("RAPIDAPI_API_KEY", "fake")
+        from explore_gen_ai_apis.translation import Generator
+        from explore_gen_ai_apis.translation_memory import TranslationMemory
+
+        single_generate = {"deepl": Generator.generate_deepl, "rapidapi": Generator.generate_rapidapi}
+        sample = [sentence + "." for sentence in " ".join(documents).split(". ")][:200]
+        print(f"{sentences} sentences in {len(documents)} documents, server latency {latency * 1000:.0f}ms")
+        for provider in ("deepl", "rapidapi"):
+            start = time.perf_counter()
+            for sentence in sample:
+                single_generate[provider](sentence)
+            single = len(sample) / (time.perf_counter() - start)
+
+            generator = Generator(TranslationMemory(":memory:"))
+            rates = []
+            for __ in range(2):
+                counter["requests"] = 0
+                start = time.perf_counter()
+                generator.execute_batch(documents, provider)
+                rates.append((sentences / (time.perf_counter() - start), counter["requests"]))
+            print(
+                f"{provider:<9} per text: {single:8.0f} segments/s   "
+                f"batch: {rates[0][0]:8.0f} segments/s in {rates[0][1]} requests   "
+                f"batch with warm memory: {rates[1][0]:8.0f} segments/s in {rates[1][1]} requests"
+            )
+
+if __name__ == "__main__":
+    main(*(cast(arg) for cast, arg in zip((int, float), sys.argv[1:])))
@@ -0,0 +1,41 @@
+"""Many concurrent video renders tracked by the shared poller against a fake tavus server.
+
+Usage: ``python -m benchmarks.bench_video_jobs [videos] [render_seconds] [--callback]``
+"""
+import os
+import sys
+import threading
+import time
+
+from benchmarks.stubs import FakeTavus, StubServer
+
+
+def main(videos: int = 50, render_seconds: float = 5.0, callback: bool = False) -> None:
+    tavus = FakeTavus(render_seconds)
+    with StubServer({"/v2/videos": tavus.route}) as stub:
+        os.environ["TAVUS_BASE_URL"] = stub.url
+        os.environ.setdefault("TAVUS_API_KEY", "fake")
+        if callback:
+            os.environ["TAVUS_WEBHOOK_PORT"] = "8765"
+            os.environ["TAVUS_CALLBACK_URL"] = "http://localhost:8765/"
+        # Imported after configuration, so shared poller picks it up
+        from explore_gen_ai_apis.video_tts import Generator
+
+        generator = Generator()
+        start = time.perf_counter()
+        submitted = [generator.submit("Hi, how is your day?", "tavus.io") for __ in range(videos)]
+        # Fake server runs in this process too, so only count threads of job tracking
+        job_threads = [thread.name for thread in threading.enumerate() if thread.name.startswith("job-")]
+        for job in submitted:
+            job.wait(render_seconds * 10)
+        elapsed = time.perf_counter() - start
+
+    ready = sum(job.status.state == "ready" for job in submitted)
+    print(f"{ready}/{videos} videos ready in {elapsed:.1f}s (render takes {render_seconds:.1f}s)")
+    print(f"status polls: {tavus.polls} ({tavus.polls / videos:.1f} per video)")
+    print(f"job tracking threads: {len(job_threads)} {job_threads}")
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--callback"]
+    main(*(cast(arg) for cast, arg in zip((int, float), args)), callback="--callback" in sys.argv)
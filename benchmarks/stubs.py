@@ -0,0 +1,520 @@
+"""Local HTTP(S) stand-ins for provider endpoints."""
+import base64
+import json
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable
+
+
+# Route handler gets request method, path and body and returns status, content type and body. Body given as
+# iterable of chunks is sent with chunked transfer encoding as the chunks are produced.
+Route = Callable[[str, str, bytes], tuple[int, str, bytes | Iterable[bytes]]]
+
+
+def json_route(payload: dict) -> Route:
+    """Route that always answers with the same JSON payload.
+
+    Parameters
+    ----------
+    payload : dict
+        Response body.
+
+    Returns
+    -------
+    Route
+        Route handler.
+    """
+    body = json.dumps(payload).encode()
+    return lambda method, path, request_body: (200, "application/json", body)
+
+
+def self_signed_context() -> tuple[ssl.SSLContext, str]:
+    """Generate self-signed certificate for `localhost` with `openssl` CLI.
+
+    Returns
+    -------
+    tuple[ssl.SSLContext, str]
+        Server SSL context and path to certificate, which clients should pass as `verify`.
+    """
+    directory = tempfile.mkdtemp(prefix="stub-cert-")
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+            "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context, cert
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are expected
+        pass
+
+
+class StubServer:
+    """Threaded HTTP/1.1 keep-alive server that dispatches requests by path prefix.
+
+    Parameters
+    ----------
+    routes : dict[str, Route]
+        Path prefix to handler, longest prefix wins.
+    latency : float
+        Seconds to sleep before every response.
+    tls : bool
+        Serve HTTPS with self-signed certificate.
+    error_rate : float
+        Share of requests answered with 500 instead of calling the route.
+    quota : int
+        Requests allowed per second, the rest are answered with 429 and ``Retry-After``, 0 is unlimited.
+    quota_headers : bool
+        Send OpenAI style ``x-ratelimit-*-requests`` headers with every response when `quota` is set.
+    """
+    def __init__(
+            self,
+            routes: dict[str, Route],
+            latency: float = 0.0,
+            tls: bool = False,
+            error_rate: float = 0.0,
+            quota: int = 0,
+            quota_headers: bool = False
+    ):
+        self.routes: dict[str, Route] = {}
+        self.add_routes(routes)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota = quota
+        self.quota_headers = quota_headers
+        self.throttled = 0
+        self._window = (0, 0)
+        self._quota_lock = threading.Lock()
+        self._random = random.Random(0)
+        self.cert = None
+        self.server = _Server(("127.0.0.1", 0), self._handler())
+        if tls:
+            context, self.cert = self_signed_context()
+            # Handshake happens lazily in request thread, so slow handshakes don't serialize accepts
+            self.server.socket = context.wrap_socket(
+                self.server.socket, server_side=True, do_handshake_on_connect=False
+            )
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def add_routes(self, routes: dict[str, Route]) -> None:
+        """Register more routes, e.g. ones that need `url` of the running server."""
+        self.routes = dict(sorted({**self.routes, **routes}.items(), key=lambda item: -len(item[0])))
+
+    def _take_quota(self) -> tuple[bool, dict[str, str]]:
+        """Count request in current one second window, returns whether it is allowed and quota headers."""
+        now = time.time()
+        with self._quota_lock:
+            window, count = self._window
+            if int(now) != window:
+                window, count = int(now), 0
+            count += 1
+            self._window = window, count
+            allowed = count <= self.quota
+            self.throttled += not allowed
+        reset = window + 1 - now
+        headers = {"Retry-After": "1", "retry-after-ms": str(int(reset * 1000))} if not allowed else {}
+        if self.quota_headers:
+            headers.update({
+                "x-ratelimit-limit-requests": str(self.quota),
+                "x-ratelimit-remaining-requests": str(max(self.quota - count, 0)),
+                "x-ratelimit-reset-requests": f"{int(reset * 1000)}ms",
+            })
+        return allowed, headers
+
+    @property
+    def url(self) -> str:
+        scheme = "https" if self.cert else "http"
+        # `localhost` and not IP, so certificate verification works
+        return f"{scheme}://localhost:{self.server.server_address[1]}"
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, content_type, response = 404, "text/plain", b"not found"
+                allowed, headers = stub._take_quota() if stub.quota else (True, {})
+                if not allowed:
+                    status, content_type, response = 429, "application/json", b'{"error": "rate limit exceeded"}'
+                elif stub.error_rate and stub._random.random() < stub.error_rate:
+                    status, content_type, response = 500, "application/json", b'{"error": "injected failure"}'
+                else:
+                    for prefix, route in stub.routes.items():
+                        if self.path.startswith(prefix):
+                            status, content_type, response = route(self.command, self.path, body)
+                            break
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if isinstance(response, bytes):
+                    self.send_header("Content-Length", str(len(response)))
+                    self.end_headers()
+                    self.wfile.write(response)
+                    return
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in response:
+                    if chunk:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            do_GET = do_POST = _dispatch
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeTavus:
+    """Stateful stand-in for tavus video API, videos become ready `render_seconds` after submission.
+
+    If video is submitted with `callback_url`, final status is also POSTed there.
+    """
+    def __init__(self, render_seconds: float = 3.0):
+        self.render_seconds = render_seconds
+        self.videos: dict[str, dict] = {}
+        self.polls = 0
+        self._lock = threading.Lock()
+
+    def _video(self, video_id: str) -> dict:
+        video = self.videos[video_id]
+        if time.monotonic() - video["submitted"] >= self.render_seconds:
+            return {"video_id": video_id, "status": "ready", "download_url": f"https://example.com/{video_id}.mp4"}
+        return {"video_id": video_id, "status": "generating"}
+
+    def _callback(self, video_id: str, url: str) -> None:
+        import requests
+
+        requests.post(url, json=self._video(video_id), timeout=5)
+
+    def route(self, method: str, path: str, body: bytes) -> tuple[int, str, bytes]:
+        if method == "POST":
+            payload = json.loads(body)
+            with self._lock:
+                video_id = f"v{len(self.videos)}"
+                self.videos[video_id] = {"submitted": time.monotonic()}
+            if payload.get("callback_url"):
+                timer = threading.Timer(self.render_seconds, self._callback, (video_id, payload["callback_url"]))
+                timer.daemon = True
+                timer.start()
+            response = {"video_id": video_id, "status": "queued"}
+        else:
+            video_id = path.rsplit("/", 1)[-1]
+            with self._lock:
+                self.polls += 1
+            if video_id not in self.videos:
+                return 404, "application/json", b'{"error": "not found"}'
+            response = self._video(video_id)
+        return 200, "application/json", json.dumps(response).encode()
+
+
+def _fake_spanish(text: str) -> str:
+    return f"[es] {text}"
+
+
+def deepl_route(method: str, path: str, body: bytes) -> tuple[int, str, bytes]:
+    """Stand-in for deepl `POST /v2/translate`."""
+    texts = json.loads(body)["text"]
+    response = {
+        "translations": [
+            {"detected_source_language": "EN", "text": _fake_spanish(text), "billed_characters": len(text)}
+            for text in texts
+        ]
+    }
+    return 200, "application/json", json.dumps(response).encode()
+
+
+def rapidapi_translate_route(method: str, path: str, body: bytes) -> tuple[int, str, bytes]:
+    """Stand-in for rapidapi `POST /v1/translate`."""
+    from urllib.parse import parse_qs
+
+    text = parse_qs(body.decode())["text"][0]
+    response = {"status": 200, "from": "en", "to": "es", "translated_text": {"es": _fake_spanish(text)}}
+    return 200, "application/json", json.dumps(response).encode()
+
+
+def audio_stream_route(size: int, chunk_size: int = 16 * 1024, chunk_delay: float = 0.0) -> Route:
+    """Route that streams `size` bytes of fake audio in chunks, e.g. elevenlabs `/stream` endpoint."""
+    def chunks():
+        for start in range(0, size, chunk_size):
+            if chunk_delay:
+                time.sleep(chunk_delay)
+            yield b"\xff" * min(chunk_size, size - start)
+
+    return lambda method, path, body: (200, "audio/mpeg", chunks())
+
+
+def _text(size: int) -> str:
+    words = ["summary", "of", "the", "input", "text", "is", "short", "and", "clear"]
+    text = ""
+    while len(text) < size:
+        text += words[len(text) % len(words)] + " "
+    return text[:size].strip() or "ok"
+
+
+def _pieces(text: str, size: int = 16) -> list[str]:
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+def _sse(events: Iterable[tuple[str | None, dict | str]]) -> Iterable[bytes]:
+    for event, data in events:
+        data = data if isinstance(data, str) else json.dumps(data)
+        yield (f"event: {event}\n" if event else "").encode() + f"data: {data}\n\n".encode()
+
+
+def chat_completions_route(size: int, text: str | None = None, piece_delay: float = 0.0) -> Route:
+    """Stand-in for OpenAI compatible `POST /v1/chat/completions` (OpenAI, TogetherAI), plain and streamed.
+
+    `text` is the answer instead of `size` characters of filler, streamed pieces of it come `piece_delay` apart.
+    """
+    text = text or _text(size)
+    tokens = len(text) // 4 + 1
+
+    def route(method, path, body):
+        request = json.loads(body)
+        usage = {"prompt_tokens": 10, "completion_tokens": tokens, "total_tokens": 10 + tokens}
+        base = {"id": "chatcmpl-stub", "created": 0, "model": request["model"]}
+        if not request.get("stream"):
+            return 200, "application/json", json.dumps({
+                **base,
+                "object": "chat.completion",
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                ],
+                "usage": usage,
+            }).encode()
+        chunk = {**base, "object": "chat.completion.chunk"}
+
+        def events():
+            for piece in _pieces(text):
+                if piece_delay:
+                    time.sleep(piece_delay)
+                yield None, {**chunk, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield None, {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            if (request.get("stream_options") or {}).get("include_usage"):
+                yield None, {**chunk, "choices": [], "usage": usage}
+            yield None, "[DONE]"
+
+        return 200, "text/event-stream", _sse(events())
+
+    return route
+
+
+def anthropic_messages_route(size: int) -> Route:
+    """Stand-in for Anthropic `POST /v1/messages`, plain and streamed."""
+    text = _text(size)
+    tokens = len(text) // 4 + 1
+
+    def route(method, path, body):
+        request = json.loads(body)
+        message = {
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": request["model"],
+            "stop_reason": "end_turn", "stop_sequence": None,
+        }
+        if not request.get("stream"):
+            return 200, "application/json", json.dumps({
+                **message,
+                "content": [{"type": "text", "text": text}],
+                "usage": {"input_tokens": 10, "output_tokens": tokens},
+            }).encode()
+        events = [
+            ("message_start", {
+                "type": "message_start",
+                "message": {
+                    **message, "content": [], "stop_reason": None, "usage": {"input_tokens": 10, "output_tokens": 1}
+                },
+            }),
+            ("content_block_start", {
+                "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}
+            }),
+            *(
+                ("content_block_delta", {
+                    "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}
+                })
+                for piece in _pieces(text)
+            ),
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": tokens},
+            }),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+        return 200, "text/event-stream", _sse(events)
+
+    return route
+
+
+def file_route(size: int, content_type: str = "application/octet-stream") -> Route:
+    """Route that answers with `size` bytes, e.g. generated image or audio downloaded by url."""
+    body = b"\x00" * size
+    return lambda method, path, request_body: (200, content_type, body)
+
+
+class FakeReplicate:
+    """Stateful stand-in for replicate predictions API, predictions succeed `render_seconds` after creation.
+
+    Handles ``POST /v1/models/<owner>/<name>/predictions`` and ``GET /v1/predictions/<id>``. With `render_seconds` of 0
+    predictions are created already succeeded, like a request that waited for the prediction.
+    """
+    def __init__(self, output_url: str, render_seconds: float = 0.0):
+        self.output_url = output_url
+        self.render_seconds = render_seconds
+        self.predictions: dict[str, dict] = {}
+        self.polls = 0
+        self._lock = threading.Lock()
+
+    def _prediction(self, prediction_id: str) -> dict:
+        prediction = self.predictions[prediction_id]
+        done = time.monotonic() - prediction["created"] >= self.render_seconds
+        return {
+            "id": prediction_id,
+            "model": prediction["model"],
+            "version": "stub",
+            "status": "succeeded" if done else "processing",
+            "input": prediction["input"],
+            "output": self.output_url if done else None,
+            "logs": "",
+            "error": None,
+            "metrics": {"predict_time": self.render_seconds} if done else {},
+            "created_at": "2024-01-01T00:00:00.000000Z",
+            "urls": {"get": f"{self.output_url}/get", "cancel": f"{self.output_url}/cancel"},
+        }
+
+    def route(self, method: str, path: str, body: bytes) -> tuple[int, str, bytes]:
+        if method == "POST":
+            owner, name = path.split("/")[3:5]
+            with self._lock:
+                prediction_id = f"p{len(self.predictions)}"
+                self.predictions[prediction_id] = {
+                    "created": time.monotonic(), "model": f"{owner}/{name}", "input": json.loads(body).get("input", {})
+                }
+            return 201, "application/json", json.dumps(self._prediction(prediction_id)).encode()
+        prediction_id = path.rsplit("/", 1)[-1]
+        with self._lock:
+            self.polls += 1
+        if prediction_id not in self.predictions:
+            return 404, "application/json", b'{"detail": "not found"}'
+        return 200, "application/json", json.dumps(self._prediction(prediction_id)).encode()
+
+
+def provider_routes(base_url: str, payload_size: int = 64 * 1024, render_seconds: float = 0.0) -> dict[str, Route]:
+    """Routes of every provider used by the app, served on one stub at `base_url`.
+
+    Parameters
+    ----------
+    base_url : str
+        Url of the stub, used in responses that point to generated files.
+    payload_size : int
+        Size in bytes of generated images and audio, text responses are a 64th of it.
+    render_seconds : float
+        Seconds a tavus video takes to render.
+
+    Returns
+    -------
+    dict[str, Route]
+        Path prefix to handler.
+    """
+    text_size = max(payload_size // 64, 16)
+    replicate = FakeReplicate(f"{base_url}/files/replicate.webp")
+    return {
+        "/files/": file_route(payload_size),
+        "/files/replicate.webp": file_route(payload_size, "image/webp"),
+        # Images
+        "/v2beta/stable-image/generate/": file_route(payload_size, "image/webp"),
+        "/v1/models/": replicate.route,
+        "/v1/predictions/": replicate.route,
+        "/v1/flux-schnell/text-to-image": json_route({"image": base64.b64encode(os.urandom(payload_size)).decode()}),
+        # Summarization
+        "/v1/chat/completions": chat_completions_route(text_size),
+        "/v1/messages": anthropic_messages_route(text_size),
+        # Translation
+        "/v2/translate": deepl_route,
+        "/v1/translate": rapidapi_translate_route,
+        # TTS
+        "/v1/text-to-speech/": audio_stream_route(payload_size),
+        "/api/v1/tts/sync": json_route({"data": {"urls": [f"{base_url}/files/lovo.mp3"]}}),
+        "/v1/speech/generate": json_route({"audioFile": f"{base_url}/files/murf.mp3"}),
+        # Video
+        "/v2/videos": FakeTavus(render_seconds).route,
+    }
+
+
+def configure_providers(base_url: str, cert: str | None = None) -> None:
+    """Point every provider client at `base_url` with fake API keys, before clients are created.
+
+    Local image, media and audio servers are used too, benchmarks reach them on ``127.0.0.1``.
+
+    Parameters
+    ----------
+    base_url : str
+        Url of the stub.
+    cert : str, optional
+        Certificate of HTTPS stub, trusted by both `requests` and httpx based clients.
+    """
+    if cert:
+        os.environ["REQUESTS_CA_BUNDLE"] = cert
+        os.environ["SSL_CERT_FILE"] = cert
+    for name in (
+        "STABILITY_AI_BASE_URL", "GETIMG_AI_BASE_URL", "REPLICATE_BASE_URL", "ANTHROPIC_BASE_URL", "DEEPL_SERVER_URL",
+        "RAPIDAPI_BASE_URL", "ELEVENLABS_BASE_URL", "LOVO_BASE_URL", "MURF_BASE_URL", "TAVUS_BASE_URL",
+    ):
+        os.environ[name] = base_url
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["TOGETHER_BASE_URL"] = f"{base_url}/v1"
+    for name in (
+        "STABILITY_AI_API_KEY", "GETIMG_AI_API_KEY", "REPLICATE_API_TOKEN", "OPENAI_API_KEY", "ANTHROPIC_API_KEY",
+        "TOGETHER_API_KEY", "RAPIDAPI_API_KEY", "ELEVENLABS_API_KEY", "LOVO_API_KEY", "MURF_API_KEY", "TAVUS_API_KEY",
+    ):
+        os.environ[name] = "fake"
+    os.environ["DEEPL_API_KEY"] = "fake:fx"
+    os.environ.pop("TAVUS_CALLBACK_URL", None)
+    os.environ.setdefault("FILE_SERVER_HOST", "127.0.0.1")
+
+
+def uncached_summarizer():
+    """Summarization `Generator` with a cache that keeps nothing, so every call with the same prompt reaches the stub.
+
+    Called after `configure_providers`, clients are created with the stub's url.
+    """
+    from explore_gen_ai_apis import summary_cache
+    from explore_gen_ai_apis.text_summarization_api import Generator
+
+    return Generator(cache=summary_cache.SummaryCache(":memory:", max_entries=0))
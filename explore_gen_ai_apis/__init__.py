@@ -0,0 +1,5 @@
+"""Provider code shared by the Streamlit pages.
+
+Every page under ``pages/`` is a thin Streamlit script, the ``Generator`` classes it uses live here so they can be
+reused outside of Streamlit (benchmarks, batch runs).
+"""
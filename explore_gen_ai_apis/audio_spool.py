@@ -0,0 +1,208 @@
+"""Spooling of streamed audio to disk and serving it to the browser while it is still being written.
+
+Streamlit's `st.audio` needs the whole file before playback starts, so instead the page gets url of a `Spool` served
+by a small local HTTP server, if browsers can reach it, see `file_server`. Download keeps writing chunks to the spool
+file in background and the server sends them to the player as soon as they arrive, so memory per request doesn't
+depend on audio length. Once a spool is complete it is served with ``Range`` support, so the player can seek in it.
+If writing fails, the response is cut off without its last chunk, so players and downloads see an error rather than a
+shorter file.
+
+Server listens on `AUDIO_SPOOL_PORT` (8766 by default), `AUDIO_SPOOL_URL` is the address browser reaches it on, see
+`file_server`.
+"""
+import os
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from typing import Iterable, Iterator
+
+from explore_gen_ai_apis import file_server
+
+
+CHUNK_SIZE = file_server.CHUNK_SIZE
+# Number of most recent spool files kept on disk
+KEEP = 100
+
+_lock = threading.Lock()
+_spools: OrderedDict[str, "Spool"] = OrderedDict()
+_downloads = ThreadPoolExecutor(max_workers=8, thread_name_prefix="audio-spool")
+
+
+class Spool:
+    """File that is written by one thread and can be read by others while it grows.
+
+    Parameters
+    ----------
+    content_type : str
+        MIME type of content.
+    suffix : str
+        Spool file suffix.
+    """
+    def __init__(self, content_type: str, suffix: str = ""):
+        self.spool_id = uuid.uuid4().hex
+        self.content_type = content_type
+        directory = os.environ.get("AUDIO_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "audio_spool"))
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, self.spool_id + suffix)
+        self.size = 0
+        self.done = False
+        self.error: Exception | None = None
+        self._cond = threading.Condition()
+        open(self.path, "wb").close()
+
+    def fill(self, chunks: Iterable[bytes]) -> None:
+        """Write chunks to spool file, readers are woken up after every chunk.
+
+        Parameters
+        ----------
+        chunks : Iterable[bytes]
+            Content.
+        """
+        try:
+            with open(self.path, "ab") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    file.flush()
+                    with self._cond:
+                        self.size += len(chunk)
+                        self._cond.notify_all()
+        except Exception as error:
+            self.error = error
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until spool is completely written, returns whether it is."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def read(self) -> Iterator[bytes]:
+        """Read content from the beginning, following the file until writer is done.
+
+        Yields
+        ------
+        bytes
+            Blocks of at most `CHUNK_SIZE` bytes.
+        """
+        offset = 0
+        with open(self.path, "rb") as file:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self.size > offset or self.done)
+                    size, done = self.size, self.done
+                while offset < size:
+                    block = file.read(min(CHUNK_SIZE, size - offset))
+                    offset += len(block)
+                    yield block
+                if done:
+                    return
+
+    @property
+    def url(self) -> str:
+        """Url for the player. Path of spool file once it is complete if server isn't used, Streamlit serves it.
+
+        Raises
+        ------
+        Exception
+            Error of writing, if server isn't used.
+        """
+        base_url = _server.base_url()
+        if base_url is None:
+            self.wait()
+            if self.error is not None:
+                raise self.error
+            return self.path
+        return f"{base_url}/audio/{self.spool_id}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, body: bool) -> None:
+        with _lock:
+            spool = _spools.get(self.path.rsplit("/", 1)[-1])
+        if spool is None:
+            self.send_error(404)
+            return
+        if spool.done and spool.error is not None:
+            self.send_error(502, explain=f"{type(spool.error).__name__}: {spool.error}")
+            return
+        if spool.done:
+            try:
+                content = file_server.open_file(spool.path)
+            except FileNotFoundError:
+                # Removed as one of the oldest spools
+                self.send_error(404)
+                return
+            try:
+                file_server.send(self, content, spool.content_type, f'"{spool.spool_id}"', body)
+            finally:
+                if not isinstance(content, bytes):
+                    content.close()
+            return
+        # Still growing, length is unknown and ranges can't be served
+        self.send_response(200)
+        self.send_header("Content-Type", spool.content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if not body:
+            return
+        try:
+            for block in spool.read():
+                self.wfile.write(f"{len(block):x}\r\n".encode() + block + b"\r\n")
+            if spool.error is not None:
+                # Without the last chunk the player knows audio is incomplete
+                self.close_connection = True
+                return
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Player stopped listening
+            self.close_connection = True
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = file_server.FileServer("audio-spool-server", _Handler, "AUDIO_SPOOL_PORT", 8766, "AUDIO_SPOOL_URL")
+
+
+def spool(chunks: Iterable[bytes], content_type: str, suffix: str = "") -> Spool:
+    """Start writing `chunks` to a new spool in background.
+
+    Parameters
+    ----------
+    chunks : Iterable[bytes]
+        Content, consumed in background thread.
+    content_type : str
+        MIME type of content.
+    suffix : str
+        Spool file suffix.
+
+    Returns
+    -------
+    Spool
+        Spool, its `url` can be given to the player right away.
+    """
+    _server.port()
+    new = Spool(content_type, suffix)
+    with _lock:
+        _spools[new.spool_id] = new
+        while len(_spools) > KEEP:
+            __, old = _spools.popitem(last=False)
+            try:
+                os.remove(old.path)
+            except FileNotFoundError:
+                pass
+    _downloads.submit(new.fill, chunks)
+    return new
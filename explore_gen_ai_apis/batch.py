@@ -0,0 +1,391 @@
+"""Headless batch runs of prompts through the same generators the pages use.
+
+Input is JSON lines, one prompt per line::
+
+    {"id": "42", "task": "translation", "provider": "deepl", "prompt": "Hello there."}
+
+``id`` defaults to the line number, ``task`` and ``provider`` default to the ones given to `run`. Tasks are the
+modules of pages: ``image_generation``, ``text_summarization``, ``text_summarization_langchain``, ``translation``,
+``tts`` and ``video_tts``.
+
+Results are written as soon as they complete, as JSON lines or as Parquet part files in a directory. Output is also the
+checkpoint: rows already written with ``ok`` status are skipped when the run is started again, failed ones are retried.
+Images, audio and videos are stored next to the output, named by sha256 of content. ``tts`` and ``video_tts`` results
+are urls of local servers of this process or of provider's storage, which expire, so those files are always downloaded.
+
+Usage: ``python -m explore_gen_ai_apis.batch input.jsonl output.jsonl [--task T] [--provider P] [--concurrency N]``
+"""
+import argparse
+import base64
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import IO, Any, Callable, Iterable, Iterator
+
+from explore_gen_ai_apis import clients, env
+
+
+TASKS = (
+    "image_generation", "text_summarization", "text_summarization_langchain", "translation", "tts", "video_tts"
+)
+# Tasks whose results are urls of media files, or paths of local files, that don't outlive the run
+MEDIA_TASKS = ("tts", "video_tts")
+# Rows buffered before a Parquet part file is written, rows of unwritten part are redone after interruption
+PARQUET_PART_ROWS = 1000
+
+
+@dataclass
+class BatchStats:
+    """Outcome of a batch run."""
+    done: int = 0
+    failed: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return (self.done + self.failed) / self.seconds if self.seconds else 0.0
+
+
+def _executor(task: str) -> Callable[[str, str], Any]:
+    """Function of prompt and provider for `task`, generators are imported only for tasks that are used."""
+    execute: Callable[[str, str], Any] = None
+    match task:
+        case "image_generation":
+            from explore_gen_ai_apis.image_generation import Generator
+            execute = Generator().execute
+        case "text_summarization":
+            from explore_gen_ai_apis.text_summarization_api import Generator
+            execute = Generator().execute
+        case "text_summarization_langchain":
+            from explore_gen_ai_apis.text_summarization_langchain import generate_response, get_chat_model
+            execute = lambda prompt, provider: generate_response(prompt, get_chat_model(provider))  # noqa: E731
+        case "translation":
+            from explore_gen_ai_apis.translation import Generator
+            execute = Generator().execute
+        case "tts":
+            from explore_gen_ai_apis.tts import Generator
+            execute = Generator().execute
+        case "video_tts":
+            from explore_gen_ai_apis.video_tts import Generator
+            execute = Generator().execute
+        case _:
+            raise ValueError(f"Unknown task {task!r}, expected one of {', '.join(TASKS)}")
+    return execute
+
+
+def _extension(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return ".png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    if data.startswith(b"\xff\xd8"):
+        return ".jpg"
+    if data.startswith(b"ID3") or data[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return ".mp3"
+    if data[4:8] == b"ftyp":
+        return ".mp4"
+    return ".bin"
+
+
+def _store(data: bytes, files_dir: str) -> str:
+    """Write `data` to `files_dir` under its content hash, returns path."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = os.path.join(files_dir, digest + _extension(data))
+    if not os.path.exists(path):
+        os.makedirs(files_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=files_dir)
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp, path)
+    return path
+
+
+def _fetch(output: str) -> bytes:
+    """Content behind url or path of local file that a generator returned."""
+    if not output.startswith(("http://", "https://")):
+        with open(output, "rb") as file:
+            return file.read()
+    response = clients.get_session("batch").get(output)
+    response.raise_for_status()
+    return response.content
+
+
+def read_rows(file: IO[str], task: str | None = None, provider: str | None = None) -> Iterator[dict]:
+    """Parse input JSON lines, filling in defaults.
+
+    Parameters
+    ----------
+    file : IO[str]
+        Input.
+    task : str, optional
+        Task of rows that don't name one.
+    provider : str, optional
+        Provider of rows that don't name one.
+
+    Yields
+    ------
+    dict
+        Rows with ``id``, ``task``, ``provider`` and ``prompt``.
+    """
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        row["id"] = str(row.get("id", number))
+        row.setdefault("task", task)
+        row.setdefault("provider", provider)
+        if not row["task"] or not row["provider"]:
+            raise ValueError(f"Line {number} has no task or provider and no default is given")
+        yield row
+
+
+def execute_rows(
+        rows: Iterable[dict],
+        concurrency: int = 8,
+        files_dir: str | None = None,
+        download: bool = False
+) -> Iterator[dict]:
+    """Run rows through generators, at most `concurrency` at once.
+
+    Rows are read lazily, so input of any size is processed in constant memory.
+
+    Parameters
+    ----------
+    rows : Iterable[dict]
+        Rows with ``id``, ``task``, ``provider`` and ``prompt``.
+    concurrency : int
+        Max number of rows processed in parallel.
+    files_dir : str, optional
+        Directory for binary results, they are inlined as base64 if not given.
+    download : bool
+        Download results of other tasks than `MEDIA_TASKS` that are urls, results of those are always downloaded.
+
+    Yields
+    ------
+    dict
+        Result rows in order of completion, with ``id``, ``task``, ``provider``, ``status`` (``ok`` or ``error``),
+        ``result`` or ``error`` and ``seconds``.
+    """
+    executors: dict[str, Callable[[str, str], Any]] = {}
+    executors_lock = threading.Lock()
+
+    def process(row: dict) -> dict:
+        start = time.perf_counter()
+        result = {"id": row["id"], "task": row["task"], "provider": row["provider"]}
+        try:
+            with executors_lock:
+                if row["task"] not in executors:
+                    executors[row["task"]] = _executor(row["task"])
+            output = executors[row["task"]](row["prompt"], row["provider"])
+            if isinstance(output, str) and (
+                    row["task"] in MEDIA_TASKS or download and output.startswith(("http://", "https://"))
+            ):
+                output = _fetch(output)
+            if not isinstance(output, str):
+                data = bytes(output)
+                output = _store(data, files_dir) if files_dir else base64.b64encode(data).decode()
+            result.update(status="ok", result=output)
+        except Exception as error:
+            result.update(status="error", error=f"{type(error).__name__}: {error}")
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        pending: set[Future] = set()
+        for row in rows:
+            # Bounded window of submitted rows, so a huge input is not all queued up front
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(process, row))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+class _JsonlOutput:
+    def __init__(self, path: str):
+        self.path = path
+
+    def completed(self) -> set[str]:
+        if not os.path.exists(self.path):
+            return set()
+        ids = set()
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line may be cut short by interruption
+                    continue
+                if row.get("status") == "ok":
+                    ids.add(row["id"])
+        return ids
+
+    def __enter__(self) -> "_JsonlOutput":
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def write(self, row: dict) -> None:
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+
+class _ParquetOutput:
+    """Directory of Parquet part files, each written whole, so an interrupted run leaves no broken file."""
+    def __init__(self, path: str):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet output needs `pyarrow` package, install it or use .jsonl output") from None
+        self.path = path
+        self._rows: list[dict] = []
+
+    def completed(self) -> set[str]:
+        import pyarrow.parquet as pq
+
+        ids = set()
+        for part in glob.glob(os.path.join(self.path, "part-*.parquet")):
+            table = pq.read_table(part, columns=["id", "status"])
+            statuses = zip(table["id"].to_pylist(), table["status"].to_pylist())
+            ids.update(id_ for id_, status in statuses if status == "ok")
+        return ids
+
+    def __enter__(self) -> "_ParquetOutput":
+        os.makedirs(self.path, exist_ok=True)
+        return self
+
+    def write(self, row: dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= PARQUET_PART_ROWS:
+            self._flush()
+
+    def _flush(self) -> None:
+        import pyarrow
+        import pyarrow.parquet as pq
+
+        if not self._rows:
+            return
+        columns = ("id", "task", "provider", "status", "result", "error", "seconds")
+        schema = pyarrow.schema(
+            [(column, pyarrow.string()) for column in columns[:-1]] + [("seconds", pyarrow.float64())]
+        )
+        rows = [{column: row.get(column) for column in columns} for row in self._rows]
+        table = pyarrow.Table.from_pylist(rows, schema)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        os.close(fd)
+        pq.write_table(table, tmp)
+        os.replace(tmp, os.path.join(self.path, f"part-{time.time_ns()}.parquet"))
+        self._rows = []
+
+    def __exit__(self, *exc_info):
+        self._flush()
+
+
+def run(
+        input_path: str,
+        output_path: str,
+        task: str | None = None,
+        provider: str | None = None,
+        concurrency: int = 8,
+        download: bool = False,
+        progress: Callable[[BatchStats], None] | None = None
+) -> BatchStats:
+    """Run every row of `input_path` that is not yet done in `output_path`.
+
+    Parameters
+    ----------
+    input_path : str
+        JSON lines input.
+    output_path : str
+        ``.jsonl`` file, or directory of Parquet part files if it ends with ``.parquet``.
+    task : str, optional
+        Task of rows that don't name one.
+    provider : str, optional
+        Provider of rows that don't name one.
+    concurrency : int
+        Max number of rows processed in parallel.
+    download : bool
+        Download results of other tasks than `MEDIA_TASKS` that are urls, results of those are always downloaded.
+    progress : Callable[[BatchStats], None], optional
+        Called after every written row.
+
+    Returns
+    -------
+    BatchStats
+        Number of done, failed and skipped rows.
+    """
+    output = _ParquetOutput(output_path) if output_path.endswith(".parquet") else _JsonlOutput(output_path)
+    files_dir = os.path.splitext(output_path)[0] + "_files"
+    stats = BatchStats()
+    completed = output.completed()
+    start = time.perf_counter()
+
+    def pending(rows: Iterable[dict]) -> Iterator[dict]:
+        for row in rows:
+            if row["id"] in completed:
+                stats.skipped += 1
+            else:
+                yield row
+
+    with open(input_path, encoding="utf-8") as file, output:
+        for result in execute_rows(pending(read_rows(file, task, provider)), concurrency, files_dir, download):
+            output.write(result)
+            if result["status"] == "ok":
+                stats.done += 1
+            else:
+                stats.failed += 1
+            stats.seconds = time.perf_counter() - start
+            if progress is not None:
+                progress(stats)
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", help="JSON lines with prompt and optionally id, task and provider")
+    parser.add_argument("output", help=".jsonl file, or .parquet directory of part files")
+    parser.add_argument("--task", choices=TASKS, help="task of rows that don't name one")
+    parser.add_argument("--provider", help="provider of rows that don't name one, as named in pages")
+    parser.add_argument("--concurrency", type=int, default=8, help="rows processed in parallel")
+    parser.add_argument(
+        "--download", action="store_true", help="download results that are urls, tts and video_tts always are"
+    )
+    args = parser.parse_args(argv)
+
+    env.load()
+    last = [0.0]
+
+    def progress(stats: BatchStats) -> None:
+        if time.monotonic() - last[0] >= 5:
+            last[0] = time.monotonic()
+            print(
+                f"done {stats.done}, failed {stats.failed}, skipped {stats.skipped}, "
+                f"{stats.rows_per_second:.1f} rows/s", file=sys.stderr
+            )
+
+    stats = run(args.input, args.output, args.task, args.provider, args.concurrency, args.download, progress)
+    print(
+        f"done {stats.done}, failed {stats.failed}, skipped {stats.skipped} in {stats.seconds:.1f}s "
+        f"({stats.rows_per_second:.1f} rows/s)", file=sys.stderr
+    )
+    sys.exit(1 if stats.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Process-wide registry of pooled HTTP sessions and SDK clients.
+
+Streamlit re-executes a page on every interaction, so clients created inside ``Generator.generate_*`` were paying DNS,
+TCP and TLS setup on every click. Every client here is created once per process and reused, with keep-alive pools,
+a per-host connection limit and HTTP/2 where the SDK is httpx based and ``h2`` is installed. Every request they send
+is reported to `metrics` and goes through `rate_limit`, which owns retries, so retries of SDKs themselves are off.
+
+SDKs take from a few hundred milliseconds to a second to import, so each is imported when its client is first created,
+not when a page imports its generator.
+"""
+import importlib.util
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from explore_gen_ai_apis import metrics, rate_limit, workers
+
+if TYPE_CHECKING:
+    import deepl
+    import httpx
+    import replicate
+    from anthropic import Anthropic
+    from openai import OpenAI
+    import together
+
+
+# Max number of keep-alive connections kept per host, enough for a batch of image variants at once
+POOL_MAXSIZE = int(os.environ.get("GEN_AI_POOL_MAXSIZE", 16))
+# Max number of hosts a single requests.Session keeps pools for
+POOL_CONNECTIONS = int(os.environ.get("GEN_AI_POOL_CONNECTIONS", 10))
+# httpx only speaks HTTP/2 when optional `h2` package is installed
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+_lock = threading.Lock()
+# Key -> (fingerprint of settings the client was built from, client)
+_clients: dict[str, tuple[int, Any]] = {}
+
+
+def _close(client: Any) -> None:
+    close = getattr(client, "close", None)
+    if close is not None:
+        close()
+
+
+def get_or_create(key: str, factory: Callable[[], Any], env: tuple[str, ...] = ()) -> Any:
+    """Return client registered under `key`, creating it with `factory` on first use.
+
+    Client is rebuilt when any of `env` variables changes, e.g. API key is rotated, and the old one is closed.
+
+    Parameters
+    ----------
+    key : str
+        Registry key.
+    factory : Callable[[], Any]
+        Function that builds the client.
+    env : tuple[str, ...]
+        Environment variables the client is built from.
+
+    Returns
+    -------
+    Any
+        Shared client.
+    """
+    fingerprint = hash(tuple(os.environ.get(name) for name in env))
+    entry = _clients.get(key)
+    if entry is not None and entry[0] == fingerprint:
+        return entry[1]
+    stale = None
+    with _lock:
+        entry = _clients.get(key)
+        if entry is None or entry[0] != fingerprint:
+            stale = entry
+            entry = _clients[key] = (fingerprint, factory())
+    if stale is not None:
+        _close(stale[1])
+    return entry[1]
+
+
+def invalidate(prefix: str = "") -> None:
+    """Close and forget clients whose key starts with `prefix`, next `get_*` call creates fresh ones.
+
+    Parameters
+    ----------
+    prefix : str
+        Key prefix, all clients by default.
+    """
+    with _lock:
+        keys = [key for key in _clients if key.startswith(prefix)]
+        clients = [_clients.pop(key)[1] for key in keys]
+    for client in clients:
+        _close(client)
+
+
+class _InstrumentedAdapter(HTTPAdapter):
+    """`HTTPAdapter` that reports every request to `metrics` and paces it by `rate_limit`, `client` is its label."""
+    def __init__(self, client: str, **kwargs):
+        self.client = client
+        super().__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        limiter = rate_limit.Limiter(self.client, request.method, request.headers)
+        while True:
+            # Cancelled background calls make no further requests or retries
+            workers.check()
+            limiter.acquire()
+            exchange = metrics.Exchange(
+                self.client, request.method, request.url, int(request.headers.get("Content-Length") or 0)
+            )
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                exchange.failed()
+                delay = limiter.failed(connected=not _unconnected(error))
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except Exception:
+                exchange.failed()
+                raise
+            exchange.responded(response.status_code)
+            delay = limiter.responded(response.status_code, response.headers)
+            if delay is None:
+                break
+            response.close()
+            time.sleep(delay)
+        # Body is read later, possibly streamed, both `.content` and `.iter_content` end up in `raw.read`
+        read = response.raw.read
+
+        def counting_read(*args, **read_kwargs):
+            data = read(*args, **read_kwargs)
+            exchange.received(len(data))
+            return data
+
+        response.raw.read = counting_read
+        return response
+
+
+def _unconnected(error: requests.RequestException) -> bool:
+    """Whether request failed before connection was made, so it surely didn't reach the provider."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _httpx_transport(client: str) -> "httpx.BaseTransport":
+    from explore_gen_ai_apis import httpx_transport
+
+    return httpx_transport.new_transport(client, POOL_MAXSIZE, HTTP2)
+
+
+def _mount(session: requests.Session, client: str) -> requests.Session:
+    adapter = _InstrumentedAdapter(
+        client, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=True
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def new_session(client: str = "requests") -> requests.Session:
+    """Build `requests.Session` with keep-alive pool limited to `POOL_MAXSIZE` connections per host.
+
+    Parameters
+    ----------
+    client : str
+        Label of session's requests in `metrics`.
+
+    Returns
+    -------
+    requests.Session
+        New session.
+    """
+    return _mount(requests.Session(), client)
+
+
+def get_session(provider: str) -> requests.Session:
+    """Shared `requests.Session` for plain HTTP providers.
+
+    Parameters
+    ----------
+    provider : str
+        Provider name, each provider gets its own pool.
+
+    Returns
+    -------
+    requests.Session
+        Shared session.
+    """
+    return get_or_create(f"session:{provider}", lambda: new_session(provider))
+
+
+def _new_openai() -> "OpenAI":
+    from openai import OpenAI, DefaultHttpxClient
+
+    return OpenAI(max_retries=0, http_client=DefaultHttpxClient(transport=_httpx_transport("openai")))
+
+
+def get_openai() -> "OpenAI":
+    """Shared OpenAI client."""
+    return get_or_create("openai", _new_openai, ("OPENAI_API_KEY", "OPENAI_BASE_URL"))
+
+
+def _new_anthropic() -> "Anthropic":
+    from anthropic import Anthropic, DefaultHttpxClient
+
+    return Anthropic(max_retries=0, http_client=DefaultHttpxClient(transport=_httpx_transport("anthropic")))
+
+
+def get_anthropic() -> "Anthropic":
+    """Shared Anthropic client."""
+    return get_or_create("anthropic", _new_anthropic, ("ANTHROPIC_API_KEY", "ANTHROPIC_BASE_URL"))
+
+
+def _new_together() -> "together.Together":
+    import together
+
+    # SDK creates a session per thread with this factory, module wide
+    together.requestssession = lambda: new_session("together")
+    return together.Together(max_retries=0)
+
+
+def get_together() -> "together.Together":
+    """Shared TogetherAI client, it keeps `requests` session per thread internally."""
+    return get_or_create("together", _new_together, ("TOGETHER_API_KEY", "TOGETHER_BASE_URL"))
+
+
+def _new_replicate() -> "replicate.Client":
+    import replicate
+
+    return replicate.Client(
+        api_token=os.environ["REPLICATE_API_TOKEN"],
+        headers={
+            "User-Agent": "my-app/1.0",
+        },
+        # replicate wraps transport with its own retries of GET requests, so limits have to be set on transport itself
+        transport=_httpx_transport("replicate"),
+    )
+
+
+def get_replicate() -> "replicate.Client":
+    """Shared replicate.com client."""
+    return get_or_create("replicate", _new_replicate, ("REPLICATE_API_TOKEN", "REPLICATE_BASE_URL"))
+
+
+def _new_deepl() -> "deepl.Translator":
+    import deepl
+
+    # Module wide, 429 and 5xx are retried by the mounted adapter
+    deepl.http_client.max_network_retries = 0
+    translator = deepl.Translator(
+        os.environ['DEEPL_API_KEY'],
+        server_url=os.environ.get("DEEPL_SERVER_URL"),
+        verify_ssl=os.environ.get("REQUESTS_CA_BUNDLE"),
+    )
+    # SDK has no option for its session, it is a plain `requests.Session`, so instrumented pool is mounted on it
+    session = getattr(getattr(translator, "_client", None), "_session", None)
+    if isinstance(session, requests.Session):
+        _mount(session, "deepl")
+    return translator
+
+
+def get_deepl() -> "deepl.Translator":
+    """Shared deepl translator, it keeps single `requests` session internally.
+
+    The SDK sends prepared requests, which skip `REQUESTS_CA_BUNDLE`, so it is passed explicitly.
+    """
+    return get_or_create("deepl", _new_deepl, ("DEEPL_API_KEY", "DEEPL_SERVER_URL"))
+
+
+def reset() -> None:
+    """Close and forget all clients, next `get_*` call creates fresh ones."""
+    invalidate()
@@ -0,0 +1,15 @@
+"""Loading of ``.env`` settings."""
+import functools
+
+from dotenv import load_dotenv
+
+
+@functools.cache
+def load() -> None:
+    """Load ``.env`` into environment once per process, Streamlit pages call it on every rerun."""
+    load_dotenv()
+
+
+def reload() -> None:
+    """Read ``.env`` again, its values override ones loaded before."""
+    load_dotenv(override=True)
@@ -0,0 +1,234 @@
+"""Small local HTTP servers that serve generated files to the browser.
+
+`image_server`, `audio_spool` and `media_cache` each run a `FileServer` on a port of their own, started on first use:
+
+* it is only used when the address browsers reach it on is known, its ``*_URL`` variable or `FILE_SERVER_HOST`.
+  Otherwise `FileServer.base_url` is None and callers fall back to Streamlit's media, bytes or a file path, since a
+  ``localhost`` url only works for a browser on the same host as the app;
+* it listens on `FILE_SERVER_HOST` (``127.0.0.1``), browsers reach it on ``http://<FILE_SERVER_HOST>:<port>``. To
+  listen on all interfaces set it to ``0.0.0.0`` together with the ``*_URL`` variables;
+* if its port is taken, e.g. by another instance of the app or by a batch run next to it, it listens on a free port
+  instead. Unless its ``*_URL`` is set, then it stays off and `FileServer.base_url` is None;
+* `send` answers a request with content, honouring ``Range`` requests, which players use to seek, and ``ETag``.
+"""
+import hashlib
+import mmap
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r"^bytes=(?P<start>\d*)-(?P<end>\d*)$")
+
+
+def byte_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Parse ``Range`` header of a request for `size` bytes.
+
+    Parameters
+    ----------
+    header : str, optional
+        Header value.
+    size : int
+        Size of content.
+
+    Returns
+    -------
+    tuple[int, int] | None
+        First and last byte, inclusive. None if whole content should be sent, for no header, multiple ranges or
+        invalid syntax, which servers may ignore.
+
+    Raises
+    ------
+    ValueError
+        If range can't be satisfied.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None or not (match["start"] or match["end"]):
+        return None
+    if not match["start"]:
+        # Suffix range, last N bytes
+        length = int(match["end"])
+        if not length or not size:
+            raise ValueError(f"Range {header} of {size} bytes")
+        return max(size - length, 0), size - 1
+    start = int(match["start"])
+    end = int(match["end"]) if match["end"] else size - 1
+    if match["end"] and end < start:
+        return None
+    if start >= size:
+        raise ValueError(f"Range {header} of {size} bytes")
+    return start, min(end, size - 1)
+
+
+def send(
+        handler: BaseHTTPRequestHandler,
+        content: bytes | mmap.mmap,
+        content_type: str,
+        etag: str,
+        body: bool = True
+) -> None:
+    """Answer request with content that never changes behind its url, or with the part of it asked for.
+
+    Parameters
+    ----------
+    handler : BaseHTTPRequestHandler
+        Handler of the request.
+    content : bytes | mmap.mmap
+        Whole content, e.g. memory map of a file.
+    content_type : str
+        MIME type of content.
+    etag : str
+        Entity tag, quoted.
+    body : bool
+        Whether to send content, False for ``HEAD`` requests.
+    """
+    if handler.headers.get("If-None-Match") == etag:
+        handler.send_response(304)
+        handler.send_header("ETag", etag)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+    size = len(content)
+    try:
+        requested = byte_range(handler.headers.get("Range"), size)
+    except ValueError:
+        handler.send_response(416)
+        handler.send_header("Content-Range", f"bytes */{size}")
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+    partial = requested is not None
+    first, last = requested or (0, size - 1)
+    handler.send_response(206 if partial else 200)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(last - first + 1))
+    handler.send_header("Accept-Ranges", "bytes")
+    if partial:
+        handler.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+    handler.send_header("Cache-Control", "public, max-age=31536000, immutable")
+    handler.send_header("ETag", etag)
+    handler.end_headers()
+    if not body:
+        return
+    view = memoryview(content)
+    try:
+        for start in range(first, last + 1, CHUNK_SIZE):
+            handler.wfile.write(view[start:min(start + CHUNK_SIZE, last + 1)])
+    except (BrokenPipeError, ConnectionResetError):
+        # Player stopped reading, e.g. it seeked elsewhere
+        pass
+    finally:
+        view.release()
+
+
+def open_file(path: str) -> bytes | mmap.mmap:
+    """Read-only memory map of file, empty bytes for an empty file, which can't be mapped.
+
+    Raises
+    ------
+    FileNotFoundError
+        If there is no such file.
+    """
+    with open(path, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            return b""
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Default backlog of 5 drops connections when a page shows many files at once
+    request_queue_size = 128
+
+
+class FileServer:
+    """HTTP server of one module, started on first use, and objects its handler serves by short ids.
+
+    Parameters
+    ----------
+    name : str
+        Name of server thread.
+    handler : type[BaseHTTPRequestHandler]
+        Request handler.
+    port_variable : str
+        Environment variable with port to listen on.
+    default_port : int
+        Port if variable is not set, 0 picks a free one.
+    url_variable : str
+        Environment variable with address browser reaches server on, ``http://<FILE_SERVER_HOST>:<port>`` if it is
+        not set.
+    """
+    def __init__(
+            self,
+            name: str,
+            handler: type[BaseHTTPRequestHandler],
+            port_variable: str,
+            default_port: int,
+            url_variable: str
+    ):
+        self.name = name
+        self.handler = handler
+        self.port_variable = port_variable
+        self.default_port = default_port
+        self.url_variable = url_variable
+        self.error: OSError | None = None
+        self._lock = threading.Lock()
+        self._server: _Server | None = None
+        self._objects: dict[str, Any] = {}
+
+    def _bind(self) -> _Server:
+        host = os.environ.get("FILE_SERVER_HOST", "127.0.0.1")
+        port = int(os.environ.get(self.port_variable, self.default_port))
+        try:
+            return _Server((host, port), self.handler)
+        except OSError:
+            if not port or os.environ.get(self.url_variable):
+                # Browser is told to reach this very port, content of another process would be there
+                raise
+            return _Server((host, 0), self.handler)
+
+    def port(self) -> int | None:
+        """Port server listens on, it is started if it isn't running. None if it can't listen."""
+        with self._lock:
+            if self._server is None and self.error is None:
+                try:
+                    self._server = self._bind()
+                except OSError as error:
+                    self.error = error
+                    return None
+                threading.Thread(target=self._server.serve_forever, name=self.name, daemon=True).start()
+            return self._server.server_address[1] if self._server else None
+
+    def base_url(self) -> str | None:
+        """Address browser reaches server on, None if it isn't known, see module docstring, or server can't listen."""
+        url = os.environ.get(self.url_variable)
+        host = os.environ.get("FILE_SERVER_HOST")
+        if not url and host in (None, "", "0.0.0.0"):
+            # Browser may be on another host, which can't reach ours on localhost or on any address
+            return None
+        port = self.port()
+        if port is None:
+            return None
+        return url or f"http://{host}:{port}"
+
+    def register(self, directory: str, item: Any) -> str:
+        """Serve `item` under a short id of `directory`, the first item of a directory is kept.
+
+        Returns
+        -------
+        str
+            Id for urls, see `lookup`.
+        """
+        item_id = hashlib.sha256(os.path.realpath(directory).encode()).hexdigest()[:8]
+        with self._lock:
+            self._objects.setdefault(item_id, item)
+        return item_id
+
+    def lookup(self, item_id: str) -> Any | None:
+        """Item registered under id."""
+        with self._lock:
+            return self._objects.get(item_id)
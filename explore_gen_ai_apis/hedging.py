@@ -0,0 +1,235 @@
+"""Hedged streaming requests: a backup provider is asked when the primary is slow to produce its first token.
+
+Backup is sent once the primary has gone without a token for longer than the p95 of its recent times to first token,
+or right away if the primary fails first. Whichever produces a token first is streamed to the caller and the other is
+cancelled. A cancelled request can't be interrupted while it waits for response headers, so its thread lives on until
+its first token or error. That token is not passed on, but its time is still recorded. This gives the latency the
+primary would have had on its own, which is what hedging is compared with.
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Generator
+
+from explore_gen_ai_apis import metrics, workers
+
+
+# Seconds to wait for primary's first token while fewer than `MIN_SAMPLES` of its times are known
+DEFAULT_DELAY = 1.0
+MIN_SAMPLES = 20
+# Percentile of primary's time to first token after which backup is sent
+DELAY_PERCENTILE = 0.95
+
+Stream = Generator[Any, None, Any]
+
+
+@dataclass(frozen=True)
+class HedgeRecord:
+    """Outcome of a single hedged call."""
+    primary: str
+    backup: str
+    fired: bool
+    winner: str
+    ttft: float
+
+
+_lock = threading.Lock()
+_last: dict[str, HedgeRecord] = {}
+
+
+class _Attempt(threading.Thread):
+    """Request to one provider, its chunks are put to shared `events` queue as ``(attempt, kind, value)``."""
+    def __init__(
+            self,
+            provider: str,
+            stream: Callable[[], Stream],
+            events: queue.Queue,
+            on_first_token: Callable[[float], None] | None = None
+    ):
+        super().__init__(name=f"hedge-{provider}", daemon=True)
+        self.provider = provider
+        self.cancelled = threading.Event()
+        self._stream = stream
+        self._events = events
+        self._on_first_token = on_first_token
+        # Request is part of the task that started it, if any
+        self.run = workers.bind(self.run)
+
+    def run(self) -> None:
+        start = time.perf_counter()
+        first = True
+        try:
+            chunks = self._stream()
+            try:
+                while True:
+                    try:
+                        chunk = next(chunks)
+                    except StopIteration as stop:
+                        self._events.put((self, "done", stop.value))
+                        return
+                    if not chunk:
+                        continue
+                    if first:
+                        first = False
+                        if self._on_first_token is not None:
+                            self._on_first_token(time.perf_counter() - start)
+                    if self.cancelled.is_set():
+                        return
+                    self._events.put((self, "chunk", chunk))
+            finally:
+                # Closes provider's response and so its connection
+                chunks.close()
+        except Exception as error:
+            self._events.put((self, "error", error))
+
+
+def delay(operation: str, primary: str) -> float:
+    """Seconds without first token after which backup of `primary` is sent, p95 of its recent times to first token."""
+    if metrics.HEDGE_TTFT_SECONDS.count(operation=operation, primary=primary, path="primary") < MIN_SAMPLES:
+        return DEFAULT_DELAY
+    percentile, = metrics.HEDGE_TTFT_SECONDS.percentiles(
+        (DELAY_PERCENTILE,), operation=operation, primary=primary, path="primary"
+    )
+    return percentile
+
+
+def hedged(
+        operation: str,
+        primary: str,
+        primary_stream: Callable[[], Stream],
+        backup: str,
+        backup_stream: Callable[[], Stream],
+        after: float | None = None,
+        decided: Callable[[HedgeRecord], None] | None = None
+) -> Stream:
+    """Stream from `primary`, sending the same request to `backup` if primary has no first token `after` seconds.
+
+    Parameters
+    ----------
+    operation : str
+        Operation label in `metrics`.
+    primary : str
+        Primary provider name.
+    primary_stream : Callable[[], Stream]
+        Starts primary request, returns generator of chunks that may return a value, e.g. number of tokens.
+    backup : str
+        Backup provider name.
+    backup_stream : Callable[[], Stream]
+        Starts backup request.
+    after : float, optional
+        Seconds to wait for primary's first token, `delay` by default.
+    decided : Callable[[HedgeRecord], None], optional
+        Called with outcome of this call once winner is known, `last` may already tell about a later call.
+
+    Yields
+    ------
+    Any
+        Chunks of the request that produced first token first.
+
+    Returns
+    -------
+    Any
+        Return value of winner's generator.
+    """
+    after = delay(operation, primary) if after is None else after
+    events: queue.Queue = queue.Queue()
+    start = time.perf_counter()
+
+    def primary_first_token(seconds: float) -> None:
+        metrics.HEDGE_TTFT_SECONDS.observe(seconds, operation=operation, primary=primary, path="primary")
+
+    attempts = [_Attempt(primary, primary_stream, events, primary_first_token)]
+    attempts[0].start()
+    errors: list[Exception] = []
+
+    def send_backup() -> None:
+        attempts.append(_Attempt(backup, backup_stream, events))
+        attempts[-1].start()
+
+    try:
+        while True:
+            timeout = max(start + after - time.perf_counter(), 0.0) if len(attempts) == 1 else None
+            try:
+                attempt, kind, value = events.get(timeout=timeout)
+            except queue.Empty:
+                send_backup()
+                continue
+            if kind != "error":
+                winner = attempt
+                break
+            errors.append(value)
+            if len(attempts) == 1:
+                send_backup()
+            elif len(errors) == len(attempts):
+                raise errors[0]
+
+        for other in attempts:
+            if other is not winner:
+                other.cancelled.set()
+        fired = len(attempts) > 1
+        outcome = "not_fired" if not fired else "primary_won" if winner is attempts[0] else "backup_won"
+        ttft = time.perf_counter() - start
+        metrics.HEDGE_CALLS.inc(operation=operation, primary=primary, outcome=outcome)
+        metrics.HEDGE_TTFT_SECONDS.observe(ttft, operation=operation, primary=primary, path="hedged")
+        record = HedgeRecord(primary, backup, fired, winner.provider, ttft)
+        with _lock:
+            _last[primary] = record
+        if decided is not None:
+            decided(record)
+
+        while True:
+            if attempt is winner:
+                if kind == "chunk":
+                    yield value
+                elif kind == "done":
+                    return value
+                else:
+                    raise value
+            attempt, kind, value = events.get()
+    finally:
+        for other in attempts:
+            other.cancelled.set()
+
+
+def last(primary: str) -> HedgeRecord | None:
+    """Most recent hedged call of `primary`, None if there was none."""
+    with _lock:
+        return _last.get(primary)
+
+
+def report(operation: str | None = None) -> list[dict]:
+    """How often hedging fired and how much it saved at p99, per operation and primary provider.
+
+    Saving is p99 time to first token of primary requests on their own minus p99 of hedged calls.
+
+    Parameters
+    ----------
+    operation : str, optional
+        Only this operation, all by default.
+
+    Returns
+    -------
+    list[dict]
+        Rows of calls, share of calls backup was sent in, backup wins and p99 times in milliseconds.
+    """
+    rows: dict[tuple[str, str], dict] = {}
+    for sample in metrics.HEDGE_CALLS.samples():
+        if operation is not None and sample["operation"] != operation:
+            continue
+        key = sample["operation"], sample["primary"]
+        row = rows.setdefault(key, {"operation": key[0], "primary": key[1], "calls": 0, "fired": 0, "backup won": 0})
+        row["calls"] += int(sample["value"])
+        if sample["outcome"] != "not_fired":
+            row["fired"] += int(sample["value"])
+        if sample["outcome"] == "backup_won":
+            row["backup won"] += int(sample["value"])
+    for row in rows.values():
+        labels = {"operation": row["operation"], "primary": row["primary"]}
+        row["fired %"] = round(100 * row.pop("fired") / row["calls"], 1)
+        alone, = metrics.HEDGE_TTFT_SECONDS.percentiles((0.99,), path="primary", **labels)
+        with_backup, = metrics.HEDGE_TTFT_SECONDS.percentiles((0.99,), path="hedged", **labels)
+        row["p99 alone ms"] = None if alone is None else round(alone * 1000, 1)
+        row["p99 hedged ms"] = None if with_backup is None else round(with_backup * 1000, 1)
+        row["p99 saved ms"] = None if alone is None or with_backup is None else round((alone - with_backup) * 1000, 1)
+    return list(rows.values())
@@ -0,0 +1,84 @@
+"""Instrumented transport of httpx based SDK clients, imported by `clients` together with the first such SDK."""
+import time
+from typing import Iterator
+
+import httpx
+
+from explore_gen_ai_apis import metrics, rate_limit, workers
+
+
+class _CountingStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, exchange: metrics.Exchange):
+        self._stream = stream
+        self._exchange = exchange
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._exchange.received(len(chunk))
+            yield chunk
+
+    def close(self) -> None:
+        self._stream.close()
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """httpx transport that reports every request to `metrics` and paces it by `rate_limit`, `client` is its label."""
+    def __init__(self, client: str, transport: httpx.BaseTransport):
+        self.client = client
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = rate_limit.Limiter(self.client, request.method, request.headers)
+        while True:
+            # Cancelled background calls make no further requests or retries
+            workers.check()
+            limiter.acquire()
+            exchange = metrics.Exchange(
+                self.client, request.method, str(request.url), int(request.headers.get("Content-Length") or 0)
+            )
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as error:
+                exchange.failed()
+                delay = limiter.failed(connected=not isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)))
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except Exception:
+                exchange.failed()
+                raise
+            exchange.responded(response.status_code)
+            delay = limiter.responded(response.status_code, response.headers)
+            if delay is None:
+                break
+            response.close()
+            time.sleep(delay)
+        response.stream = _CountingStream(response.stream, exchange)
+        return response
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+def new_transport(client: str, pool_maxsize: int, http2: bool) -> InstrumentedTransport:
+    """Pooled transport reported to `metrics` under `client` label.
+
+    Pool limits and HTTP/2 are options of transport, httpx client ignores them once transport is given.
+
+    Parameters
+    ----------
+    client : str
+        Label in `metrics`.
+    pool_maxsize : int
+        Max number of connections, all of them kept alive.
+    http2 : bool
+        Whether to speak HTTP/2, needs `h2` package.
+
+    Returns
+    -------
+    InstrumentedTransport
+        New transport.
+    """
+    limits = httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize)
+    return InstrumentedTransport(client, httpx.HTTPTransport(http2=http2, limits=limits))
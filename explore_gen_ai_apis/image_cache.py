@@ -0,0 +1,335 @@
+"""Content-addressed on-disk cache of generated images.
+
+Layout of cache directory::
+
+    objects/<digest[:2]>/<digest>            image bytes, named by sha256 of content
+    thumbnails/<digest[:2]>/<digest>.webp    thumbnail of the object
+    index.json                               request key -> digest and metadata, in LRU order
+
+Several request keys may point to the same object, object is deleted once no key references it. Index is rewritten
+on every `put`, hits only reorder it in memory, so LRU order survives restarts approximately.
+
+Thumbnails are rendered in a shared worker pool as soon as an image is stored, so a gallery of past images doesn't
+have to decode full images. Thumbnails of objects stored before are rendered on first request.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable
+
+
+# Max width and height of thumbnails, pixels
+THUMBNAIL_SIZE = 256
+
+_thumbnails = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="thumbnails")
+
+
+class ImageCache:
+    """Size bounded LRU cache of images.
+
+    Parameters
+    ----------
+    directory : str
+        Cache directory, created if missing.
+    max_bytes : int
+        Max total size of stored objects, least recently used entries are evicted above it.
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> digest, most recently used last
+        self._index: OrderedDict[str, str] = OrderedDict()
+        # digest -> (size, number of keys referencing it)
+        self._objects: dict[str, list[int]] = {}
+        # key -> metadata given to `put`
+        self._meta: dict[str, dict] = {}
+        # digest -> thumbnail being rendered
+        self._rendering: dict[str, Future] = {}
+        self._size = 0
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def key(provider: str, model: str, prompt: str, params: dict) -> str:
+        """Build request key.
+
+        Parameters
+        ----------
+        provider : str
+            Provider name.
+        model : str
+            Model name.
+        prompt : str
+            Input prompt.
+        params : dict
+            Output parameters, e.g. format.
+
+        Returns
+        -------
+        str
+            Key, sha256 of all inputs.
+        """
+        raw = json.dumps([provider, model, prompt, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def _thumbnail_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "thumbnails", digest[:2], digest + ".webp")
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    def _load(self) -> None:
+        try:
+            with open(self._index_path()) as file:
+                entries = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entries = []
+        for key, digest, *meta in entries:
+            if digest not in self._objects:
+                path = self._object_path(digest)
+                if not os.path.exists(path):
+                    continue
+                self._objects[digest] = [os.path.getsize(path), 0]
+                self._size += self._objects[digest][0]
+            self._objects[digest][1] += 1
+            self._index[key] = digest
+            if meta and meta[0]:
+                self._meta[key] = meta[0]
+
+    def _save(self) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            json.dump([(key, digest, self._meta.get(key)) for key, digest in self._index.items()], file)
+        os.replace(tmp, self._index_path())
+
+    def _drop(self, key: str) -> None:
+        digest = self._index.pop(key)
+        self._meta.pop(key, None)
+        entry = self._objects[digest]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._objects[digest]
+            self._size -= entry[0]
+            for path in self._object_path(digest), self._thumbnail_path(digest):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def get(self, key: str | Iterable[str]) -> bytes | None:
+        """Read cached image.
+
+        Parameters
+        ----------
+        key : str | Iterable[str]
+            Request key, see `ImageCache.key`. Or several keys, e.g. of every provider, image of the first one stored
+            is returned and counted as a single hit or miss.
+
+        Returns
+        -------
+        bytes | None
+            Image, None on miss.
+        """
+        keys = (key,) if isinstance(key, str) else tuple(key)
+        with self._lock:
+            for key in keys:
+                digest = self._index.get(key)
+                if digest is None:
+                    continue
+                try:
+                    with open(self._object_path(digest), "rb") as file:
+                        image = file.read()
+                except FileNotFoundError:
+                    # Object was removed behind our back
+                    self._drop(key)
+                    continue
+                self._index.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+            return None
+
+    def put(self, key: str, image: bytes, meta: dict | None = None) -> None:
+        """Store image, start rendering its thumbnail and evict least recently used entries above `max_bytes`.
+
+        Parameters
+        ----------
+        key : str
+            Request key, see `ImageCache.key`.
+        image : bytes
+            Image content.
+        meta : dict, optional
+            JSON serializable details shown in `recent`, e.g. provider and prompt.
+        """
+        if not image or len(image) > self.max_bytes:
+            return
+        digest = hashlib.sha256(image).hexdigest()
+        with self._lock:
+            if key in self._index:
+                self._drop(key)
+            if digest not in self._objects:
+                path = self._object_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                with os.fdopen(fd, "wb") as file:
+                    file.write(image)
+                os.replace(tmp, path)
+                self._objects[digest] = [len(image), 0]
+                self._size += len(image)
+            self._objects[digest][1] += 1
+            self._index[key] = digest
+            if meta is not None:
+                self._meta[key] = {**meta, "created": time.time()}
+            while self._size > self.max_bytes:
+                self._drop(next(iter(self._index)))
+                self.evictions += 1
+            self._save()
+        self._render(digest)
+
+    def digest(self, image: bytes) -> str | None:
+        """Digest of `image` if it is stored, None otherwise."""
+        digest = hashlib.sha256(image).hexdigest()
+        with self._lock:
+            return digest if digest in self._objects else None
+
+    def path(self, digest: str) -> str | None:
+        """Path of stored object, None if there is none with `digest`."""
+        with self._lock:
+            return self._object_path(digest) if digest in self._objects else None
+
+    def _render(self, digest: str) -> Future | None:
+        """Start rendering thumbnail of object in the worker pool, unless it is already being rendered."""
+        # Imported by the caller, Pillow imports numpy, which fails when a page imports it in another thread meanwhile
+        import PIL.Image  # noqa: F401
+
+        with self._lock:
+            if digest not in self._objects:
+                return None
+            future = self._rendering.get(digest)
+            if future is None:
+                future = self._rendering[digest] = _thumbnails.submit(self._render_thumbnail, digest)
+            return future
+
+    def _render_thumbnail(self, digest: str) -> str:
+        try:
+            from PIL import Image
+
+            path = self._thumbnail_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file, Image.open(self._object_path(digest)) as image:
+                    # Lets JPEG decoder downscale while decoding
+                    image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+                    thumbnail = image if image.mode in ("RGB", "RGBA") else image.convert("RGBA")
+                    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+                    thumbnail.save(file, "WEBP", quality=80)
+                os.replace(tmp, path)
+            except BaseException:
+                os.remove(tmp)
+                raise
+            with self._lock:
+                if digest not in self._objects:
+                    # Object was evicted while thumbnail was rendered
+                    os.remove(path)
+            return path
+        finally:
+            with self._lock:
+                self._rendering.pop(digest, None)
+
+    def thumbnail(self, digest: str) -> str | None:
+        """Path of thumbnail of stored object, waiting for it to be rendered.
+
+        Parameters
+        ----------
+        digest : str
+            Object digest.
+
+        Returns
+        -------
+        str | None
+            Path of WebP thumbnail, None if there is no such object or it isn't an image.
+        """
+        path = self._thumbnail_path(digest)
+        if os.path.exists(path):
+            return path
+        future = self._render(digest)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except (OSError, ValueError):
+            # Object is gone or isn't an image Pillow can read, PIL.UnidentifiedImageError is an OSError
+            return None
+
+    def recent(self, limit: int = 24) -> list[dict]:
+        """Most recently created images stored with metadata, newest first.
+
+        Parameters
+        ----------
+        limit : int
+            Max number of images.
+
+        Returns
+        -------
+        list[dict]
+            Metadata given to `put`, with ``digest`` and ``created`` timestamp added, one per object.
+        """
+        with self._lock:
+            entries = sorted(
+                ({**meta, "digest": self._index[key]} for key, meta in self._meta.items()),
+                key=lambda entry: entry["created"],
+                reverse=True,
+            )
+        seen, images = set(), []
+        for entry in entries:
+            if entry["digest"] not in seen:
+                seen.add(entry["digest"])
+                images.append(entry)
+        return images[:limit]
+
+    def stats(self) -> dict[str, int]:
+        """Counters to size the cache with.
+
+        Returns
+        -------
+        dict[str, int]
+            hits, misses, evictions, number of entries and objects, total size in bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "objects": len(self._objects),
+                "bytes": self._size,
+            }
+
+
+_default: ImageCache | None = None
+_default_lock = threading.Lock()
+
+
+def get_default() -> ImageCache:
+    """Process-wide cache configured by `IMAGE_CACHE_DIR` and `IMAGE_CACHE_MAX_BYTES` environment variables."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ImageCache(
+                os.environ.get("IMAGE_CACHE_DIR", "./.cache/images"),
+                int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024)),
+            )
+        return _default
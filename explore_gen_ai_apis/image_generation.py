@@ -0,0 +1,418 @@
+"""Image generation providers.
+
+Variants of a prompt are generated at once. Stability AI and getimg.ai answer with the image, so their requests are
+simply sent concurrently. replicate.com predictions are created without waiting and tracked by a shared
+`jobs.JobPoller`, so many variants cost one polling thread instead of a blocked request each.
+"""
+import base64
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Callable, Iterator
+
+from explore_gen_ai_apis import clients, image_cache, jobs, metrics, routing, workers
+
+if TYPE_CHECKING:
+    import replicate.prediction
+    import requests
+
+
+_lock = threading.Lock()
+_pollers: dict[str, jobs.JobPoller] = {}
+
+
+def _stability_url() -> str:
+    return os.environ.get("STABILITY_AI_BASE_URL", "https://api.stability.ai")
+
+
+def _getimg_url() -> str:
+    return os.environ.get("GETIMG_AI_BASE_URL", "https://api.getimg.ai")
+
+
+def _image(response: "requests.Response") -> bytes:
+    """Body of response if it is an image, providers answer errors, e.g. moderation, with JSON bodies."""
+    response.raise_for_status()
+    content_type = response.headers.get("Content-Type", "")
+    if not content_type.startswith("image/"):
+        raise Exception(f"Expected an image, got {content_type or 'no content type'}: {response.text[:200]}")
+    return response.content
+
+
+class Generator:
+    """Class that contains all generate methods.
+
+    Parameters
+    ----------
+    cache : image_cache.ImageCache, optional
+        Cache of generated images, process-wide cache by default.
+    """
+    # Provider -> (model, output params), everything apart from prompt that affects an output image
+    MODELS = {
+        "Stability AI": ("ultra", {"output_format": "webp"}),
+        "replicate.com": ("black-forest-labs/flux-1.1-pro", {}),
+        "getimg.ai": ("flux-schnell", {"output_format": "png"}),
+    }
+    # Rough USD per image from list prices
+    COSTS = {"Stability AI": 0.08, "replicate.com": 0.04, "getimg.ai": 0.003}
+    ROUTER = routing.Router("image_generation", COSTS)
+    # Max number of variants generated at once
+    MAX_VARIANTS = 16
+
+    def __init__(self, cache: image_cache.ImageCache | None = None):
+        self.cache = cache or image_cache.get_default()
+
+    @staticmethod
+    def generate_stability(prompt: str, seed: int | None = None) -> bytes:
+        """Generate image using Stability AI ultra model.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt for Text to Image
+        seed : int, optional
+            Seed of the image, random by default.
+
+        Returns
+        -------
+        bytes
+            Output image
+        """
+        response = clients.get_session("stability").post(
+            f"{_stability_url()}/v2beta/stable-image/generate/ultra",
+            headers={
+                "authorization": f"Bearer {os.environ['STABILITY_AI_API_KEY']}",
+                "accept": "image/*"
+            },
+            files={"none": ''},
+            data={
+                "prompt": prompt,
+                "output_format": "webp",
+                **({} if seed is None else {"seed": seed}),
+            },
+        )
+        return _image(response)
+
+    @staticmethod
+    def generate_replicate(prompt: str, seed: int | None = None) -> bytes:
+        """Generate image using replicate.com and flux-1.1-pro
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt for Text to Image
+        seed : int, optional
+            Seed of the image, random by default.
+
+        Returns
+        -------
+        bytes
+            Output Image
+        """
+        output = clients.get_replicate().run(
+            "black-forest-labs/flux-1.1-pro",
+            input={"prompt": prompt, **({} if seed is None else {"seed": seed})}
+        )
+        return output.read()
+
+    @staticmethod
+    def _replicate_status(prediction: "replicate.prediction.Prediction") -> jobs.JobStatus:
+        match prediction.status:
+            case "succeeded":
+                # Url, or list of them for models with several outputs
+                output = prediction.output[0] if isinstance(prediction.output, list) else prediction.output
+                return jobs.JobStatus(jobs.READY, prediction.status, result=output)
+            case "failed" | "canceled":
+                return jobs.JobStatus(jobs.FAILED, prediction.status, error=prediction.error or prediction.status)
+        return jobs.JobStatus(jobs.PENDING, prediction.status)
+
+    @staticmethod
+    def submit_replicate(prompt: str, seed: int | None = None) -> tuple[str, jobs.JobStatus]:
+        """Create replicate.com prediction with flux-1.1-pro without waiting for it.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt for Text to Image
+        seed : int, optional
+            Seed of the image, random by default.
+
+        Returns
+        -------
+        tuple[str, jobs.JobStatus]
+            Prediction id and its status.
+        """
+        prediction = clients.get_replicate().models.predictions.create(
+            model="black-forest-labs/flux-1.1-pro",
+            input={"prompt": prompt, **({} if seed is None else {"seed": seed})}
+        )
+        return prediction.id, Generator._replicate_status(prediction)
+
+    @staticmethod
+    def status_replicate(prediction_id: str) -> jobs.JobStatus:
+        """Fetch status of replicate.com prediction.
+
+        Parameters
+        ----------
+        prediction_id : str
+            Prediction id.
+
+        Returns
+        -------
+        jobs.JobStatus
+            Prediction status, result is url to image once it is ready.
+        """
+        return Generator._replicate_status(clients.get_replicate().predictions.get(prediction_id))
+
+    @staticmethod
+    def poller(provider: str) -> jobs.JobPoller:
+        """Shared poller of provider's predictions.
+
+        Parameters
+        ----------
+        provider
+            Provider for Image generation
+
+        Returns
+        -------
+        jobs.JobPoller
+            Poller.
+        """
+        with _lock:
+            if provider not in _pollers:
+                match provider:
+                    case "replicate.com":
+                        # Images take seconds, not minutes like videos
+                        _pollers[provider] = jobs.JobPoller(
+                            Generator.status_replicate, initial_delay=1.0, max_delay=4.0, timeout=300.0
+                        )
+            return _pollers[provider]
+
+    @staticmethod
+    def generate_replicate_async(prompt: str, seed: int | None = None, timeout: float = 300) -> bytes:
+        """Generate image using replicate.com prediction, status is polled by shared poller.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt for Text to Image
+        seed : int, optional
+            Seed of the image, random by default.
+        timeout : float
+            Max seconds to wait for prediction.
+
+        Returns
+        -------
+        bytes
+            Output Image
+
+        Raises
+        ------
+        Exception
+            If prediction failed or takes > `timeout` seconds.
+        """
+        poller = Generator.poller("replicate.com")
+        prediction_id, status = Generator.submit_replicate(prompt, seed)
+        job = poller.track(prediction_id)
+        try:
+            # Prediction may already be finished, e.g. if it was served from provider's cache
+            poller.update(prediction_id, status)
+            status = job.wait(timeout)
+        finally:
+            poller.forget(prediction_id)
+        if status.state == jobs.READY:
+            return _image(clients.get_session("replicate").get(status.result))
+        elif status.state == jobs.FAILED:
+            raise Exception(status.error)
+        raise Exception(f'Failed to generate image in {timeout} seconds, aborting')
+
+    @staticmethod
+    def generate_getimg_ai(prompt: str, seed: int | None = None) -> bytes:
+        """Generate image using getimg.ai and flux-schnell
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt for Text to Image
+        seed : int, optional
+            Seed of the image, random by default.
+
+        Returns
+        -------
+        bytes
+            Output Image
+        """
+        url = f"{_getimg_url()}/v1/flux-schnell/text-to-image"
+
+        payload = {
+            # Image comes inline, url would have to be downloaded again
+            "response_format": "b64",
+            "output_format": "png",
+            "prompt": prompt,
+            **({} if seed is None else {"seed": seed}),
+        }
+        headers = {
+            "accept": "application/json",
+            "content-type": "application/json",
+            "authorization": f"Bearer {os.environ['GETIMG_AI_API_KEY']}"
+        }
+
+        response = clients.get_session("getimg").post(url, json=payload, headers=headers)
+        response.raise_for_status()
+
+        return base64.b64decode(response.json()['image'])
+
+    def execute(self, prompt: str, provider, budget: float | None = None, over_budget: bool = False) -> bytes:
+        """Generate image, cached images are returned without calling provider.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt for Text to Image
+        provider
+            Provider for Image generation, ``auto`` picks one with `ROUTER`
+        budget : float, optional
+            Max estimated cost in USD of the image for ``auto`` provider.
+        over_budget : bool
+            Fail over to providers over `budget` if those within it fail, instead of leaving them out.
+
+        Returns
+        -------
+        bytes
+            Output Image
+        """
+        start = time.perf_counter()
+        # Image of any provider will do for auto
+        image = self.cache.get(
+            self._request(prompt, choice)[0] for choice in (self.COSTS if provider == routing.AUTO else [provider])
+        )
+        if image is not None:
+            metrics.observe_call("image_generation", provider, time.perf_counter() - start, "cache_hit")
+            return image
+        if provider == routing.AUTO:
+            # Only calls that reach a provider are timed by the router
+            return self.ROUTER.call(
+                lambda choice: self._generate(prompt, choice), budget=budget, over_budget=over_budget
+            )
+        return self._generate(prompt, provider)
+
+    def _request(self, prompt: str, provider: str, seed: int | None = None) -> tuple[str, str, dict]:
+        """Cache key, model and output params of image."""
+        model, params = self.MODELS[provider]
+        if seed is not None:
+            params = {**params, "seed": seed}
+        return self.cache.key(provider, model, prompt, params), model, params
+
+    @metrics.instrumented("image_generation")
+    def _generate(self, prompt: str, provider: str) -> bytes:
+        """Image from `provider` itself, stored in `cache`."""
+        generate: Callable[[str], bytes] = None
+        match provider:
+            case "Stability AI":
+                generate = self.generate_stability
+            case "replicate.com":
+                generate = self.generate_replicate
+            case "getimg.ai":
+                generate = self.generate_getimg_ai
+
+        return self._store(prompt, provider, generate)
+
+    def _store(self, prompt: str, provider: str, generate: Callable[..., bytes], seed: int | None = None) -> bytes:
+        """Image generated by `generate`, stored in `cache`."""
+        key, model, params = self._request(prompt, provider, seed)
+        with workers.slot(provider):
+            image = generate(prompt) if seed is None else generate(prompt, seed)
+        self.cache.put(key, image, {"provider": provider, "model": model, "prompt": prompt, **params})
+        return image
+
+    def _cached(self, prompt: str, provider: str, generate: Callable[..., bytes], seed: int | None = None) -> bytes:
+        """Image from cache, or generated and cached on miss."""
+        image = self.cache.get(self._request(prompt, provider, seed)[0])
+        if image is not None:
+            return image
+        return self._store(prompt, provider, generate, seed)
+
+    def variants(
+            self,
+            prompt: str,
+            provider,
+            count: int,
+            seed: int | None = None
+    ) -> Iterator[tuple[int, bytes | Exception, float]]:
+        """Generate `count` variants of image at once, each with its own seed.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt for Text to Image
+        provider
+            Provider for Image generation
+        count : int
+            Number of variants, at most `MAX_VARIANTS`.
+        seed : int, optional
+            Seed of the first variant, the rest get the following ones, random by default. Same seed gives cached
+            images.
+
+        Yields
+        ------
+        tuple[int, bytes | Exception, float]
+            Seed, output image or an error it failed with, and wall time in seconds, in order of completion.
+        """
+        generate: Callable[[str, int], bytes] = None
+        match provider:
+            case "Stability AI":
+                generate = self.generate_stability
+            case "replicate.com":
+                generate = self.generate_replicate_async
+            case "getimg.ai":
+                generate = self.generate_getimg_ai
+
+        count = min(count, self.MAX_VARIANTS)
+        if seed is None:
+            seed = random.randint(1, 2 ** 31 - 1 - count)
+
+        def timed(variant_seed: int) -> tuple[int, bytes | Exception, float]:
+            start = time.perf_counter()
+            try:
+                image = self._cached(prompt, provider, generate, variant_seed)
+            except Exception as error:
+                image = error
+            return variant_seed, image, time.perf_counter() - start
+
+        if count < 1:
+            return
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            timed = workers.bind(timed)
+            for future in as_completed([pool.submit(timed, seed + i) for i in range(count)]):
+                yield future.result()
+
+    def compare(self, prompt: str, providers: list[str]) -> Iterator[tuple[str, bytes | Exception, float]]:
+        """Generate image with several providers at once.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt for Text to Image
+        providers : list[str]
+            Providers for Image generation
+
+        Yields
+        ------
+        tuple[str, bytes | Exception, float]
+            Provider, output image or an error it failed with, and wall time in seconds, in order of completion.
+        """
+        def timed(provider: str) -> tuple[str, bytes | Exception, float]:
+            start = time.perf_counter()
+            try:
+                image = self.execute(prompt, provider)
+            except Exception as error:
+                image = error
+            return provider, image, time.perf_counter() - start
+
+        if not providers:
+            return
+        with ThreadPoolExecutor(max_workers=len(providers)) as pool:
+            timed = workers.bind(timed)
+            for future in as_completed([pool.submit(timed, provider) for provider in providers]):
+                yield future.result()
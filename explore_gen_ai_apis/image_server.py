@@ -0,0 +1,99 @@
+"""Serving of cached images and their thumbnails to the browser straight from disk.
+
+`st.image` with bytes keeps a copy of every shown image in Streamlit's memory and sends it again on every rerun,
+instead the page gets urls of a small local HTTP server that reads objects of an `image_cache.ImageCache`. Urls contain
+sha256 of content, so responses are cached by the browser for good and a gallery of past images is shown at once.
+
+Server listens on `IMAGE_SERVER_PORT` (8767 by default), `IMAGE_SERVER_URL` is the address browser reaches it on, see
+`file_server`.
+"""
+import re
+from http.server import BaseHTTPRequestHandler
+
+from explore_gen_ai_apis import file_server, image_cache
+
+
+_PATH = re.compile(r"^/(?P<cache>[0-9a-f]{8})/(?P<kind>images|thumbnails)/(?P<digest>[0-9a-f]{64})$")
+_SIGNATURES = (
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+)
+
+
+def _content_type(head: bytes) -> str:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return "application/octet-stream"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, body: bool) -> None:
+        match = _PATH.match(self.path)
+        cache = _server.lookup(match["cache"]) if match else None
+        path = None
+        if cache is not None:
+            path = cache.thumbnail(match["digest"]) if match["kind"] == "thumbnails" else cache.path(match["digest"])
+        try:
+            content = file_server.open_file(path) if path else None
+        except FileNotFoundError:
+            content = None
+        if content is None:
+            self.send_error(404)
+            return
+        try:
+            etag = f'"{match["kind"]}-{match["digest"]}"'
+            file_server.send(self, content, _content_type(content[:12]), etag, body)
+        finally:
+            if not isinstance(content, bytes):
+                content.close()
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = file_server.FileServer("image-server", _Handler, "IMAGE_SERVER_PORT", 8767, "IMAGE_SERVER_URL")
+
+
+def url(digest: str, cache: image_cache.ImageCache | None = None, thumbnail: bool = False) -> str | None:
+    """Url of a cached image or its thumbnail.
+
+    Parameters
+    ----------
+    digest : str
+        Object digest, see `image_cache.ImageCache.digest`.
+    cache : image_cache.ImageCache, optional
+        Cache the object is stored in, process-wide cache by default.
+    thumbnail : bool
+        Whether to point to thumbnail instead of full image.
+
+    Returns
+    -------
+    str | None
+        Url for the browser, None if server isn't used or can't listen.
+    """
+    base_url = _server.base_url()
+    if base_url is None:
+        return None
+    cache = cache or image_cache.get_default()
+    cache_id = _server.register(cache.directory, cache)
+    return f"{base_url}/{cache_id}/{'thumbnails' if thumbnail else 'images'}/{digest}"
+
+
+def image_url(image: bytes, cache: image_cache.ImageCache | None = None) -> str | None:
+    """Url of full `image` if it is in `cache`, None otherwise, e.g. if it is too large to be cached or server isn't
+    used."""
+    cache = cache or image_cache.get_default()
+    digest = cache.digest(image)
+    return None if digest is None else url(digest, cache)
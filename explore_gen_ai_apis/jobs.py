@@ -0,0 +1,256 @@
+"""Tracking of long-running provider jobs, e.g. video renders.
+
+Instead of a thread busy-polling every job, all outstanding jobs of a provider are tracked by one `JobPoller` thread,
+which polls each job with exponential backoff. Providers that support callbacks can also notify `WebhookReceiver`, a
+callback makes its job be polled right away. Its body isn't trusted, anyone who reaches the port can send one.
+"""
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+@dataclass(frozen=True)
+class JobStatus:
+    """Job status reported by provider.
+
+    Attributes
+    ----------
+    state : str
+        One of `PENDING`, `READY`, `FAILED`.
+    status : str
+        Provider's own status, shown to user.
+    result : Any
+        Job output once it is `READY`, e.g. url.
+    error : str, optional
+        Error details once it is `FAILED`.
+    """
+    state: str
+    status: str
+    result: Any = None
+    error: str | None = None
+
+
+@dataclass(eq=False)
+class Job:
+    """Job tracked by `JobPoller`, it is updated in place by poller thread."""
+    job_id: str
+    status: JobStatus = JobStatus(PENDING, "queued")
+    submitted: float = field(default_factory=time.monotonic)
+    polls: int = 0
+    next_poll: float = 0.0
+    delay: float = 0.0
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.submitted
+
+    def wait(self, timeout: float | None = None) -> JobStatus:
+        """Block until job is finished or `timeout` passes.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Max seconds to wait.
+
+        Returns
+        -------
+        JobStatus
+            Latest status, still `PENDING` if timeout passed.
+        """
+        self.done.wait(timeout)
+        return self.status
+
+
+class JobPoller:
+    """Single background thread that polls all outstanding jobs.
+
+    Parameters
+    ----------
+    fetch : Callable[[str], JobStatus]
+        Fetch current status of a job by its id.
+    initial_delay : float
+        Seconds before first poll of a job.
+    max_delay : float
+        Max seconds between polls of a job, delay doubles after every poll until it reaches `max_delay`.
+    timeout : float
+        Jobs still pending after `timeout` seconds are failed.
+    """
+    def __init__(self, fetch: Callable[[str], JobStatus], initial_delay: float = 2.0, max_delay: float = 30.0,
+                 timeout: float = 900.0):
+        self.fetch = fetch
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._jobs: dict[str, Job] = {}
+        self._pending: dict[str, Job] = {}
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def track(self, job_id: str) -> Job:
+        """Start tracking job.
+
+        Parameters
+        ----------
+        job_id : str
+            Provider's id of the job.
+
+        Returns
+        -------
+        Job
+            Tracked job.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = Job(job_id, delay=self.initial_delay)
+                job.next_poll = job.submitted + job.delay
+                self._jobs[job_id] = job
+                self._pending[job_id] = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="job-poller", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """Tracked job by its id."""
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        """Number of jobs that are not finished yet."""
+        with self._cond:
+            return len(self._pending)
+
+    def update(self, job_id: str, status: JobStatus) -> None:
+        """Apply status of a job, e.g. received through callback.
+
+        Parameters
+        ----------
+        job_id : str
+            Provider's id of the job.
+        status : JobStatus
+            New status.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.done.is_set():
+                return
+            job.status = status
+            if status.state != PENDING:
+                del self._pending[job_id]
+                job.done.set()
+
+    def poll_now(self, job_id: str) -> None:
+        """Poll pending job as soon as possible, e.g. after provider reported it changed.
+
+        Parameters
+        ----------
+        job_id : str
+            Provider's id of the job, unknown and finished jobs are ignored.
+        """
+        with self._cond:
+            job = self._pending.get(job_id)
+            if job is not None:
+                job.next_poll = time.monotonic()
+                self._cond.notify()
+
+    def forget(self, job_id: str) -> None:
+        """Stop tracking job and drop it, so finished jobs don't pile up."""
+        with self._cond:
+            self._pending.pop(job_id, None)
+            self._jobs.pop(job_id, None)
+
+    def _due(self) -> list[Job]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                due = [job for job in self._pending.values() if job.next_poll <= now]
+                if due:
+                    return due
+                wait = min((job.next_poll for job in self._pending.values()), default=now + 60) - now
+                self._cond.wait(wait)
+
+    def _run(self) -> None:
+        while True:
+            for job in self._due():
+                if job.elapsed > self.timeout:
+                    self.update(job.job_id, JobStatus(FAILED, "timeout", error=f"Not finished in {self.timeout:.0f}s"))
+                    continue
+                try:
+                    status = self.fetch(job.job_id)
+                except Exception:
+                    # Transient errors are retried with the same backoff as pending jobs
+                    status = job.status
+                with self._cond:
+                    job.polls += 1
+                    job.delay = min(job.delay * 2, self.max_delay)
+                    # Jitter, so jobs submitted together don't keep polling together
+                    job.next_poll = time.monotonic() + job.delay * random.uniform(0.8, 1.2)
+                self.update(job.job_id, status)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Default backlog of 5 drops connections when many callbacks arrive at once
+    request_queue_size = 128
+
+
+class WebhookReceiver:
+    """Small HTTP server that receives job callbacks and makes `JobPoller` poll their jobs right away.
+
+    Status in a callback is not used, it is fetched from provider, so a forged callback can't change a job's result.
+
+    Parameters
+    ----------
+    poller : JobPoller
+        Poller that tracks the jobs.
+    parse : Callable[[dict], str]
+        Parse JSON callback body into job id.
+    port : int
+        Port to listen on, 0 picks a free one.
+    host : str
+        Interface to listen on.
+    """
+    def __init__(self, poller: JobPoller, parse: Callable[[dict], str], port: int = 0,
+                 host: str = "0.0.0.0"):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                try:
+                    body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                    job_id = parse(json.loads(body))
+                except (ValueError, KeyError, TypeError):
+                    self.send_response(400)
+                else:
+                    receiver.poller.poll_now(job_id)
+                    self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.poller = poller
+        self.server = _Server((host, port), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, name="job-webhook", daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
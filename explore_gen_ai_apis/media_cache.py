@@ -0,0 +1,356 @@
+"""Local copies of audio and videos generated by providers, served to the browser from disk.
+
+lovo, murf and tavus answer with urls on their own storage, those urls expire and every replay downloads the file from
+the provider again. `url` downloads the file once, streaming it to disk while it is hashed, and returns an url of a
+small local HTTP server instead, or path of the local copy if the server isn't used, which Streamlit serves:
+
+* objects are named by sha256 of content, so the same file behind different urls is stored once;
+* responses are read from memory-mapped objects and support ``Range`` requests, players use them to seek;
+* objects not used for `max_age` seconds are evicted, and least recently used ones while total size is above
+  `max_bytes`.
+
+Layout of cache directory::
+
+    objects/<digest[:2]>/<digest>    file content, named by sha256 of it
+    index.json                       source url -> digest, digest -> size, content type and last use, in LRU order
+
+Server listens on `MEDIA_SERVER_PORT` (8768 by default), `MEDIA_SERVER_URL` is the address browser reaches it on, see
+`file_server`.
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+from explore_gen_ai_apis import clients, file_server
+
+
+CHUNK_SIZE = file_server.CHUNK_SIZE
+
+_downloads = ThreadPoolExecutor(max_workers=4, thread_name_prefix="media-download")
+
+
+class MediaCache:
+    """Size and age bounded cache of downloaded files.
+
+    Parameters
+    ----------
+    directory : str
+        Cache directory, created if missing.
+    max_bytes : int
+        Max total size of stored objects, least recently used ones are evicted above it.
+    max_age : float
+        Seconds since last use after which object is evicted.
+    """
+    def __init__(self, directory: str, max_bytes: int, max_age: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Source url -> digest
+        self._urls: dict[str, str] = {}
+        # Digest -> [size, content type, last use], least recently used first
+        self._objects: OrderedDict[str, list] = OrderedDict()
+        # Source url -> download in progress
+        self._fetching: dict[str, Future] = {}
+        self._size = 0
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self._load()
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    def _load(self) -> None:
+        try:
+            with open(self._index_path()) as file:
+                index = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            index = {"urls": {}, "objects": []}
+        for digest, content_type, last_used in index["objects"]:
+            path = self._object_path(digest)
+            if os.path.exists(path):
+                self._objects[digest] = [os.path.getsize(path), content_type, last_used]
+                self._size += self._objects[digest][0]
+        self._urls = {url: digest for url, digest in index["urls"].items() if digest in self._objects}
+        self._evict()
+
+    def _save(self) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            json.dump({
+                "urls": self._urls,
+                "objects": [[digest, content_type, last_used] for digest, (__, content_type, last_used)
+                            in self._objects.items()],
+            }, file)
+        os.replace(tmp, self._index_path())
+
+    def _touch(self, digest: str) -> None:
+        self._objects[digest][2] = time.time()
+        self._objects.move_to_end(digest)
+
+    def _evict(self) -> None:
+        """Drop objects not used for `max_age` and least recently used ones above `max_bytes`."""
+        oldest = time.time() - self.max_age
+        while self._objects:
+            digest, (size, __, last_used) = next(iter(self._objects.items()))
+            if self._size <= self.max_bytes and last_used >= oldest:
+                break
+            del self._objects[digest]
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+        self._urls = {url: digest for url, digest in self._urls.items() if digest in self._objects}
+
+    def lookup(self, url: str) -> str | None:
+        """Digest of file downloaded from `url`, None if it isn't stored, without downloading it."""
+        with self._lock:
+            digest = self._urls.get(url)
+            if digest is None:
+                return None
+            self._touch(digest)
+            return digest
+
+    def fetch(self, url: str, client: str = "media") -> str | None:
+        """Download file unless it is already stored, concurrent fetches of the same url share one download.
+
+        Parameters
+        ----------
+        url : str
+            Source url.
+        client : str
+            Label of pooled session the file is downloaded with, see `clients.get_session`.
+
+        Returns
+        -------
+        str | None
+            Digest of stored file, None if it is larger than `max_bytes` and wasn't kept.
+        """
+        with self._lock:
+            digest = self._urls.get(url)
+            if digest is not None:
+                self._touch(digest)
+                self.hits += 1
+                return digest
+            future = self._fetching.get(url)
+            downloading = future is None
+            if downloading:
+                future = self._fetching[url] = Future()
+                self.misses += 1
+        if not downloading:
+            return future.result()
+        try:
+            future.set_result(self._download(url, client))
+        except BaseException as error:
+            future.set_exception(error)
+        finally:
+            with self._lock:
+                del self._fetching[url]
+        return future.result()
+
+    def prefetch(self, url: str, client: str = "media") -> Future:
+        """Start `fetch` in background, unless url is already being downloaded.
+
+        Returns
+        -------
+        Future
+            Future of digest.
+        """
+        with self._lock:
+            future = self._fetching.get(url)
+        return future or _downloads.submit(self.fetch, url, client)
+
+    def _download(self, url: str, client: str) -> str | None:
+        hasher = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.directory, "objects"), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file, clients.get_session(client).get(url, stream=True) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "application/octet-stream").split(";")[0]
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    file.write(chunk)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        digest = hasher.hexdigest()
+        size = os.path.getsize(tmp)
+        if size > self.max_bytes:
+            os.remove(tmp)
+            return None
+        with self._lock:
+            if digest in self._objects:
+                # Same content from another url
+                os.remove(tmp)
+            else:
+                path = self._object_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+                self._objects[digest] = [size, content_type, 0.0]
+                self._size += size
+            self._urls[url] = digest
+            self._touch(digest)
+            self._evict()
+            self._save()
+        return digest
+
+    def path(self, digest: str) -> str | None:
+        """Path of stored object, None if there is none with `digest`."""
+        with self._lock:
+            if digest not in self._objects:
+                return None
+            self._touch(digest)
+            return self._object_path(digest)
+
+    def open(self, digest: str) -> tuple[mmap.mmap | bytes, str] | None:
+        """Read stored object.
+
+        Parameters
+        ----------
+        digest : str
+            Object digest.
+
+        Returns
+        -------
+        tuple[mmap.mmap | bytes, str] | None
+            Read-only memory map of content, or empty bytes for an empty file, and its content type. None if there is
+            no such object.
+        """
+        with self._lock:
+            if digest not in self._objects:
+                return None
+            size, content_type, __ = self._objects[digest]
+            self._touch(digest)
+            if not size:
+                return b"", content_type
+            try:
+                with open(self._object_path(digest), "rb") as file:
+                    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), content_type
+            except FileNotFoundError:
+                # Object was removed behind our back
+                del self._objects[digest]
+                self._size -= size
+                self._urls = {url: stored for url, stored in self._urls.items() if stored != digest}
+                return None
+
+    def stats(self) -> dict[str, int]:
+        """Counters to size the cache with.
+
+        Returns
+        -------
+        dict[str, int]
+            hits, misses, evictions, number of urls and objects, total size in bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "urls": len(self._urls),
+                "objects": len(self._objects),
+                "bytes": self._size,
+            }
+
+
+_PATH = re.compile(r"^/(?P<cache>[0-9a-f]{8})/(?P<digest>[0-9a-f]{64})$")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, body: bool) -> None:
+        match = _PATH.match(self.path)
+        cache = _server.lookup(match["cache"]) if match else None
+        opened = cache.open(match["digest"]) if cache is not None else None
+        if opened is None:
+            self.send_error(404)
+            return
+        content, content_type = opened
+        try:
+            file_server.send(self, content, content_type, f'"{match["digest"]}"', body)
+        finally:
+            if isinstance(content, mmap.mmap):
+                content.close()
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = file_server.FileServer("media-server", _Handler, "MEDIA_SERVER_PORT", 8768, "MEDIA_SERVER_URL")
+
+
+def _local_url(digest: str, cache: MediaCache) -> str | None:
+    """Url of stored object, its path if server isn't used, None if it was evicted meanwhile."""
+    base_url = _server.base_url()
+    if base_url is None:
+        return cache.path(digest)
+    return f"{base_url}/{_server.register(cache.directory, cache)}/{digest}"
+
+
+def url(source: str, client: str = "media", cache: MediaCache | None = None) -> str:
+    """Url of local copy of file, it is downloaded first unless it is already stored.
+
+    Parameters
+    ----------
+    source : str
+        Provider's url of the file.
+    client : str
+        Label of pooled session the file is downloaded with, e.g. provider name.
+    cache : MediaCache, optional
+        Cache to store file in, process-wide cache by default.
+
+    Returns
+    -------
+    str
+        Url for the browser, path of local copy if server isn't used, `source` itself if file is too large to be
+        cached.
+    """
+    cache = cache or get_default()
+    digest = cache.fetch(source, client)
+    return (digest and _local_url(digest, cache)) or source
+
+
+def cached_url(source: str, cache: MediaCache | None = None) -> str | None:
+    """Url or path of local copy of file if it is stored, see `url`, None otherwise, never downloads."""
+    cache = cache or get_default()
+    digest = cache.lookup(source)
+    return digest and _local_url(digest, cache)
+
+
+_default: MediaCache | None = None
+_default_lock = threading.Lock()
+
+
+def get_default() -> MediaCache:
+    """Process-wide cache configured by `MEDIA_CACHE_DIR`, `MEDIA_CACHE_MAX_BYTES` and `MEDIA_CACHE_MAX_AGE`
+    environment variables."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = MediaCache(
+                os.environ.get("MEDIA_CACHE_DIR", "./.cache/media"),
+                int(os.environ.get("MEDIA_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024)),
+                float(os.environ.get("MEDIA_CACHE_MAX_AGE", 7 * 24 * 3600)),
+            )
+        return _default
@@ -0,0 +1,441 @@
+"""In-process metrics of provider calls, exported in Prometheus text format.
+
+Two levels are recorded:
+
+* calls - every instrumented ``execute``/``generate_response``: wall time, time to first response byte, bytes sent and
+  received, retries and outcome, labelled by operation and provider;
+* HTTP exchanges - every request that goes through a pooled client of `clients`: time to response headers, bytes,
+  status code and retries, labelled by client.
+
+Exchanges made in the calling thread are also added to its call. Metrics are served on
+``http://<METRICS_HOST>:<METRICS_PORT>/metrics``, ``127.0.0.1`` and 9464 by default, port 0 disables the server. Set
+`METRICS_HOST` to ``0.0.0.0`` for Prometheus on other hosts.
+"""
+import functools
+import inspect
+import os
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+# Only used at call time, rate_limit imports this module too
+from explore_gen_ai_apis import rate_limit
+
+
+# Seconds
+TIME_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+# Number of most recent observations per label set kept for percentiles
+RECENT = 1000
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic counter.
+
+    Parameters
+    ----------
+    name : str
+        Metric name.
+    documentation : str
+        Help text.
+    labels : tuple[str, ...]
+        Label names.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[dict[str, str | float]]:
+        """Labels and value of every series."""
+        with self._lock:
+            return [{**dict(zip(self.labels, key)), "value": value} for key, value in self._values.items()]
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return super().render() + [
+            f"{self.name}{_format_labels(dict(zip(self.labels, key)))} {value}" for key, value in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Histogram with fixed cumulative buckets for export, plus recent observations for exact percentiles.
+
+    Parameters
+    ----------
+    name : str
+        Metric name.
+    documentation : str
+        Help text.
+    buckets : tuple[float, ...]
+        Upper bounds of buckets, ascending.
+    labels : tuple[str, ...]
+        Label names.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...], labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = defaultdict(float)
+        self._recent: dict[tuple[str, ...], deque[float]] = defaultdict(lambda: deque(maxlen=RECENT))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[key] += value
+            self._recent[key].append(value)
+
+    def series(self) -> list[dict[str, str]]:
+        """Label sets observed so far."""
+        with self._lock:
+            return [dict(zip(self.labels, key)) for key in self._counts]
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), ()))
+
+    def percentiles(self, shares: tuple[float, ...] = (0.5, 0.95, 0.99), **labels: str) -> list[float | None]:
+        """Percentiles of the most recent `RECENT` observations, None where nothing was observed."""
+        with self._lock:
+            recent = sorted(self._recent.get(self._key(labels), ()))
+        if not recent:
+            return [None] * len(shares)
+        return [recent[min(len(recent) - 1, int(share * len(recent)))] for share in shares]
+
+    def render(self) -> list[str]:
+        with self._lock:
+            counts = {key: list(value) for key, value in self._counts.items()}
+            sums = dict(self._sums)
+        lines = super().render()
+        for key, bucket_counts in counts.items():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), bucket_counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+_registry: list[_Metric] = []
+
+CALL_SECONDS = Histogram(
+    "gen_ai_call_seconds", "Wall time of provider calls.", TIME_BUCKETS, ("operation", "provider", "status")
+)
+CALL_TTFB_SECONDS = Histogram(
+    "gen_ai_call_ttfb_seconds", "Time from start of provider call to first response headers or token.",
+    TIME_BUCKETS, ("operation", "provider")
+)
+CALL_REQUEST_BYTES = Histogram(
+    "gen_ai_call_request_bytes", "Bytes sent during provider call.", SIZE_BUCKETS, ("operation", "provider")
+)
+CALL_RESPONSE_BYTES = Histogram(
+    "gen_ai_call_response_bytes", "Bytes received during provider call.", SIZE_BUCKETS, ("operation", "provider")
+)
+CALL_RETRIES = Counter(
+    "gen_ai_call_retries_total", "Retried HTTP requests of provider calls.", ("operation", "provider")
+)
+TOKENS = Counter("gen_ai_tokens_total", "Tokens reported by LLM providers.", ("provider", "kind"))
+HTTP_TTFB_SECONDS = Histogram(
+    "gen_ai_http_ttfb_seconds", "Time from sending HTTP request to its response headers.", TIME_BUCKETS, ("client",)
+)
+HTTP_RESPONSES = Counter(
+    "gen_ai_http_responses_total", "HTTP responses by status code, `error` if no response came.", ("client", "code")
+)
+HTTP_SENT_BYTES = Counter("gen_ai_http_sent_bytes_total", "HTTP request body bytes.", ("client",))
+HTTP_RECEIVED_BYTES = Counter("gen_ai_http_received_bytes_total", "HTTP response body bytes.", ("client",))
+HTTP_RETRIES = Counter(
+    "gen_ai_http_retries_total", "HTTP requests repeated after a failed or throttled attempt.", ("client",)
+)
+HEDGE_CALLS = Counter(
+    "gen_ai_hedge_calls_total", "Hedged calls by whether backup was sent and which request answered first.",
+    ("operation", "primary", "outcome")
+)
+HEDGE_TTFT_SECONDS = Histogram(
+    "gen_ai_hedge_ttft_seconds", "Time to first token of hedged calls and of their primary request on its own.",
+    TIME_BUCKETS, ("operation", "primary", "path")
+)
+RATE_LIMIT_WAIT_SECONDS = Counter(
+    "gen_ai_rate_limit_wait_seconds_total", "Time requests waited for client side rate limit.", ("client",)
+)
+
+
+@dataclass
+class _Call:
+    start: float
+    ttfb: float | None = None
+    sent: int = 0
+    received: int = 0
+    retries: int = 0
+
+
+_local = threading.local()
+
+
+def _active_calls() -> list[_Call]:
+    if not hasattr(_local, "calls"):
+        _local.calls = []
+        _local.failed = set()
+    return _local.calls
+
+
+class Exchange:
+    """Single HTTP request/response, reported by instrumented transports of `clients`.
+
+    Parameters
+    ----------
+    client : str
+        Client name.
+    method : str
+        HTTP method.
+    url : str
+        Request url.
+    sent : int
+        Request body size.
+    """
+    def __init__(self, client: str, method: str, url: str, sent: int):
+        self.client = client
+        self.calls = list(_active_calls())
+        self._key = (client, method, url)
+        self._start = time.perf_counter()
+        HTTP_SENT_BYTES.inc(sent, client=client)
+        if self._key in _local.failed:
+            HTTP_RETRIES.inc(client=client)
+        for call in self.calls:
+            call.sent += sent
+            call.retries += self._key in _local.failed
+
+    def responded(self, status: int) -> None:
+        """Response headers arrived."""
+        now = time.perf_counter()
+        HTTP_TTFB_SECONDS.observe(now - self._start, client=self.client)
+        HTTP_RESPONSES.inc(client=self.client, code=str(status))
+        for call in self.calls:
+            if call.ttfb is None:
+                call.ttfb = now - call.start
+        # Same request is retried after these, see `rate_limit`
+        if status in rate_limit.RETRIABLE:
+            _local.failed.add(self._key)
+        else:
+            _local.failed.discard(self._key)
+
+    def failed(self) -> None:
+        """No response came, e.g. connection error or timeout."""
+        HTTP_RESPONSES.inc(client=self.client, code="error")
+        _local.failed.add(self._key)
+
+    def received(self, size: int) -> None:
+        """Part of response body was read, possibly in another thread."""
+        HTTP_RECEIVED_BYTES.inc(size, client=self.client)
+        for call in self.calls:
+            call.received += size
+
+
+def observe_call(
+        operation: str,
+        provider: str,
+        seconds: float,
+        status: str,
+        ttfb: float | None = None,
+        sent: int = 0,
+        received: int = 0,
+        retries: int = 0
+) -> None:
+    """Record a finished provider call.
+
+    Parameters
+    ----------
+    operation : str
+        What was done, e.g. ``image_generation``.
+    provider : str
+        Provider name as selected in page.
+    seconds : float
+        Wall time.
+    status : str
+        ``ok``, ``error`` or ``cache_hit`` if result was found in a cache and no provider was called.
+    ttfb : float, optional
+        Seconds until first response headers or first streamed token.
+    sent : int
+        Bytes sent.
+    received : int
+        Bytes received.
+    retries : int
+        Number of retried HTTP requests.
+    """
+    CALL_SECONDS.observe(seconds, operation=operation, provider=provider, status=status)
+    if ttfb is not None:
+        CALL_TTFB_SECONDS.observe(ttfb, operation=operation, provider=provider)
+    if sent or received:
+        CALL_REQUEST_BYTES.observe(sent, operation=operation, provider=provider)
+        CALL_RESPONSE_BYTES.observe(received, operation=operation, provider=provider)
+    if retries:
+        CALL_RETRIES.inc(retries, operation=operation, provider=provider)
+
+
+def record_tokens(provider: str, input_tokens: int | None = None, output_tokens: int | None = None) -> None:
+    """Record token usage reported by LLM provider."""
+    if input_tokens:
+        TOKENS.inc(input_tokens, provider=provider, kind="input")
+    if output_tokens:
+        TOKENS.inc(output_tokens, provider=provider, kind="output")
+
+
+def instrumented(
+        operation: str,
+        provider_of: Callable[[dict[str, Any]], str] = lambda arguments: arguments["provider"]
+) -> Callable:
+    """Decorator that records every call of the function as a provider call.
+
+    Parameters
+    ----------
+    operation : str
+        Operation label.
+    provider_of : Callable[[dict[str, Any]], str]
+        Provider label from bound arguments of the call, its ``provider`` argument by default.
+
+    Returns
+    -------
+    Callable
+        Decorator.
+    """
+    def decorator(function: Callable) -> Callable:
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            _ensure_server()
+            provider = str(provider_of(signature.bind(*args, **kwargs).arguments))
+            calls = _active_calls()
+            if not calls:
+                # Failures of earlier calls in this thread aren't retried by this one
+                _local.failed.clear()
+            call = _Call(time.perf_counter())
+            calls.append(call)
+            status = "error"
+            try:
+                result = function(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                calls.remove(call)
+                observe_call(
+                    operation, provider, time.perf_counter() - call.start, status,
+                    ttfb=call.ttfb, sent=call.sent, received=call.received, retries=call.retries
+                )
+
+        return wrapper
+
+    return decorator
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format."""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+_server_lock = threading.Lock()
+_server: ThreadingHTTPServer | None = None
+_server_error: OSError | None = None
+
+
+def _ensure_server() -> int | None:
+    """Start export server once per process, returns its port or None if it is disabled or port is taken."""
+    global _server, _server_error
+    if _server is not None or _server_error is not None:
+        return _server.server_address[1] if _server else None
+    port = int(os.environ.get("METRICS_PORT", 9464))
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None and _server_error is None:
+            try:
+                _server = _Server((os.environ.get("METRICS_HOST", "127.0.0.1"), port), _Handler)
+            except OSError as error:
+                # E.g. another Streamlit process already exports, calls must not fail because of it
+                _server_error = error
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server.server_address[1] if _server else None
+
+
+def server_url() -> str | None:
+    """Url of export endpoint, None if it isn't running."""
+    port = _ensure_server()
+    if not port:
+        return None
+    host = _server.server_address[0]
+    # Listening on every interface, the host name is one of them
+    return f"http://{socket.gethostname() if host == '0.0.0.0' else host}:{port}/metrics"
@@ -0,0 +1,323 @@
+"""Summarize -> translate -> TTS -> video chain, streamed sentence by sentence.
+
+Stages overlap instead of running back to back: summary is streamed and split into sentences as soon as their end is
+seen, translation of the first sentence starts while the rest of the summary is still streamed, and TTS of the first
+translated sentence starts while later ones are translated. Stages run in threads of their own connected by queues,
+translation and TTS send requests of up to `CONCURRENCY` sentences at once and pass results on in order. A video
+renders a whole script, so it is submitted once the last sentence is translated and rendered while remaining
+sentences are voiced.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Generator, Iterable, Iterator, TypeVar
+
+from explore_gen_ai_apis import jobs, text_summarization_api, translation, tts, video_tts, workers
+from explore_gen_ai_apis.text import segment
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+SUMMARIZATION = "summarization"
+TRANSLATION = "translation"
+TTS = "tts"
+VIDEO = "video"
+# Max requests of translation and of TTS in flight at once, results are still used in order
+CONCURRENCY = 4
+
+
+def sentences(chunks: Iterable[str]) -> Iterator[str]:
+    """Split streamed text into sentences, each is yielded as soon as its end is seen.
+
+    Parameters
+    ----------
+    chunks : Iterable[str]
+        Pieces of text, e.g. streamed tokens.
+
+    Returns
+    -------
+    Iterator[str]
+        Sentences, stripped of surrounding whitespace.
+    """
+    buffer = ""
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            parts = segment(buffer)
+            # Last part is a sentence that may go on in the next chunk
+            for sentence in parts[:-1:2]:
+                if sentence.strip():
+                    yield sentence.strip()
+            buffer = parts[-1]
+    finally:
+        _close(chunks)
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def _close(items: Iterator) -> None:
+    """Close generator, so the ones it takes items from are closed too, down to provider's response."""
+    if hasattr(items, "close"):
+        items.close()
+
+
+def _ahead(items: Iterator[T]) -> Iterator[T]:
+    """Run iterator in a thread of its own, so it produces next items while caller is busy with earlier ones.
+
+    Closing the returned iterator stops the thread once its current item is done.
+    """
+    produced: queue.Queue = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                produced.put((True, item))
+            produced.put((False, None))
+        except BaseException as error:
+            produced.put((False, error))
+        finally:
+            _close(items)
+
+    threading.Thread(target=workers.bind(produce), name="pipeline", daemon=True).start()
+    try:
+        while True:
+            ok, item = produced.get()
+            if not ok:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _ordered(function: Callable[[T], R], items: Iterator[T], concurrency: int) -> Iterator[R]:
+    """Call function on items as they come, with up to `concurrency` calls at once, results are yielded in order.
+
+    Items are taken by a thread of its own, so a call starts as soon as its item is there, not when caller asks for
+    the next result.
+    """
+    pool = ThreadPoolExecutor(concurrency, thread_name_prefix="pipeline")
+    slots = threading.Semaphore(concurrency)
+    function = workers.bind(function)
+
+    def submit() -> Iterator[Future]:
+        try:
+            for item in items:
+                slots.acquire()
+                future = pool.submit(function, item)
+                future.add_done_callback(lambda __: slots.release())
+                yield future
+        finally:
+            _close(items)
+
+    try:
+        for future in _ahead(submit()):
+            yield future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+@dataclass
+class Segment:
+    """Sentence of the summary that went through all stages.
+
+    Attributes
+    ----------
+    index : int
+        Position in summary.
+    summary : str
+        Summarized sentence.
+    translation : str
+        Its translation.
+    audio : str
+        Url to its audio.
+    ready : float
+        Seconds from start of pipeline until audio was ready.
+    """
+    index: int
+    summary: str
+    translation: str
+    audio: str
+    ready: float
+
+
+@dataclass
+class StageReport:
+    """Latency of a stage.
+
+    Attributes
+    ----------
+    stage : str
+        One of `SUMMARIZATION`, `TRANSLATION`, `TTS`, `VIDEO`.
+    items : int
+        Number of outputs, sentences or videos.
+    first : float, optional
+        Seconds from start of pipeline until first output.
+    last : float, optional
+        Seconds from start of pipeline until last output.
+    busy : float
+        Seconds spent waiting for provider.
+    """
+    stage: str
+    items: int = 0
+    first: float | None = None
+    last: float | None = None
+    busy: float = 0.0
+
+
+@dataclass
+class Report:
+    """Per-stage latency and end-to-end time of a pipeline run.
+
+    Attributes
+    ----------
+    stages : list[StageReport]
+        Latency of every stage, in order of pipeline.
+    total : float
+        Seconds from start of pipeline until its last output.
+    video : str, optional
+        Url to video.
+    sequential : float
+        Sum of busy time of all stages, roughly end-to-end time if they ran back to back.
+    """
+    stages: list[StageReport]
+    total: float
+    video: str | None = None
+    sequential: float = field(init=False)
+
+    def __post_init__(self):
+        self.sequential = sum(stage.busy for stage in self.stages)
+
+    def rows(self) -> list[dict]:
+        return [asdict(stage) for stage in self.stages]
+
+
+class Pipeline:
+    """Chain of summarization, translation, TTS and optionally video providers.
+
+    Parameters
+    ----------
+    summarization_provider : str
+        LLM provider, see `text_summarization_api.Generator.execute_stream`.
+    translation_provider : str
+        Translation provider, see `translation.Generator.execute`.
+    tts_provider : str
+        TTS provider, see `tts.Generator.execute`.
+    video_provider : str, optional
+        Video TTS provider, no video is rendered if it is None.
+    video_timeout : float
+        Max seconds to wait for video.
+    """
+    def __init__(
+            self,
+            summarization_provider: str = "OpenAI",
+            translation_provider: str = "deepl",
+            tts_provider: str = "elevenlabs",
+            video_provider: str | None = None,
+            video_timeout: float = 600
+    ):
+        self.summarization_provider = summarization_provider
+        self.translation_provider = translation_provider
+        self.tts_provider = tts_provider
+        self.video_provider = video_provider
+        self.video_timeout = video_timeout
+        self.summarizer = text_summarization_api.Generator()
+        self.translator = translation.Generator()
+        self.speaker = tts.Generator()
+        self.video_generator = video_tts.Generator()
+
+    def run(self, text: str) -> Generator[Segment, None, Report]:
+        """Summarize text, translate and voice summary sentence by sentence, and render video of translation.
+
+        Parameters
+        ----------
+        text : str
+            Input text.
+
+        Returns
+        -------
+        Generator[Segment, None, Report]
+            Voiced sentences in order, report is the return value of generator.
+
+        Raises
+        ------
+        Exception
+            If any stage fails, or video failed or wasn't ready within `video_timeout`.
+        """
+        start = time.perf_counter()
+        stages = (SUMMARIZATION, TRANSLATION, TTS) + ((VIDEO,) if self.video_provider else ())
+        reports = {stage: StageReport(stage) for stage in stages}
+        video_job: jobs.Job | None = None
+
+        lock = threading.Lock()
+
+        def done(stage: str, began: float) -> None:
+            now = time.perf_counter()
+            with lock:
+                report = reports[stage]
+                report.items += 1
+                report.busy += now - began
+                report.first = now - start if report.first is None else report.first
+                report.last = now - start
+
+        def summarize() -> Iterator[str]:
+            began = time.perf_counter()
+            summarized = sentences(self.summarizer.execute_stream(text, self.summarization_provider))
+            try:
+                for sentence in summarized:
+                    done(SUMMARIZATION, began)
+                    yield sentence
+                    began = time.perf_counter()
+            finally:
+                _close(summarized)
+
+        def translate(sentence: str) -> tuple[str, str]:
+            began = time.perf_counter()
+            translated = self.translator.execute(sentence, self.translation_provider)
+            done(TRANSLATION, began)
+            return sentence, translated
+
+        def submit_video(translated: Iterator[tuple[str, str]]) -> Iterator[tuple[str, str]]:
+            nonlocal video_job
+            script = []
+            try:
+                for pair in translated:
+                    script.append(pair[1])
+                    yield pair
+            finally:
+                _close(translated)
+            if self.video_provider and script:
+                video_job = self.video_generator.submit(" ".join(script), self.video_provider)
+
+        def speak(translated: tuple[str, str]) -> tuple[str, str, str]:
+            began = time.perf_counter()
+            audio = self.speaker.execute(translated[1], self.tts_provider)
+            done(TTS, began)
+            return *translated, audio
+
+        voiced = _ordered(speak, submit_video(_ordered(translate, _ahead(summarize()), CONCURRENCY)), CONCURRENCY)
+        try:
+            for index, (sentence, translated, audio) in enumerate(voiced):
+                yield Segment(index, sentence, translated, audio, time.perf_counter() - start)
+        finally:
+            _close(voiced)
+
+        video = None
+        if video_job is not None:
+            status = video_job.wait(self.video_timeout)
+            self.video_generator.forget(video_job, self.video_provider)
+            if status.state == jobs.FAILED:
+                raise Exception(status.error)
+            if status.state != jobs.READY:
+                raise Exception(f"Failed to render video in {self.video_timeout} seconds")
+            # Job was submitted `elapsed` seconds ago
+            done(VIDEO, time.perf_counter() - video_job.elapsed)
+            video = status.result
+        return Report(list(reports.values()), time.perf_counter() - start, video)
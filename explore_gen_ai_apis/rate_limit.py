@@ -0,0 +1,337 @@
+"""Adaptive client side rate limiting and retries of provider requests.
+
+Every request that goes through a pooled client of `clients` first takes a token from a bucket of its provider and API
+key, so parallel pages and batch runs share one budget per quota instead of each finding the limit on its own. Rate of
+a bucket is learned:
+
+* from rate limit headers (OpenAI, Anthropic and the common ``x-ratelimit-*``/``ratelimit-*`` ones), remaining requests
+  are spread evenly until the window resets;
+* without headers, additive increase while the bucket is the bottleneck and multiplicative decrease on every 429.
+
+Throttled (429), unavailable (408, 5xx) and unconnected requests are retried with full jitter exponential backoff, but
+never sooner than ``Retry-After`` says.
+"""
+import email.utils
+import hashlib
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime
+
+from explore_gen_ai_apis import metrics
+
+
+# Kill switch, requests go out unpaced and unretried when off
+ENABLED = os.environ.get("GEN_AI_RATE_LIMITING", "1") != "0"
+# Requests per second of a bucket before anything is learned about its quota
+INITIAL_RATE = float(os.environ.get("GEN_AI_RATE_LIMIT", 10))
+# Requests that can be sent at once after a bucket was idle, as many as connections in a pool
+BURST = float(os.environ.get("GEN_AI_RATE_BURST", 16))
+MIN_RATE = 0.1
+# Rate is multiplied by this on every 429
+DECREASE = 0.7
+# Retries of a single request, 0 disables them
+MAX_RETRIES = int(os.environ.get("GEN_AI_MAX_RETRIES", 4))
+# Seconds, base and cap of backoff, `Retry-After` longer than cap is given up on
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = float(os.environ.get("GEN_AI_MAX_RETRY_WAIT", 60))
+RETRIABLE = frozenset({408, 429, 500, 502, 503, 504})
+# Methods repeated when connection failed after request may have been sent
+IDEMPOTENT = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Headers of API keys, in order of precedence
+_KEY_HEADERS = ("authorization", "x-api-key", "xi-api-key", "api-key", "x-rapidapi-key")
+# Limit, remaining and reset headers of request quotas
+_QUOTA_HEADERS = (
+    ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+    (
+        "anthropic-ratelimit-requests-limit",
+        "anthropic-ratelimit-requests-remaining",
+        "anthropic-ratelimit-requests-reset",
+    ),
+    ("x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset"),
+    ("ratelimit-limit", "ratelimit-remaining", "ratelimit-reset"),
+)
+# Go style durations of OpenAI, e.g. "6m0s"
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def _seconds(value: str | None) -> float | None:
+    """Seconds from now of a delay or a moment, e.g. ``"20"``, ``"6m0s"``, ``"20ms"``, epoch, RFC 3339 or HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        number = float(value)
+    except ValueError:
+        pass
+    else:
+        # Large numbers are epoch timestamps
+        return max(number - time.time(), 0.0) if number > 1e9 else max(number, 0.0)
+    if not _DURATION.sub("", value):
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(amount) * scale[unit] for amount, unit in _DURATION.findall(value))
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            moment = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if moment.tzinfo is None:
+        return None
+    return max(moment.timestamp() - time.time(), 0.0)
+
+
+def retry_after(headers: Mapping[str, str]) -> float | None:
+    """Seconds to wait before retrying according to response `headers`, None if they don't say."""
+    milliseconds = headers.get("retry-after-ms")
+    if milliseconds:
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+    return _seconds(headers.get("retry-after"))
+
+
+def quota(headers: Mapping[str, str]) -> tuple[float | None, float, float] | None:
+    """Limit, remaining requests and seconds until reset from response `headers`, None if they have none."""
+    for limit_header, remaining_header, reset_header in _QUOTA_HEADERS:
+        remaining, reset = headers.get(remaining_header), _seconds(headers.get(reset_header))
+        if remaining is None or reset is None:
+            continue
+        try:
+            limit = headers.get(limit_header)
+            # IETF draft allows a policy after the number, e.g. "100, 100;w=60"
+            return (
+                float(limit.split(",")[0].split(";")[0]) if limit else None,
+                float(remaining.split(",")[0].split(";")[0]),
+                reset,
+            )
+        except ValueError:
+            continue
+    return None
+
+
+class TokenBucket:
+    """Token bucket whose rate adapts to responses of the provider it limits.
+
+    Waiting requests hold numbered tickets and are let through in order of arrival. They are woken whenever the rate
+    changes, so a wait computed at an old rate never outlives it.
+
+    Parameters
+    ----------
+    rate : float, optional
+        Initial requests per second, `INITIAL_RATE` by default.
+    burst : float, optional
+        Max number of tokens, `BURST` by default.
+    """
+    def __init__(self, rate: float | None = None, burst: float | None = None):
+        self.rate = INITIAL_RATE if rate is None else rate
+        self.burst = BURST if burst is None else burst
+        # Rate at last 429, additive increase slows down above it
+        self.ceiling = math.inf
+        # Tokens added since creation and tickets handed out since creation, their difference is tokens available
+        self._granted = self.burst
+        self._issued = 0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._saturated = False
+        # Longest quota reset seen in headers, seconds
+        self._window = 0.0
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(now - self._updated, 0.0)
+        self._granted = min(self._granted + elapsed * self.rate, max(self._granted, self._issued + self.burst))
+        self._updated = max(now, self._updated)
+
+    def acquire(self) -> float:
+        """Take a token, waiting for it if there is none, returns seconds waited."""
+        start = time.monotonic()
+        with self._condition:
+            self._refill(start)
+            ticket = self._issued
+            self._issued += 1
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._granted >= ticket + 1:
+                    return now - start
+                if now >= self._paused_until:
+                    self._saturated = True
+                self._condition.wait(max(self._paused_until - now, (ticket + 1 - self._granted) / self.rate))
+
+    def pause(self, seconds: float) -> None:
+        """Hold all requests for `seconds`, then let them through at current rate."""
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            until = now + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                # At most one request goes right after the pause
+                self._granted = min(self._granted, self._issued + 1)
+                self._updated = until
+                self._condition.notify_all()
+
+    def learn(self, limit: float | None, remaining: float, reset: float) -> None:
+        """Pace requests so the quota of `limit` lasts its window, `remaining` ones until it resets in `reset` seconds.
+
+        Window is taken as the longest reset seen and the rate never drops below its share of the limit, so a low
+        remaining count late in a window doesn't stall requests that are already waiting.
+        """
+        if remaining < 1:
+            self.pause(reset)
+            return
+        with self._condition:
+            self._refill(time.monotonic())
+            self._window = max(self._window, reset)
+            rate = remaining / reset if reset > 0 else math.inf
+            if limit and self._window > 0:
+                rate = max(rate, limit / self._window)
+            if math.isfinite(rate):
+                self.rate = max(rate, MIN_RATE)
+            if limit:
+                self.burst = max(min(limit, BURST), 1.0)
+            self._condition.notify_all()
+
+    def throttled(self, sent: float, wait: float | None) -> None:
+        """Provider answered 429, lower the rate and hold requests for `wait` seconds if given.
+
+        Rate is lowered once per burst of 429s, those of requests `sent` before the last decrease are its echo.
+        """
+        with self._condition:
+            if sent >= self._decreased_at:
+                self._refill(time.monotonic())
+                self.ceiling = self.rate
+                self.rate = max(self.rate * DECREASE, MIN_RATE)
+                self._decreased_at = time.monotonic()
+                self._saturated = False
+        if wait:
+            self.pause(wait)
+
+    def succeeded(self) -> None:
+        """Request went through, raise the rate if the bucket was what held requests back.
+
+        Until the first 429 the rate doubles every second of saturation, then it grows by one request per second each
+        second, ten times slower above the rate of the last 429.
+        """
+        with self._condition:
+            if self._saturated:
+                self._saturated = False
+                self._refill(time.monotonic())
+                if math.isinf(self.ceiling):
+                    self.rate += 1.0
+                else:
+                    self.rate += (1.0 if self.rate < self.ceiling else 0.1) / self.rate
+                self._condition.notify_all()
+
+
+_lock = threading.Lock()
+# (client, API key digest) -> bucket
+_buckets: dict[tuple[str, str], TokenBucket] = {}
+
+
+def get_bucket(client: str, headers: Mapping[str, str]) -> TokenBucket:
+    """Bucket of `client` and API key sent in request `headers`, keys are kept only as digests.
+
+    Parameters
+    ----------
+    client : str
+        Client name, as labelled in `metrics`.
+    headers : Mapping[str, str]
+        Case-insensitive request headers.
+
+    Returns
+    -------
+    TokenBucket
+        Shared bucket.
+    """
+    key = next((headers[name] for name in _KEY_HEADERS if headers.get(name)), "")
+    index = client, hashlib.sha256(key.encode()).hexdigest()[:16] if key else ""
+    bucket = _buckets.get(index)
+    if bucket is None:
+        with _lock:
+            bucket = _buckets.setdefault(index, TokenBucket())
+    return bucket
+
+
+def backoff(attempt: int) -> float:
+    """Full jitter delay before retry number `attempt` (0 based)."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class Limiter:
+    """Rate limit and retry state of one request, used by instrumented transports of `clients`.
+
+    Parameters
+    ----------
+    client : str
+        Client name.
+    method : str
+        HTTP method.
+    headers : Mapping[str, str]
+        Case-insensitive request headers.
+    """
+    def __init__(self, client: str, method: str, headers: Mapping[str, str]):
+        self.client = client
+        self.method = method
+        self.bucket = get_bucket(client, headers)
+        self.attempt = 0
+        self._sent = time.monotonic()
+
+    def acquire(self) -> None:
+        """Wait until next attempt may be sent."""
+        if not ENABLED:
+            return
+        waited = self.bucket.acquire()
+        self._sent = time.monotonic()
+        if waited:
+            metrics.RATE_LIMIT_WAIT_SECONDS.inc(waited, client=self.client)
+
+    def responded(self, status: int, headers: Mapping[str, str]) -> float | None:
+        """Learn from response, returns seconds to wait before retrying or None if response is final."""
+        if not ENABLED:
+            return None
+        learned = quota(headers)
+        if learned is not None:
+            self.bucket.learn(*learned)
+        wait = retry_after(headers) if status in RETRIABLE else None
+        if status == 429:
+            self.bucket.throttled(self._sent, wait)
+        elif learned is None and status < 400:
+            self.bucket.succeeded()
+        if status not in RETRIABLE:
+            return None
+        return self._retry(wait)
+
+    def failed(self, connected: bool) -> float | None:
+        """Request raised, returns seconds to wait before retrying or None if error is final.
+
+        Parameters
+        ----------
+        connected : bool
+            Whether connection was made, so the provider may have received the request.
+        """
+        if not ENABLED or (connected and self.method not in IDEMPOTENT):
+            return None
+        return self._retry(None)
+
+    def _retry(self, wait: float | None) -> float | None:
+        if self.attempt >= MAX_RETRIES or (wait or 0.0) > BACKOFF_CAP:
+            return None
+        delay = max(wait or 0.0, backoff(self.attempt))
+        self.attempt += 1
+        return delay
+
+
+def reset() -> None:
+    """Forget everything learned about quotas."""
+    with _lock:
+        _buckets.clear()
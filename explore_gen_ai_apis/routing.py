@@ -0,0 +1,251 @@
+"""Automatic choice of provider by recent latency, errors and cost.
+
+Pages offer ``auto`` next to named providers, ``Generator.execute`` hands it to the `Router` of its operation, which
+calls ``execute`` again with a named provider:
+
+* providers that failed several times in a row or too often lately are taken out for `COOLDOWN` seconds;
+* providers whose estimated cost is over budget are left out, unless failing over past the budget is asked for, then
+  they are tried after those within it;
+* the rest are tried fastest first. Speed is median latency of recent successful calls divided by share of recent calls
+  that succeeded. Providers without recent calls count as fastest, so each is tried again once its calls are older than
+  `WINDOW_SECONDS`;
+* on error the next provider is tried, so a degraded provider is failed over within the same request.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Any, Callable, Generator, Iterator, TypeVar
+
+T = TypeVar("T")
+
+AUTO = "auto"
+# Recent calls kept per provider, and max age of those that count, seconds
+WINDOW = 50
+WINDOW_SECONDS = 600.0
+# Failures in a row, or share of failures among at least `MIN_CALLS` recent ones, that take provider out
+FAILURES_TO_TRIP = 3
+MAX_ERROR_RATE = 0.5
+MIN_CALLS = 4
+# Seconds provider stays out after it was taken out
+COOLDOWN = 30.0
+
+
+class NoProviderError(RuntimeError):
+    """Every provider failed, or none is within budget."""
+
+
+@dataclass(frozen=True)
+class _Outcome:
+    at: float
+    seconds: float
+    ok: bool
+
+
+class Router:
+    """Routes calls of one operation among providers.
+
+    Parameters
+    ----------
+    operation : str
+        Operation name, for display.
+    costs : dict[str, float]
+        Provider -> estimated cost in USD per unit of work, e.g. per image or per 1000 characters.
+    """
+    def __init__(self, operation: str, costs: dict[str, float]):
+        self.operation = operation
+        self.costs = costs
+        self._lock = threading.Lock()
+        self._outcomes: dict[str, deque[_Outcome]] = defaultdict(lambda: deque(maxlen=WINDOW))
+        self._failures_in_row: dict[str, int] = defaultdict(int)
+        self._down_until: dict[str, float] = {}
+        self._local = threading.local()
+
+    def _recent(self, provider: str, now: float) -> list[_Outcome]:
+        return [outcome for outcome in self._outcomes[provider] if now - outcome.at <= WINDOW_SECONDS]
+
+    def _latency(self, provider: str, now: float) -> float | None:
+        seconds = sorted(outcome.seconds for outcome in self._recent(provider, now) if outcome.ok)
+        return seconds[len(seconds) // 2] if seconds else None
+
+    def _expected_seconds(self, provider: str, now: float) -> float:
+        """Median latency divided by success rate, i.e. counting time lost on failures, 0 if nothing is known."""
+        recent = self._recent(provider, now)
+        if not recent:
+            return 0.0
+        latency = self._latency(provider, now)
+        if latency is None:
+            return float("inf")
+        return latency / (sum(outcome.ok for outcome in recent) / len(recent))
+
+    def order(self, units: float = 1.0, budget: float | None = None, over_budget: bool = False) -> list[str]:
+        """Providers in order they would be tried.
+
+        Parameters
+        ----------
+        units : float
+            Amount of work, cost of provider is its unit cost times `units`.
+        budget : float, optional
+            Max cost in USD, providers over it are left out.
+        over_budget : bool
+            Try providers over `budget` after those within it instead of leaving them out.
+
+        Returns
+        -------
+        list[str]
+            Providers.
+
+        Raises
+        ------
+        NoProviderError
+            If no provider is within `budget` and `over_budget` is not set.
+        """
+        def over(provider: str) -> bool:
+            return budget is not None and self.costs[provider] * units > budget
+
+        providers = [provider for provider in self.costs if over_budget or not over(provider)]
+        if not providers:
+            raise NoProviderError(f"No {self.operation} provider costs at most ${budget} for {units:g} units")
+        now = time.monotonic()
+        with self._lock:
+            def rank(provider: str) -> tuple:
+                down = self._down_until.get(provider, 0.0) > now
+                return down, over(provider), self._expected_seconds(provider, now), self.costs[provider]
+
+            return sorted(providers, key=rank)
+
+    def record(self, provider: str, seconds: float, ok: bool) -> None:
+        """Record outcome of a call, taking provider out if it is failing."""
+        now = time.monotonic()
+        with self._lock:
+            self._outcomes[provider].append(_Outcome(now, seconds, ok))
+            if ok:
+                self._failures_in_row[provider] = 0
+                return
+            self._failures_in_row[provider] += 1
+            recent = self._recent(provider, now)
+            failed = sum(not outcome.ok for outcome in recent)
+            if (
+                self._failures_in_row[provider] >= FAILURES_TO_TRIP
+                or (len(recent) >= MIN_CALLS and failed / len(recent) >= MAX_ERROR_RATE)
+            ):
+                self._down_until[provider] = now + COOLDOWN
+
+    def call(
+            self,
+            execute: Callable[[str], T],
+            units: float = 1.0,
+            budget: float | None = None,
+            over_budget: bool = False
+    ) -> T:
+        """Call `execute` with providers in `order` until one succeeds.
+
+        Parameters
+        ----------
+        execute : Callable[[str], T]
+            Function of provider name.
+        units : float
+            Amount of work, see `order`.
+        budget : float, optional
+            Max cost in USD, see `order`.
+        over_budget : bool
+            Fail over to providers over `budget`, see `order`.
+
+        Returns
+        -------
+        T
+            Result of the first provider that succeeded.
+        """
+        errors = []
+        for provider in self.order(units, budget, over_budget):
+            start = time.perf_counter()
+            try:
+                result = execute(provider)
+            except Exception as error:
+                self.record(provider, time.perf_counter() - start, False)
+                errors.append(f"{provider}: {error}")
+                continue
+            self.record(provider, time.perf_counter() - start, True)
+            self._local.last = provider
+            return result
+        raise NoProviderError(f"All {self.operation} providers failed: " + "; ".join(errors))
+
+    def stream(
+            self,
+            start: Callable[[str], Iterator[T]],
+            units: float = 1.0,
+            budget: float | None = None,
+            over_budget: bool = False
+    ) -> Generator[T, None, Any]:
+        """Stream from providers in `order`, failing over to the next one until a first chunk arrives.
+
+        Once a provider has produced output, its errors are raised, as output can't be taken back.
+
+        Parameters
+        ----------
+        start : Callable[[str], Iterator[T]]
+            Function of provider name that starts streaming, generator may return a value, e.g. number of tokens.
+        units : float
+            Amount of work, see `order`.
+        budget : float, optional
+            Max cost in USD, see `order`.
+        over_budget : bool
+            Fail over to providers over `budget`, see `order`.
+
+        Yields
+        ------
+        T
+            Chunks of the first provider that started streaming.
+
+        Returns
+        -------
+        Any
+            Return value of its generator.
+        """
+        errors = []
+        for provider in self.order(units, budget, over_budget):
+            started = time.perf_counter()
+            chunks = iter(start(provider))
+            try:
+                first = next(chunks)
+            except StopIteration:
+                self.record(provider, time.perf_counter() - started, True)
+                self._local.last = provider
+                return
+            except Exception as error:
+                self.record(provider, time.perf_counter() - started, False)
+                errors.append(f"{provider}: {error}")
+                continue
+            self._local.last = provider
+            try:
+                yield first
+                result = yield from chunks
+            except Exception:
+                self.record(provider, time.perf_counter() - started, False)
+                raise
+            self.record(provider, time.perf_counter() - started, True)
+            return result
+        raise NoProviderError(f"All {self.operation} providers failed: " + "; ".join(errors))
+
+    def last(self) -> str | None:
+        """Provider that served the latest call made from the current thread."""
+        return getattr(self._local, "last", None)
+
+    def snapshot(self) -> list[dict]:
+        """State of every provider, in order they would be tried now."""
+        now = time.monotonic()
+        rows = []
+        for provider in self.order():
+            with self._lock:
+                recent = self._recent(provider, now)
+                down_for = self._down_until.get(provider, 0.0) - now
+                latency = self._latency(provider, now)
+            rows.append({
+                "provider": provider,
+                "recent calls": len(recent),
+                "p50 ms": None if latency is None else round(latency * 1000, 1),
+                "error %": round(100 * sum(not outcome.ok for outcome in recent) / len(recent), 1) if recent else None,
+                "cost $": self.costs[provider],
+                "status": f"out for {down_for:.0f}s" if down_for > 0 else "ok",
+            })
+        return rows
@@ -0,0 +1,93 @@
+"""Time-to-first-token and throughput of streamed LLM responses."""
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Generator, Iterator
+
+from explore_gen_ai_apis import metrics
+
+
+# Number of most recent streams kept per provider
+HISTORY = 100
+
+
+@dataclass(frozen=True)
+class StreamRecord:
+    """Timings of a single streamed response."""
+    ttft: float
+    seconds: float
+    tokens: int
+
+    @property
+    def tokens_per_second(self) -> float:
+        generation = self.seconds - self.ttft
+        return self.tokens / generation if generation > 0 else 0.0
+
+
+_lock = threading.Lock()
+_records: dict[str, deque[StreamRecord]] = defaultdict(lambda: deque(maxlen=HISTORY))
+
+
+def record_stream(
+        provider: str,
+        chunks: Generator[str, None, int | None],
+        operation: str = "stream"
+) -> Iterator[str]:
+    """Pass `chunks` through, recording time to first token and tokens per second for `provider`.
+
+    Stream is also recorded in `metrics` as a call of `operation`, time to first token being its time to first byte.
+
+    Parameters
+    ----------
+    provider : str
+        Provider name.
+    chunks : Generator[str, None, int | None]
+        Text chunks, generator may return number of output tokens reported by provider. Otherwise number of
+        chunks is used as number of tokens.
+    operation : str
+        Operation label in `metrics`.
+
+    Yields
+    ------
+    str
+        Text chunks.
+    """
+    start = time.perf_counter()
+    ttft = None
+    count = 0
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration as stop:
+            tokens = stop.value
+            break
+        except Exception:
+            metrics.observe_call(operation, provider, time.perf_counter() - start, "error", ttfb=ttft)
+            raise
+        if not chunk:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        count += 1
+        yield chunk
+
+    seconds = time.perf_counter() - start
+    record = StreamRecord(ttft=seconds if ttft is None else ttft, seconds=seconds, tokens=tokens or count)
+    with _lock:
+        _records[provider].append(record)
+    metrics.observe_call(operation, provider, seconds, "ok", ttfb=record.ttft)
+    metrics.record_tokens(provider, output_tokens=tokens)
+
+
+def last(provider: str) -> StreamRecord | None:
+    """Most recent record of `provider`, None if it has not streamed anything yet."""
+    with _lock:
+        records = _records.get(provider)
+        return records[-1] if records else None
+
+
+def records(provider: str) -> list[StreamRecord]:
+    """Recent records of `provider`, oldest first."""
+    with _lock:
+        return list(_records.get(provider, ()))
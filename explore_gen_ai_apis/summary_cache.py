@@ -0,0 +1,277 @@
+"""Near-duplicate cache of summaries.
+
+The same articles come back with small edits, e.g. changed whitespace, a tracking footer or a reworded sentence, and
+each would cost a full LLM call. So summaries are stored with a MinHash signature of their input and returned for any
+later input whose estimated Jaccard similarity to it is at least `threshold`:
+
+* input is lowercased and split into words, shingles are runs of `SHINGLE_WORDS` words hashed to 64 bits;
+* signature is the minimum over shingles of each of `PERMUTATIONS` multiply-shift hash functions, computed with NumPy
+  for all functions at once;
+* signatures are cut into `BANDS` bands and inputs sharing any band are candidates (LSH), share of equal signature
+  values of a candidate estimates its similarity.
+
+Entries are kept in SQLite, so they survive restarts, and in memory with their LSH buckets. Number of entries is
+capped, least recently used ones are evicted.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Iterable
+
+import numpy as np
+
+
+SHINGLE_WORDS = 3
+PERMUTATIONS = 128
+# With 4 rows per band, inputs of similarity 0.8 become candidates with probability 1 - (1 - 0.8^4)^32 > 0.99999
+BANDS = 32
+_ROWS = PERMUTATIONS // BANDS
+# Shingles hashed at once, bounds the temporary PERMUTATIONS x _BLOCK array
+_BLOCK = 4096
+# Hash functions must stay the same across restarts, or stored signatures become meaningless
+_RANDOM = np.random.default_rng(20250101)
+_MULTIPLIERS = _RANDOM.integers(0, 2 ** 64 - 1, PERMUTATIONS, dtype=np.uint64, endpoint=True) | np.uint64(1)
+_OFFSETS = _RANDOM.integers(0, 2 ** 64 - 1, PERMUTATIONS, dtype=np.uint64, endpoint=True)
+# Odd constants that make shingle hash depend on order of its words
+_POSITIONS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9][:SHINGLE_WORDS], dtype=np.uint64)
+_WORD = re.compile(r"\w+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    summary TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+
+def _word_hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+
+
+def signature(text: str) -> np.ndarray | None:
+    """MinHash signature of text.
+
+    Parameters
+    ----------
+    text : str
+        Input text.
+
+    Returns
+    -------
+    np.ndarray | None
+        `PERMUTATIONS` uint32 values, None if text has no words.
+    """
+    words = _WORD.findall(text.lower())
+    if not words:
+        return None
+    hashes = {word: _word_hash(word) for word in set(words)}
+    word_hashes = np.fromiter((hashes[word] for word in words), dtype=np.uint64, count=len(words))
+    count = max(len(words) - SHINGLE_WORDS + 1, 1)
+    shingles = np.zeros(count, dtype=np.uint64)
+    for position in range(min(SHINGLE_WORDS, len(words))):
+        shingles ^= word_hashes[position:position + count] * _POSITIONS[position]
+    shingles = np.unique(shingles)
+
+    values = np.full(PERMUTATIONS, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(shingles), _BLOCK):
+        block = shingles[start:start + _BLOCK]
+        # Multiply-shift hashing, products wrap around modulo 2^64 and the high 32 bits are kept
+        hashed = (_MULTIPLIERS[:, None] * block[None, :] + _OFFSETS[:, None]) >> np.uint64(32)
+        np.minimum(values, hashed.min(axis=1), out=values)
+    return values.astype(np.uint32)
+
+
+@dataclass(frozen=True)
+class _Entry:
+    namespace: str
+    signature: np.ndarray
+    summary: str
+
+    def band_keys(self) -> list[tuple[str, int, bytes]]:
+        return _band_keys(self.namespace, self.signature)
+
+
+def _band_keys(namespace: str, values: np.ndarray) -> list[tuple[str, int, bytes]]:
+    return [(namespace, band, values[band * _ROWS:(band + 1) * _ROWS].tobytes()) for band in range(BANDS)]
+
+
+class SummaryCache:
+    """Summaries of texts, found by similarity of input.
+
+    Parameters
+    ----------
+    path : str
+        SQLite database file, ``:memory:`` keeps it in memory only.
+    threshold : float
+        Min estimated Jaccard similarity of word shingles of an input to a stored one to return its summary.
+    max_entries : int
+        Max number of stored summaries, least recently used ones are evicted above it.
+    """
+    def __init__(self, path: str, threshold: float = 0.8, max_entries: int = 10_000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # id -> entry, most recently used last
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        # (namespace, band, band values) -> ids
+        self._buckets: dict[tuple[str, int, bytes], set[int]] = defaultdict(set)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._load()
+
+    def _load(self) -> None:
+        with self._connection:
+            # Signatures stored with other settings, and entries above a lowered cap
+            self._connection.execute("DELETE FROM summaries WHERE length(signature) != ?", (PERMUTATIONS * 4,))
+            self._connection.execute(
+                "DELETE FROM summaries WHERE id NOT IN (SELECT id FROM summaries ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+        rows = self._connection.execute("SELECT id, namespace, signature, summary FROM summaries ORDER BY last_used")
+        for entry_id, namespace, values, summary in rows:
+            self._add(entry_id, _Entry(namespace, np.frombuffer(values, dtype=np.uint32), summary))
+
+    def _add(self, entry_id: int, entry: _Entry) -> None:
+        self._entries[entry_id] = entry
+        for key in entry.band_keys():
+            self._buckets[key].add(entry_id)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        for key in entry.band_keys():
+            bucket = self._buckets[key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[key]
+        self._connection.execute("DELETE FROM summaries WHERE id = ?", (entry_id,))
+
+    def _similar(self, namespace: str, values: np.ndarray) -> list[tuple[int, float]]:
+        """Candidates from LSH buckets with their estimated similarity, most similar first."""
+        candidates = list(set().union(*(self._buckets.get(key, ()) for key in _band_keys(namespace, values))))
+        if not candidates:
+            return []
+        similarities = (np.stack([self._entries[entry_id].signature for entry_id in candidates]) == values).mean(axis=1)
+        order = np.argsort(-similarities)
+        return [(candidates[i], float(similarities[i])) for i in order]
+
+    def get(self, text: str, namespace: str | Iterable[str]) -> str | None:
+        """Summary of a stored text similar to `text`.
+
+        Parameters
+        ----------
+        text : str
+            Input text.
+        namespace : str | Iterable[str]
+            Where summary comes from, e.g. provider, only summaries stored with the same namespace are returned. Or
+            several namespaces, e.g. every provider, the most similar summary of any of them is returned.
+
+        Returns
+        -------
+        str | None
+            Summary of the most similar stored text, None if none is at least `threshold` similar.
+        """
+        self._local.similarity = None
+        values = signature(text)
+        namespaces = (namespace,) if isinstance(namespace, str) else tuple(namespace)
+        with self._lock:
+            similar = sorted(
+                (candidate for name in namespaces for candidate in self._similar(name, values)),
+                key=lambda candidate: -candidate[1]
+            ) if values is not None else []
+            if not similar or similar[0][1] < self.threshold:
+                self.misses += 1
+                return None
+            entry_id, similarity = similar[0]
+            self._entries.move_to_end(entry_id)
+            with self._connection:
+                self._connection.execute("UPDATE summaries SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+            self.hits += 1
+            self._local.similarity = similarity
+            return self._entries[entry_id].summary
+
+    def put(self, text: str, namespace: str, summary: str) -> None:
+        """Store summary of text, replacing summary of the same text, and evict least recently used entries.
+
+        Parameters
+        ----------
+        text : str
+            Input text.
+        namespace : str
+            Where summary comes from, see `get`.
+        summary : str
+            Summary.
+        """
+        values = signature(text)
+        if values is None or not summary:
+            return
+        with self._lock, self._connection:
+            for entry_id, similarity in self._similar(namespace, values):
+                if similarity < 1.0:
+                    break
+                self._remove(entry_id)
+            entry_id = self._connection.execute(
+                "INSERT INTO summaries (namespace, signature, summary, last_used) VALUES (?, ?, ?, ?)",
+                (namespace, values.tobytes(), summary, time.time())
+            ).lastrowid
+            self._add(entry_id, _Entry(namespace, values, summary))
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def last(self) -> float | None:
+        """Similarity of the input found by the latest `get` of the current thread, None if it was a miss."""
+        return getattr(self._local, "similarity", None)
+
+    def stats(self) -> dict[str, int]:
+        """Counters to tune the cache with.
+
+        Returns
+        -------
+        dict[str, int]
+            hits, misses, evictions and number of entries.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+_default: SummaryCache | None = None
+_default_lock = threading.Lock()
+
+
+def get_default() -> SummaryCache:
+    """Process-wide cache configured by `SUMMARY_CACHE_PATH`, `SUMMARY_CACHE_THRESHOLD` and
+    `SUMMARY_CACHE_MAX_ENTRIES` environment variables."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = SummaryCache(
+                os.environ.get("SUMMARY_CACHE_PATH", "./.cache/summaries.sqlite3"),
+                float(os.environ.get("SUMMARY_CACHE_THRESHOLD", 0.8)),
+                int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", 10_000)),
+            )
+        return _default
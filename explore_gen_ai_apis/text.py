@@ -0,0 +1,68 @@
+"""Splitting of text into sentences and provider-sized pieces."""
+import re
+
+
+# Separators between sentences: whitespace after sentence end, or any line break
+SENTENCE_SEPARATOR = re.compile(r'((?<=[.!?…。！？])\s+|\s*\n\s*)')
+
+
+def segment(text: str) -> list[str]:
+    """Split text into sentences.
+
+    Parameters
+    ----------
+    text : str
+        Input text.
+
+    Returns
+    -------
+    list[str]
+        Sentences at even positions and separators between them at odd positions, joined they give back `text`.
+    """
+    return SENTENCE_SEPARATOR.split(text)
+
+
+def pack(text: str, max_chars: int) -> list[str]:
+    """Split text into pieces of at most `max_chars` characters at sentence boundaries.
+
+    Paragraph breaks are preferred, piece is closed at a paragraph break once it is at least half full. Sentence
+    longer than `max_chars` is split at whitespace, or hard split if it has none.
+
+    Parameters
+    ----------
+    text : str
+        Input text.
+    max_chars : int
+        Max length of a piece.
+
+    Returns
+    -------
+    list[str]
+        Pieces, stripped of surrounding whitespace.
+    """
+    pieces: list[str] = []
+    current = ""
+    parts = segment(text)
+    for i in range(0, len(parts), 2):
+        sentence = parts[i].strip()
+        separator = parts[i + 1] if i + 1 < len(parts) else ""
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars + 1)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+        if "\n\n" in separator and len(current) >= max_chars // 2:
+            pieces.append(current)
+            current = ""
+    if current:
+        pieces.append(current)
+    return pieces
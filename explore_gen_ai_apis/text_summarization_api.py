@@ -0,0 +1,407 @@
+"""Text summarization providers used without LangChain.
+
+Summaries are kept in a `summary_cache.SummaryCache`, texts nearly the same as an earlier one get its summary without
+calling provider.
+"""
+import time
+from typing import Callable, Generator as Stream, Iterable, Iterator
+
+from explore_gen_ai_apis import clients, hedging, metrics, routing, streaming, summary_cache, workers
+
+
+SYSTEM_PROMPT = "Imagine you are extremely proficient in summarization, summarize incoming text"
+# Provider asked when the selected one is slow to start answering in hedged mode
+HEDGE_BACKUPS = {"OpenAI": "Anthropic", "Anthropic": "OpenAI", "TogetherAI": "OpenAI"}
+# Rough USD per 1000 characters of input from list prices, assuming a summary of about 300 tokens
+COSTS = {"OpenAI": 0.0036, "Anthropic": 0.0053, "TogetherAI": 0.00003}
+ROUTER = routing.Router("text_summarization", COSTS)
+
+
+class Generator:
+    """Class that contains all generate methods.
+
+    Parameters
+    ----------
+    cache : summary_cache.SummaryCache, optional
+        Cache of summaries, process-wide cache by default.
+    """
+    def __init__(self, cache: summary_cache.SummaryCache | None = None):
+        self.cache = cache or summary_cache.get_default()
+
+    @staticmethod
+    def generate_openai(prompt: str) -> str:
+        """Generate summarization using OpenAI API and GPT-4o.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt.
+
+        Returns
+        -------
+        str
+            Summarized text.
+        """
+        completion = clients.get_openai().chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "developer", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f'Summarize this: "{prompt}"'}
+            ]
+        )
+        if completion.usage:
+            metrics.record_tokens("OpenAI", completion.usage.prompt_tokens, completion.usage.completion_tokens)
+
+        return completion.choices[0].message.content
+
+    @staticmethod
+    def generate_anhtropic(prompt: str) -> str:
+        """Generate summarization using Anthropic API and Claude-3.5-sonnet.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt.
+
+        Returns
+        -------
+        str
+            Summarized text.
+        """
+        message = clients.get_anthropic().messages.create(
+            model="claude-3-5-sonnet-20241022",
+            temperature=0,
+            max_tokens=1000,
+            system=SYSTEM_PROMPT,
+            messages=[
+                {"role": "user", "content": f'Summarize this: "{prompt}"'}
+            ]
+        )
+        metrics.record_tokens("Anthropic", message.usage.input_tokens, message.usage.output_tokens)
+
+        return message.content[0].text
+
+    @staticmethod
+    def generate_together(prompt: str) -> str:
+        """Generate summarization using TogetherAI and LLama 3.2 3B Instruct Turbo.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt.
+
+        Returns
+        -------
+        str
+            Summarized text.
+        """
+        response = clients.get_together().chat.completions.create(
+            model="meta-llama/Llama-3.2-3B-Instruct-Turbo",
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f'Summarize this: "{prompt}"'}
+            ],
+        )
+        if response.usage:
+            metrics.record_tokens("TogetherAI", response.usage.prompt_tokens, response.usage.completion_tokens)
+
+        return response.choices[0].message.content
+
+    @staticmethod
+    def stream_openai(prompt: str) -> Stream[str, None, int | None]:
+        """Stream summarization using OpenAI API and GPT-4o.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt.
+
+        Yields
+        ------
+        str
+            Chunks of summarized text.
+
+        Returns
+        -------
+        int | None
+            Number of output tokens.
+        """
+        stream = clients.get_openai().chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "developer", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f'Summarize this: "{prompt}"'}
+            ],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        tokens = None
+        for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                tokens = chunk.usage.completion_tokens
+        return tokens
+
+    @staticmethod
+    def stream_anthropic(prompt: str) -> Stream[str, None, int | None]:
+        """Stream summarization using Anthropic API and Claude-3.5-sonnet.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt.
+
+        Yields
+        ------
+        str
+            Chunks of summarized text.
+
+        Returns
+        -------
+        int | None
+            Number of output tokens.
+        """
+        with clients.get_anthropic().messages.stream(
+            model="claude-3-5-sonnet-20241022",
+            temperature=0,
+            max_tokens=1000,
+            system=SYSTEM_PROMPT,
+            messages=[
+                {"role": "user", "content": f'Summarize this: "{prompt}"'}
+            ]
+        ) as stream:
+            yield from stream.text_stream
+            return stream.get_final_message().usage.output_tokens
+
+    @staticmethod
+    def stream_together(prompt: str) -> Stream[str, None, int | None]:
+        """Stream summarization using TogetherAI and LLama 3.2 3B Instruct Turbo.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt.
+
+        Yields
+        ------
+        str
+            Chunks of summarized text.
+
+        Returns
+        -------
+        int | None
+            Number of output tokens.
+        """
+        stream = clients.get_together().chat.completions.create(
+            model="meta-llama/Llama-3.2-3B-Instruct-Turbo",
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f'Summarize this: "{prompt}"'}
+            ],
+            stream=True,
+        )
+
+        tokens = None
+        for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                tokens = chunk.usage.completion_tokens
+        return tokens
+
+    def stream_hedged(
+            self,
+            prompt: str,
+            provider,
+            backup=None,
+            decided: Callable[[hedging.HedgeRecord], None] | None = None
+    ) -> Stream[str, None, int | None]:
+        """Stream summarization of `provider`, asking `backup` too if first token is late, see `hedging`.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt.
+        provider
+            LLM provider, ``auto`` streams from the first provider in order of `ROUTER` backed up by the second.
+        backup
+            LLM provider asked when `provider` is slow, `HEDGE_BACKUPS` by default.
+        decided : Callable[[hedging.HedgeRecord], None], optional
+            Called with outcome of the call once it is known which provider answers.
+
+        Yields
+        ------
+        str
+            Chunks of summarized text of whichever provider answered first.
+
+        Returns
+        -------
+        int | None
+            Number of output tokens.
+
+        Raises
+        ------
+        ValueError
+            If no backup is given and `provider` has none in `HEDGE_BACKUPS`.
+        """
+        if provider == routing.AUTO:
+            provider, routed_backup = ROUTER.order()[:2]
+            backup = backup or routed_backup
+        backup = backup or HEDGE_BACKUPS.get(provider)
+        if backup is None:
+            raise ValueError(f"No backup provider to hedge {provider!r} with, expected {', '.join(HEDGE_BACKUPS)}")
+        return hedging.hedged(
+            "text_summarization",
+            provider,
+            lambda: self._streamer(provider)(prompt),
+            backup,
+            lambda: self._streamer(backup)(prompt),
+            decided=decided,
+        )
+
+    def _cached(self, prompt: str, provider) -> str | None:
+        """Summary of a nearly identical earlier text, of any provider for ``auto``, recorded as a cache hit."""
+        start = time.perf_counter()
+        summary = self.cache.get(prompt, COSTS if provider == routing.AUTO else provider)
+        if summary is not None:
+            metrics.observe_call("text_summarization", provider, time.perf_counter() - start, "cache_hit")
+        return summary
+
+    @metrics.instrumented("text_summarization")
+    def _generate(self, prompt: str, provider) -> str:
+        """Summary from `provider` itself, stored in `cache`."""
+        generate: Callable[[str], str] = None
+        match provider:
+            case "OpenAI":
+                generate = self.generate_openai
+            case "Anthropic":
+                generate = self.generate_anhtropic
+            case "TogetherAI":
+                generate = self.generate_together
+
+        with workers.slot(provider):
+            summary = generate(prompt)
+        self.cache.put(prompt, provider, summary)
+        return summary
+
+    def execute(
+            self,
+            prompt: str,
+            provider,
+            hedge: bool = False,
+            budget: float | None = None,
+            over_budget: bool = False
+    ) -> bytes:
+        """Generate summarization, summary of a nearly identical earlier text is returned without calling provider.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt
+        provider
+            LLM provider, ``auto`` picks one with `ROUTER`
+        hedge : bool
+            Stream from `provider` and a backup provider if first token is late, see `stream_hedged`.
+        budget : float, optional
+            Max estimated cost in USD of the call for ``auto`` provider.
+        over_budget : bool
+            Fail over to providers over `budget` if those within it fail, instead of leaving them out.
+
+        Returns
+        -------
+        bytes
+            Output Image
+        """
+        summary = self._cached(prompt, provider)
+        if summary is not None:
+            return summary
+        if hedge:
+            records: list[hedging.HedgeRecord] = []
+            summary = "".join(self.stream_hedged(prompt, provider, decided=records.append))
+            # Backup may have answered
+            self.cache.put(prompt, records[0].winner, summary)
+            return summary
+        if provider == routing.AUTO:
+            # Only calls that reach a provider are timed by the router, summary is cached under the one it chose
+            units = len(prompt) / 1000
+            return ROUTER.call(lambda choice: self._generate(prompt, choice), units, budget, over_budget)
+        return self._generate(prompt, provider)
+
+    def _streamer(self, provider) -> Callable[[str], Stream[str, None, int | None]]:
+        stream: Callable[[str], Stream[str, None, int | None]] = None
+        match provider:
+            case "OpenAI":
+                stream = self.stream_openai
+            case "Anthropic":
+                stream = self.stream_anthropic
+            case "TogetherAI":
+                stream = self.stream_together
+        # Slot is held until the stream is done, not only while it is started
+        return lambda prompt: workers.held(provider, stream(prompt))
+
+    def _stored(self, chunks: Iterable[str], prompt: str, provider: Callable[[], str]) -> Stream[str, None, int | None]:
+        """Pass `chunks` through, storing whole summary in `cache` under `provider()` once stream is complete."""
+        parts = []
+        chunks = iter(chunks)
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as stop:
+                self.cache.put(prompt, provider(), "".join(parts))
+                return stop.value
+            if chunk:
+                parts.append(chunk)
+            yield chunk
+
+    def execute_stream(
+            self,
+            prompt: str,
+            provider,
+            hedge: bool = False,
+            budget: float | None = None,
+            over_budget: bool = False
+    ) -> Iterator[str]:
+        """Stream summarization, time to first token and tokens per second are recorded in `streaming`.
+
+        Summary of a nearly identical earlier text is returned as a single chunk without calling provider and without
+        recording, `cache.last` tells whether it was.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt
+        provider
+            LLM provider, ``auto`` picks one with `ROUTER`
+        hedge : bool
+            Stream from `provider` and a backup provider if first token is late, see `stream_hedged`.
+        budget : float, optional
+            Max estimated cost in USD of the call for ``auto`` provider.
+        over_budget : bool
+            Fail over to providers over `budget` if those within it fail, instead of leaving them out.
+
+        Returns
+        -------
+        Iterator[str]
+            Chunks of summarized text.
+        """
+        summary = self._cached(prompt, provider)
+        if summary is not None:
+            return iter([summary])
+        if hedge:
+            records: list[hedging.HedgeRecord] = []
+            chunks = self.stream_hedged(prompt, provider, decided=records.append)
+            # Summary is cached under the provider that answered, backup may have
+            return streaming.record_stream(
+                provider, self._stored(chunks, prompt, lambda: records[0].winner), "text_summarization_hedged_stream"
+            )
+        if provider == routing.AUTO:
+            units = len(prompt) / 1000
+            chunks = ROUTER.stream(lambda choice: self._streamer(choice)(prompt), units, budget, over_budget)
+            # Summary is cached under the provider it was routed to, like in `execute`
+            answered = ROUTER.last
+        else:
+            chunks = self._streamer(provider)(prompt)
+            answered = lambda: provider  # noqa: E731
+        return streaming.record_stream(provider, self._stored(chunks, prompt, answered), "text_summarization_stream")
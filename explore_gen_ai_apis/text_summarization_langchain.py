@@ -0,0 +1,276 @@
+"""Text summarization using LangChain.
+
+LangChain takes about a second to import, so it is imported on first summarization rather than with the page. Chat
+models and chains are built once per process and shared by all sessions, Streamlit reruns only look them up.
+Summaries of single prompts are kept in the process-wide `summary_cache`, shared with summarization without LangChain.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Iterator, TextIO
+
+import tiktoken
+
+from explore_gen_ai_apis import clients, metrics, summary_cache
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.runnables import Runnable
+
+
+# Tokenizer used to size chunks, exact count differs per model, but it is close enough for all of them
+ENCODING = "cl100k_base"
+# Max number of characters read from a stream at once, so a file without line breaks is not read whole
+READ_SIZE = 16 * 1024
+# Provider -> (chat model, environment variables its client is built from)
+CHAT_MODELS = {
+    "OpenAI": ("gpt-4o", ("OPENAI_API_KEY", "OPENAI_BASE_URL")),
+    "Vertex": ("gemini-1.5-flash-001", ("GOOGLE_APPLICATION_CREDENTIALS",)),
+    "Anthropic": ("claude-3-5-haiku-20241022", ("ANTHROPIC_API_KEY", "ANTHROPIC_BASE_URL")),
+}
+# Max number of cached chains, models passed in by callers may come and go
+MAX_CHAINS = 32
+
+_chains_lock = threading.Lock()
+# (id of model, instruction, parse) -> (model, chain), model is kept so its id is not reused while the entry exists
+_chains: OrderedDict[tuple[int, str, bool], tuple["BaseChatModel", "Runnable"]] = OrderedDict()
+
+
+def _new_chat_model(provider: str) -> "BaseChatModel":
+    model, __ = CHAT_MODELS[provider]
+    llm = None
+    match provider:
+        case "OpenAI":
+            from langchain_openai import ChatOpenAI
+            llm = ChatOpenAI(model=model, temperature=0, api_key=os.environ['OPENAI_API_KEY'])
+        case "Vertex":
+            from langchain_google_vertexai import ChatVertexAI
+            llm = ChatVertexAI(model=model)
+        case "Anthropic":
+            from langchain_anthropic import ChatAnthropic
+            llm = ChatAnthropic(model=model)
+    return llm
+
+
+def get_chat_model(provider: str) -> "BaseChatModel":
+    """Shared chat model of provider, rebuilt when its model in `CHAT_MODELS` or credentials change.
+
+    Parameters
+    ----------
+    provider : str
+        One of `CHAT_MODELS`.
+
+    Returns
+    -------
+    langchain_core.language_models.BaseChatModel
+        Chat model.
+    """
+    model, env = CHAT_MODELS[provider]
+    return clients.get_or_create(f"langchain:{provider}:{model}", lambda: _new_chat_model(provider), env)
+
+
+def _chain(
+        model: "BaseChatModel", instruction: str = 'Summarize this:\n{input_text}', parse: bool = True
+) -> "Runnable":
+    key = (id(model), instruction, parse)
+    with _chains_lock:
+        entry = _chains.get(key)
+        if entry is not None:
+            _chains.move_to_end(key)
+            return entry[1]
+    chain = _new_chain(model, instruction, parse)
+    with _chains_lock:
+        _chains[key] = (model, chain)
+        while len(_chains) > MAX_CHAINS:
+            _chains.popitem(last=False)
+    return chain
+
+
+def _new_chain(model: "BaseChatModel", instruction: str, parse: bool = True) -> "Runnable":
+    """Chain of prompt and model, it returns text if `parse`, otherwise model's message with its token usage."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+
+    prompt_template = ChatPromptTemplate.from_messages([
+        (
+            'system',
+            'Imagine you are extremely proficient in summarization, summarize incoming text'
+        ),
+        (
+            'human',
+            instruction
+        )
+    ])
+    chain = prompt_template | model
+    return chain | StrOutputParser() if parse else chain
+
+
+def _cache_namespace(model: "BaseChatModel") -> str:
+    name = getattr(model, "model_name", None) or getattr(model, "model", "")
+    return f"langchain:{type(model).__name__}:{name}"
+
+
+def cached_response(input_text: str, model: "BaseChatModel") -> str | None:
+    """Summary of a nearly identical earlier text by the same model, see `summary_cache`.
+
+    Parameters
+    ----------
+    input_text : str
+        Input text
+    model : langchain_core.language_models.BaseChatModel
+        LangChain ChatModel to use for summarization.
+
+    Returns
+    -------
+    str | None
+        Cached summary, None if there is none.
+    """
+    return summary_cache.get_default().get(input_text, _cache_namespace(model))
+
+
+@metrics.instrumented("text_summarization_langchain", lambda arguments: type(arguments["model"]).__name__)
+def generate_response(input_text: str, model: "BaseChatModel") -> str:
+    """Generate LLM summarization response, summary of a nearly identical earlier text is returned without calling
+    `model`.
+
+    Parameters
+    ----------
+    input_text : str
+        Input text
+    model : langchain_core.language_models.BaseChatModel
+        LangChain ChatModel to use for summarization.
+
+    Returns
+    -------
+    str
+        Summarized text.
+    """
+    response = cached_response(input_text, model)
+    if response is not None:
+        return response
+
+    from langchain_core.output_parsers import StrOutputParser
+
+    message = _chain(model, parse=False).invoke({'input_text': input_text})
+    usage = message.usage_metadata or {}
+    metrics.record_tokens(type(model).__name__, usage.get('input_tokens'), usage.get('output_tokens'))
+    response = StrOutputParser().invoke(message)
+    summary_cache.get_default().put(input_text, _cache_namespace(model), response)
+    return response
+
+
+def stream_response(input_text: str, model: "BaseChatModel") -> Iterator[str]:
+    """Stream LLM summarization response, whole response is stored in `summary_cache` once stream is complete.
+
+    Cache isn't looked up, so that caller can tell cached summaries from streamed ones, see `cached_response`.
+
+    Parameters
+    ----------
+    input_text : str
+        Input text
+    model : langchain_core.language_models.BaseChatModel
+        LangChain ChatModel to use for summarization.
+
+    Yields
+    ------
+    str
+        Chunks of summarized text.
+    """
+    parts = []
+    for chunk in _chain(model).stream({'input_text': input_text}):
+        parts.append(chunk)
+        yield chunk
+    summary_cache.get_default().put(input_text, _cache_namespace(model), ''.join(parts))
+
+
+def iter_chunks(stream: TextIO, chunk_tokens: int) -> Iterator[str]:
+    """Split text into chunks of at most `chunk_tokens` tokens, preferably on line breaks.
+
+    Text is read and tokenized piece by piece, only tokens of the current piece are kept in memory.
+
+    Parameters
+    ----------
+    stream : TextIO
+        Input text.
+    chunk_tokens : int
+        Max number of tokens in a chunk.
+
+    Yields
+    ------
+    str
+        Chunks of text.
+    """
+    encoding = tiktoken.get_encoding(ENCODING)
+    buffer: list[str] = []
+    size = 0
+    for piece in iter(lambda: stream.readline(READ_SIZE), ''):
+        tokens = encoding.encode(piece, disallowed_special=())
+        if size + len(tokens) > chunk_tokens and buffer:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+        if len(tokens) > chunk_tokens:
+            for start in range(0, len(tokens), chunk_tokens):
+                yield encoding.decode(tokens[start:start + chunk_tokens])
+            continue
+        buffer.append(piece)
+        size += len(tokens)
+    if buffer:
+        yield ''.join(buffer)
+
+
+def summarize_long(
+        stream: TextIO,
+        model: "BaseChatModel",
+        chunk_tokens: int = 3000,
+        max_concurrency: int = 4
+) -> str:
+    """Map-reduce summarization of text that does not fit into a single prompt.
+
+    Chunks are summarized in parallel, then summaries are combined, again chunk by chunk if they are still too long,
+    until a single summary remains. Summaries that don't get shorter than their inputs are cut, so no prompt is longer
+    than `chunk_tokens`.
+
+    Parameters
+    ----------
+    stream : TextIO
+        Input text.
+    model : langchain_core.language_models.BaseChatModel
+        LangChain ChatModel to use for summarization.
+    chunk_tokens : int
+        Max number of tokens sent in a single prompt.
+    max_concurrency : int
+        Max number of parallel requests to `model`.
+
+    Returns
+    -------
+    str
+        Summarized text.
+    """
+    config = {'max_concurrency': max_concurrency}
+    summaries = _chain(model).batch(
+        [{'input_text': chunk} for chunk in iter_chunks(stream, chunk_tokens)],
+        config=config
+    )
+    if not summaries:
+        return ''
+
+    encoding = tiktoken.get_encoding(ENCODING)
+
+    def truncated(text: str, tokens: int) -> str:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+
+    reduce_chain = _chain(model, 'Combine these summaries of parts of a single text into one summary:\n{input_text}')
+    while True:
+        chunks = list(iter_chunks(io.StringIO('\n\n'.join(summaries)), chunk_tokens))
+        if 1 < len(chunks) >= len(summaries):
+            # Summaries are no shorter than their inputs, so grouping them the same way won't shrink them. Instead
+            # pairs are combined, each summary cut to half of the budget, so every round halves their number
+            share = chunk_tokens // min(len(summaries), 2)
+            pairs = [summaries[start:start + 2] for start in range(0, len(summaries), 2)]
+            chunks = [
+                truncated('\n\n'.join(truncated(summary, share) for summary in pair), chunk_tokens) for pair in pairs
+            ]
+        if len(chunks) == 1:
+            return reduce_chain.invoke({'input_text': chunks[0]})
+        summaries = reduce_chain.batch([{'input_text': chunk} for chunk in chunks], config=config)
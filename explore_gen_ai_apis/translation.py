@@ -0,0 +1,250 @@
+"""Translation providers."""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from explore_gen_ai_apis import clients, metrics, routing, translation_memory, workers
+from explore_gen_ai_apis.text import segment
+
+
+# deepl limits a single request to 50 texts and 128 KiB body
+DEEPL_BATCH_TEXTS = 50
+DEEPL_BATCH_BYTES = 100 * 1024
+DEEPL_CONCURRENCY = 4
+# rapidapi takes a single text per request, so requests are only limited by connection pool
+RAPIDAPI_CONCURRENCY = clients.POOL_MAXSIZE
+
+
+def _rapidapi_url() -> str:
+    return os.environ.get("RAPIDAPI_BASE_URL", "https://nlp-translation.p.rapidapi.com")
+
+
+class Generator:
+    """Class that contains all generate methods.
+
+    Parameters
+    ----------
+    memory : translation_memory.TranslationMemory, optional
+        Memory of translated segments, process-wide memory by default.
+    """
+    # Provider -> (source language, target language), deepl detects source language itself
+    LANGUAGES = {
+        "rapidapi": ("en", "es"),
+        "deepl": ("auto", "es"),
+    }
+    # Rough USD per 1000 characters from list prices
+    COSTS = {"rapidapi": 0.01, "deepl": 0.025}
+    ROUTER = routing.Router("translation", COSTS)
+
+    def __init__(self, memory: translation_memory.TranslationMemory | None = None):
+        self.memory = memory if memory is not None else translation_memory.get_default()
+
+    @staticmethod
+    def generate_rapidapi(prompt: str) -> str:
+        """Generate Spanish translation using rapidai.
+
+        Parameters
+        ----------
+        prompt : str
+            Input text.
+
+        Returns
+        -------
+        str
+            Spanish translation.
+        """
+        url = f"{_rapidapi_url()}/v1/translate"
+
+        payload = {
+            "text": prompt,
+            "to": "es",
+            "from": "en"
+        }
+
+        headers = {
+            "x-rapidapi-key": os.environ['RAPIDAPI_API_KEY'],
+            "x-rapidapi-host": "nlp-translation.p.rapidapi.com",
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+
+        response = clients.get_session("rapidapi").post(url, data=payload, headers=headers)
+
+        return response.json()['translated_text']['es']
+
+    @staticmethod
+    def generate_deepl(prompt: str) -> str:
+        """Generate Spanish translation using deepl.
+
+        Parameters
+        ----------
+        prompt : str
+            Input text.
+
+        Returns
+        -------
+        str
+            Spanish translation.
+        """
+        return clients.get_deepl().translate_text(prompt, target_lang="ES").text
+
+    @staticmethod
+    def generate_rapidapi_batch(prompts: list[str]) -> list[str]:
+        """Generate Spanish translations using rapidai, it takes single text per request, so requests go in parallel.
+
+        Parameters
+        ----------
+        prompts : list[str]
+            Input texts.
+
+        Returns
+        -------
+        list[str]
+            Spanish translations, in order of `prompts`.
+        """
+        with ThreadPoolExecutor(max_workers=RAPIDAPI_CONCURRENCY) as pool:
+            return list(pool.map(Generator.generate_rapidapi, prompts))
+
+    @staticmethod
+    def generate_deepl_batch(prompts: list[str]) -> list[str]:
+        """Generate Spanish translations using deepl, packing as many texts into a request as it allows.
+
+        Parameters
+        ----------
+        prompts : list[str]
+            Input texts.
+
+        Returns
+        -------
+        list[str]
+            Spanish translations, in order of `prompts`.
+        """
+        batches: list[list[str]] = []
+        size = 0
+        for prompt in prompts:
+            prompt_size = len(prompt.encode())
+            if not batches or len(batches[-1]) == DEEPL_BATCH_TEXTS or size + prompt_size > DEEPL_BATCH_BYTES:
+                batches.append([])
+                size = 0
+            batches[-1].append(prompt)
+            size += prompt_size
+
+        translator = clients.get_deepl()
+        with ThreadPoolExecutor(max_workers=DEEPL_CONCURRENCY) as pool:
+            results = pool.map(lambda batch: translator.translate_text(batch, target_lang="ES"), batches)
+            return [result.text for batch in results for result in batch]
+
+    def execute(self, prompt: str, provider, budget: float | None = None, over_budget: bool = False) -> str:
+        """Generate translation, text found in translation memory is not sent to provider.
+
+        Unlike `execute_batch`, text is looked up and sent as a whole, so provider translates every sentence in the
+        context of the others.
+
+        Parameters
+        ----------
+        prompt : str
+            Input text.
+        provider
+            Translation provider, ``auto`` picks one with `ROUTER`
+        budget : float, optional
+            Max estimated cost in USD of the call for ``auto`` provider.
+        over_budget : bool
+            Fail over to providers over `budget` if those within it fail, instead of leaving them out.
+
+        Returns
+        -------
+        str
+            Spanish translation.
+        """
+        if not prompt.strip():
+            return prompt
+        return self._translate([prompt], provider, budget, over_budget)[prompt]
+
+    def execute_batch(
+            self,
+            prompts: list[str],
+            provider,
+            budget: float | None = None,
+            over_budget: bool = False
+    ) -> list[str]:
+        """Translate many texts at once.
+
+        Texts are split into sentences, sentences are looked up in translation memory and each distinct missing
+        sentence is translated only once, with as few requests as provider allows. Translations are joined back with
+        the original separators.
+
+        Parameters
+        ----------
+        prompts : list[str]
+            Input texts.
+        provider
+            Translation provider, ``auto`` picks one with `ROUTER`
+        budget : float, optional
+            Max estimated cost in USD of the call for ``auto`` provider.
+        over_budget : bool
+            Fail over to providers over `budget` if those within it fail, instead of leaving them out.
+
+        Returns
+        -------
+        list[str]
+            Spanish translations, in order of `prompts`.
+        """
+        documents = [segment(prompt) for prompt in prompts]
+        unique = list(dict.fromkeys(
+            part for parts in documents for part in parts[::2] if part.strip()
+        ))
+        translations = self._translate(unique, provider, budget, over_budget)
+
+        return [
+            "".join(translations.get(part, part) if i % 2 == 0 else part for i, part in enumerate(parts))
+            for parts in documents
+        ]
+
+    def _translate(
+            self,
+            texts: list[str],
+            provider,
+            budget: float | None = None,
+            over_budget: bool = False
+    ) -> dict[str, str]:
+        """Translations of distinct texts, only ones missing in `memory` are sent to provider.
+
+        Memory of every provider is looked up for ``auto``, `ROUTER` only picks a provider for the missing texts. If
+        none are missing, the call is recorded as a cache hit.
+        """
+        start = time.perf_counter()
+        translations: dict[str, str] = {}
+        for choice in self.COSTS if provider == routing.AUTO else [provider]:
+            source_lang, target_lang = self.LANGUAGES[choice]
+            missing = [text for text in texts if text not in translations]
+            if missing:
+                translations.update(self.memory.lookup(missing, source_lang, target_lang, choice))
+        missing = [text for text in texts if text not in translations]
+        if not missing:
+            if texts:
+                metrics.observe_call("translation", provider, time.perf_counter() - start, "cache_hit")
+        elif provider == routing.AUTO:
+            # Only calls that reach a provider are timed by the router
+            units = sum(map(len, missing)) / 1000
+            translations.update(
+                self.ROUTER.call(lambda choice: self._generate(missing, choice), units, budget, over_budget)
+            )
+        else:
+            translations.update(self._generate(missing, provider))
+        return translations
+
+    @metrics.instrumented("translation")
+    def _generate(self, texts: list[str], provider) -> dict[str, str]:
+        """Translations from `provider` itself, stored in `memory`."""
+        generate: Callable[[list[str]], list[str]] = None
+        match provider:
+            case "rapidapi":
+                generate = self.generate_rapidapi_batch
+            case "deepl":
+                generate = self.generate_deepl_batch
+
+        source_lang, target_lang = self.LANGUAGES[provider]
+        with workers.slot(provider):
+            translated = dict(zip(texts, generate(texts)))
+        self.memory.store(translated, source_lang, target_lang, provider)
+        return translated
@@ -0,0 +1,201 @@
+"""Persistent segment-level translation memory backed by SQLite.
+
+Translations are stored per source segment, language pair and provider, so repeated sentences (product names,
+boilerplate, legal footers) are translated upstream only once. Number of entries is capped, least recently used
+entries are evicted.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import IO, Iterable, Iterator
+
+
+# SQLite limits number of host parameters in one statement
+_QUERY_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    provider TEXT NOT NULL,
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    source TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (provider, source_lang, target_lang, source)
+);
+CREATE INDEX IF NOT EXISTS segments_last_used ON segments (last_used);
+"""
+
+
+class TranslationMemory:
+    """Translation memory.
+
+    Parameters
+    ----------
+    path : str
+        SQLite database file, ``:memory:`` keeps it in memory only.
+    max_entries : int
+        Max number of stored segments, above it least recently used ones are evicted down to 90% of `max_entries`.
+    """
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._count = self._connection.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    def lookup(self, segments: Iterable[str], source_lang: str, target_lang: str, provider: str) -> dict[str, str]:
+        """Find stored translations.
+
+        Parameters
+        ----------
+        segments : Iterable[str]
+            Source segments.
+        source_lang : str
+            Source language.
+        target_lang : str
+            Target language.
+        provider : str
+            Translation provider.
+
+        Returns
+        -------
+        dict[str, str]
+            Source segment to translation, only for segments that are stored.
+        """
+        segments = list(dict.fromkeys(segments))
+        found: dict[str, str] = {}
+        with self._lock, self._connection:
+            for start in range(0, len(segments), _QUERY_BATCH):
+                batch = segments[start:start + _QUERY_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._connection.execute(
+                    f"SELECT source, translation FROM segments "
+                    f"WHERE provider = ? AND source_lang = ? AND target_lang = ? AND source IN ({placeholders})",
+                    (provider, source_lang, target_lang, *batch)
+                ))
+            self._connection.executemany(
+                "UPDATE segments SET last_used = ? "
+                "WHERE provider = ? AND source_lang = ? AND target_lang = ? AND source = ?",
+                [(time.time(), provider, source_lang, target_lang, source) for source in found]
+            )
+            self.hits += len(found)
+            self.misses += len(segments) - len(found)
+        return found
+
+    def store(self, translations: dict[str, str], source_lang: str, target_lang: str, provider: str) -> None:
+        """Store translations.
+
+        Parameters
+        ----------
+        translations : dict[str, str]
+            Source segment to translation.
+        source_lang : str
+            Source language.
+        target_lang : str
+            Target language.
+        provider : str
+            Translation provider.
+        """
+        now = time.time()
+        self._insert(
+            (provider, source_lang, target_lang, source, translation, now)
+            for source, translation in translations.items()
+        )
+
+    def _insert(self, rows: Iterable[tuple]) -> None:
+        rows = list(rows)
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?)", rows)
+            # Upper bound, replaced rows are counted too, exact count is only taken when cap may be reached
+            self._count += len(rows)
+            if self._count > self.max_entries:
+                self._count = self._connection.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+            if self._count > self.max_entries:
+                evict = self._count - int(self.max_entries * 0.9)
+                self._connection.execute(
+                    "DELETE FROM segments WHERE rowid IN (SELECT rowid FROM segments ORDER BY last_used LIMIT ?)",
+                    (evict,)
+                )
+                self._count -= evict
+
+    def import_jsonl(self, file: IO[str]) -> int:
+        """Bulk import segments exported by `export_jsonl`.
+
+        Parameters
+        ----------
+        file : IO[str]
+            JSON lines with provider, source_lang, target_lang, source and translation keys.
+
+        Returns
+        -------
+        int
+            Number of imported segments.
+        """
+        now = time.time()
+        rows = [
+            (row["provider"], row["source_lang"], row["target_lang"], row["source"], row["translation"], now)
+            for row in map(json.loads, filter(str.strip, file))
+        ]
+        self._insert(rows)
+        return len(rows)
+
+    def export_jsonl(self) -> Iterator[str]:
+        """Bulk export all segments.
+
+        Yields
+        ------
+        str
+            JSON line per segment.
+        """
+        last = 0
+        while True:
+            # Read page by page, so lock isn't held while caller consumes rows
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT rowid, provider, source_lang, target_lang, source, translation FROM segments "
+                    "WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last, _QUERY_BATCH)
+                ).fetchall()
+            if not rows:
+                return
+            for last, provider, source_lang, target_lang, source, translation in rows:
+                yield json.dumps({
+                    "provider": provider,
+                    "source_lang": source_lang,
+                    "target_lang": target_lang,
+                    "source": source,
+                    "translation": translation,
+                }, ensure_ascii=False) + "\n"
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+_default: TranslationMemory | None = None
+_default_lock = threading.Lock()
+
+
+def get_default() -> TranslationMemory:
+    """Process-wide memory configured by `TRANSLATION_MEMORY_PATH` and `TRANSLATION_MEMORY_MAX_ENTRIES`."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = TranslationMemory(
+                os.environ.get("TRANSLATION_MEMORY_PATH", "./.cache/translation_memory.sqlite3"),
+                int(os.environ.get("TRANSLATION_MEMORY_MAX_ENTRIES", 1_000_000)),
+            )
+        return _default
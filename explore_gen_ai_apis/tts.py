@@ -0,0 +1,325 @@
+"""TTS providers."""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import requests
+
+from explore_gen_ai_apis import audio_spool, clients, media_cache, metrics, routing, workers
+from explore_gen_ai_apis.text import pack
+
+
+# Provider -> (max characters per request, max parallel requests) in long script mode
+LONG_SCRIPT = {
+    "elevenlabs": (2500, 3),
+    "murf": (2500, 4),
+}
+# Attempts per piece of a long script whose audio was cut short
+ATTEMPTS = 3
+# Rough USD per 1000 characters from list prices
+COSTS = {"elevenlabs": 0.30, "lovo": 0.16, "murf": 0.20}
+ROUTER = routing.Router("tts", COSTS)
+
+_lock = threading.Lock()
+_pools: dict[str, ThreadPoolExecutor] = {}
+
+
+def _elevenlabs_url() -> str:
+    return os.environ.get("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io")
+
+
+def _lovo_url() -> str:
+    return os.environ.get("LOVO_BASE_URL", "https://api.genny.lovo.ai")
+
+
+def _murf_url() -> str:
+    return os.environ.get("MURF_BASE_URL", "https://api.murf.ai")
+
+
+def _pool(provider: str) -> ThreadPoolExecutor:
+    """Process-wide pool of provider, so parallel requests are capped across all scripts."""
+    with _lock:
+        if provider not in _pools:
+            _pools[provider] = ThreadPoolExecutor(max_workers=LONG_SCRIPT[provider][1], thread_name_prefix=provider)
+        return _pools[provider]
+
+
+class _CutShort(Exception):
+    """Audio stopped arriving after response started, which `rate_limit` can't retry."""
+
+
+def _save(response: requests.Response, path: str) -> None:
+    response.raise_for_status()
+    with response, open(path, "wb") as file:
+        try:
+            for chunk in response.iter_content(audio_spool.CHUNK_SIZE):
+                file.write(chunk)
+        except requests.RequestException as error:
+            raise _CutShort(f"Audio was cut short: {error}") from error
+
+
+def _id3_size(header: bytes) -> int:
+    """Size of ID3v2 tag at the start of MP3 file, 0 if there is none."""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = (header[6] & 0x7f) << 21 | (header[7] & 0x7f) << 14 | (header[8] & 0x7f) << 7 | header[9] & 0x7f
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def _synthesize_piece(synthesize: Callable[[str, str], None], text: str, path: str) -> str:
+    """Synthesize single piece of a long script, only this piece is synthesized again if its audio is cut short.
+
+    Throttled, unavailable and unconnected requests are already retried by `rate_limit`, other errors are final.
+    """
+    for attempt in range(ATTEMPTS):
+        try:
+            synthesize(text, path)
+            return path
+        except _CutShort:
+            if attempt == ATTEMPTS - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+class Generator:
+    """Class that contains all generate methods."""
+    @staticmethod
+    def generate_elevenlabs(prompt: str) -> str:
+        """TTS using elevenlabs streaming endpoint.
+
+        Audio is spooled to disk in background while it is synthesized, url can be played before synthesis ends.
+
+        Parameters
+        ----------
+        prompt : str
+            Inout text.
+
+        Returns
+        -------
+        str
+            Url to audio.
+        """
+        url = f"{_elevenlabs_url()}/v1/text-to-speech/9BWtsMINqrJLrRacOk9x/stream"
+
+        payload = {
+            "text": prompt,
+        }
+        headers = {
+            "xi-api-key": os.environ['ELEVENLABS_API_KEY'],
+            "Content-Type": "application/json"
+        }
+
+        response = clients.get_session("elevenlabs").post(url, json=payload, headers=headers, stream=True)
+        response.raise_for_status()
+
+        def chunks():
+            with response:
+                yield from response.iter_content(audio_spool.CHUNK_SIZE)
+
+        return audio_spool.spool(chunks(), "audio/mpeg", ".mp3").url
+
+    @staticmethod
+    def generate_lovo(prompt: str) -> str:
+        """TTS using lovo.
+
+        Parameters
+        ----------
+        prompt : str
+            Input text.
+
+        Returns
+        -------
+        str
+            Url to audio.
+        """
+        url = f"{_lovo_url()}/api/v1/tts/sync"
+
+        payload = {
+            "text": prompt,
+            "speaker": "62e8c3581ffadc3ff72832aa"
+        }
+        headers = {
+            "x-api-key": os.environ['LOVO_API_KEY'],
+            "Content-Type": "application/json"
+        }
+
+        # It has timeout of 90 seconds, after that you would need to retrieve the recording
+        response = clients.get_session("lovo").post(url, json=payload, headers=headers)
+
+        return response.json()['data']['urls'][0]
+
+    @staticmethod
+    def generate_murf(prompt: str) -> str:
+        """TTS using murf.ai.
+
+        Parameters
+        ----------
+        prompt : str
+            Input text.
+
+        Returns
+        -------
+        str
+            Url to audio.
+        """
+        url = f"{_murf_url()}/v1/speech/generate"
+
+        payload = {
+            "voiceId": "en-US-natalie",
+            "text": prompt,
+            "format": "MP3",
+            "channelType": "MONO",
+            "modelVersion": "GEN2",
+        }
+        headers = {
+            "api-key": os.environ['MURF_API_KEY'],
+            "Content-Type": "application/json"
+        }
+
+        # It has timeout of 90 seconds, after that you would need to retrieve the recording
+        response = clients.get_session("murf").post(url, json=payload, headers=headers)
+
+        return response.json()['audioFile']
+
+    @staticmethod
+    def synthesize_elevenlabs(prompt: str, path: str) -> None:
+        """TTS using elevenlabs, saved to a file.
+
+        Parameters
+        ----------
+        prompt : str
+            Input text.
+        path : str
+            Output MP3 file.
+        """
+        response = clients.get_session("elevenlabs").post(
+            f"{_elevenlabs_url()}/v1/text-to-speech/9BWtsMINqrJLrRacOk9x/stream",
+            json={"text": prompt},
+            headers={
+                "xi-api-key": os.environ['ELEVENLABS_API_KEY'],
+                "Content-Type": "application/json"
+            },
+            stream=True
+        )
+        _save(response, path)
+
+    @staticmethod
+    def synthesize_murf(prompt: str, path: str) -> None:
+        """TTS using murf.ai, saved to a file.
+
+        Parameters
+        ----------
+        prompt : str
+            Input text.
+        path : str
+            Output MP3 file.
+        """
+        _save(clients.get_session("murf").get(Generator.generate_murf(prompt), stream=True), path)
+
+    @metrics.instrumented("tts")
+    def execute(self, prompt: str, provider, budget: float | None = None, over_budget: bool = False) -> str:
+        """TTS.
+
+        Parameters
+        ----------
+        prompt : str
+            Input text.
+        provider
+            Translation provider, ``auto`` picks one with `ROUTER`
+        budget : float, optional
+            Max estimated cost in USD of the call for ``auto`` provider.
+        over_budget : bool
+            Fail over to providers over `budget` if those within it fail, instead of leaving them out.
+
+        Returns
+        -------
+        str
+            Url to audio.
+        """
+        generate: Callable[[str], str] = None
+        match provider:
+            case routing.AUTO:
+                units = len(prompt) / 1000
+                return ROUTER.call(lambda choice: self.execute(prompt, choice), units, budget, over_budget)
+            case "elevenlabs":
+                generate = self.generate_elevenlabs
+            case "lovo":
+                generate = self.generate_lovo
+            case "murf":
+                generate = self.generate_murf
+
+        with workers.slot(provider):
+            url = generate(prompt)
+        # elevenlabs audio is already served locally while it is synthesized. Urls of others expire, local copy is
+        # downloaded once and replayed from disk
+        return url if provider == "elevenlabs" else media_cache.url(url)
+
+    @metrics.instrumented("tts_long")
+    def execute_long(self, prompt: str, provider) -> str:
+        """TTS of a long script.
+
+        Script is split into pieces at sentence or paragraph boundaries, pieces are synthesized in parallel and MP3
+        files are joined in order without re-encoding. Piece whose audio is cut short is synthesized again on its own.
+        Playback can start once the first piece is ready. If a later piece fails, audio ends with the error instead
+        of being shorter, see `audio_spool.Spool`.
+
+        Parameters
+        ----------
+        prompt : str
+            Input text.
+        provider
+            TTS provider, one of `LONG_SCRIPT`.
+
+        Returns
+        -------
+        str
+            Url to audio.
+        """
+        synthesize: Callable[[str, str], None] = None
+        match provider:
+            case "elevenlabs":
+                synthesize = self.synthesize_elevenlabs
+            case "murf":
+                synthesize = self.synthesize_murf
+
+        max_chars, __ = LONG_SCRIPT[provider]
+        pool = _pool(provider)
+        directory = tempfile.mkdtemp(prefix="tts-")
+        # Pieces are requests of the calling task, cancelled with it
+        synthesize_piece = workers.bind(_synthesize_piece)
+        # Slot is held until the first piece is there, the rest are limited by the pool of provider
+        with workers.slot(provider):
+            futures = [
+                pool.submit(synthesize_piece, synthesize, piece, os.path.join(directory, f"{i:05d}.mp3"))
+                for i, piece in enumerate(pack(prompt, max_chars) or [prompt])
+            ]
+            try:
+                # Errors like a bad API key are raised here, rather than as a silently truncated audio
+                futures[0].result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                shutil.rmtree(directory, ignore_errors=True)
+                raise
+
+        def chunks():
+            try:
+                for i, future in enumerate(futures):
+                    path = future.result()
+                    with open(path, "rb") as file:
+                        if i:
+                            # Tags of later pieces would be played as noise in the middle of the audio
+                            file.seek(_id3_size(file.read(10)))
+                        while block := file.read(audio_spool.CHUNK_SIZE):
+                            yield block
+                    os.remove(path)
+            finally:
+                for future in futures:
+                    future.cancel()
+                shutil.rmtree(directory, ignore_errors=True)
+
+        return audio_spool.spool(chunks(), "audio/mpeg", ".mp3").url
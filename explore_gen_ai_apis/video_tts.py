@@ -0,0 +1,225 @@
+"""Video TTS/Voiceover providers.
+
+Renders take minutes, so videos are submitted and then tracked by a shared `jobs.JobPoller` instead of waiting in
+the caller's thread. When `TAVUS_CALLBACK_URL` is set, tavus also notifies a local `jobs.WebhookReceiver` listening on
+`TAVUS_WEBHOOK_PORT` of status changes, callback url should be the public address of that port. A callback only makes
+its video be polled right away, its status and url are always read from tavus.
+"""
+import os
+import threading
+from typing import Callable
+
+from explore_gen_ai_apis import clients, jobs, media_cache, metrics, workers
+
+
+_lock = threading.Lock()
+_pollers: dict[str, jobs.JobPoller] = {}
+_receivers: dict[str, jobs.WebhookReceiver] = {}
+
+
+def _tavus_url() -> str:
+    return os.environ.get("TAVUS_BASE_URL", "https://tavusapi.com")
+
+
+def _tavus_headers() -> dict[str, str]:
+    return {
+        "x-api-key": os.environ['TAVUS_API_KEY'],
+        "Content-Type": "application/json"
+    }
+
+
+class Generator:
+    """Class that contains all generate methods."""
+    @staticmethod
+    def submit_tavus(prompt: str) -> str:
+        """Submit video TTS to tavus.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt.
+
+        Returns
+        -------
+        str
+            Video id.
+        """
+        payload = {
+            "script": prompt,
+            "replica_id": "r7dbef2aab"
+        }
+        if os.environ.get("TAVUS_CALLBACK_URL"):
+            payload["callback_url"] = os.environ["TAVUS_CALLBACK_URL"]
+
+        response = clients.get_session("tavus").post(f"{_tavus_url()}/v2/videos", json=payload, headers=_tavus_headers())
+        response.raise_for_status()
+        return response.json()['video_id']
+
+    @staticmethod
+    def video_generate_tavus(prompt: str, timeout: float = 100) -> str:
+        """Gnerate video TTS using tavus and wait for it, status is polled by shared poller.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt.
+        timeout : float
+            Max seconds to wait for video.
+
+        Returns
+        -------
+        str
+            Url to video.
+
+        Raises
+        ------
+        Exception
+            If video generation takes > `timeout` seconds of If video generation failed.
+        """
+        poller = Generator.poller("tavus.io")
+        job = poller.track(Generator.submit_tavus(prompt))
+        status = job.wait(timeout)
+        poller.forget(job.job_id)
+        if status.state == jobs.READY:
+            return status.result
+        elif status.state == jobs.FAILED:
+            raise Exception(status.error)
+        raise Exception(f'Failed to generate video in {timeout} seconds, aborting')
+
+    @staticmethod
+    def _tavus_status(video: dict) -> jobs.JobStatus:
+        video_status = video['status']
+        if video_status == 'ready':
+            return jobs.JobStatus(jobs.READY, video_status, result=video['download_url'])
+        elif video_status in ('deleted', 'error'):
+            return jobs.JobStatus(
+                jobs.FAILED,
+                video_status,
+                error=f"Video failed with status [{video_status}] - {video.get('status_details')}"
+            )
+        return jobs.JobStatus(jobs.PENDING, video_status)
+
+    @staticmethod
+    def status_tavus(video_id: str) -> jobs.JobStatus:
+        """Fetch status of tavus video.
+
+        Parameters
+        ----------
+        video_id : str
+            Video id.
+
+        Returns
+        -------
+        jobs.JobStatus
+            Video status, result is url to video once it is ready.
+        """
+        response = clients.get_session("tavus").get(f"{_tavus_url()}/v2/videos/{video_id}", headers=_tavus_headers())
+        response.raise_for_status()
+        return Generator._tavus_status(response.json())
+
+    @staticmethod
+    def parse_tavus_callback(payload: dict) -> str:
+        """Parse tavus callback body.
+
+        Parameters
+        ----------
+        payload : dict
+            Callback body.
+
+        Returns
+        -------
+        str
+            Video id.
+        """
+        return str(payload['video_id'])
+
+    @staticmethod
+    def poller(provider: str) -> jobs.JobPoller:
+        """Shared poller of provider's jobs, started with webhook receiver if callbacks are configured.
+
+        Parameters
+        ----------
+        provider
+            TTS provider
+
+        Returns
+        -------
+        jobs.JobPoller
+            Poller.
+        """
+        with _lock:
+            if provider not in _pollers:
+                match provider:
+                    case "tavus.io":
+                        _pollers[provider] = jobs.JobPoller(Generator.status_tavus)
+                        if os.environ.get("TAVUS_CALLBACK_URL"):
+                            _receivers[provider] = jobs.WebhookReceiver(
+                                _pollers[provider],
+                                Generator.parse_tavus_callback,
+                                port=int(os.environ.get("TAVUS_WEBHOOK_PORT", 8765))
+                            )
+            return _pollers[provider]
+
+    @metrics.instrumented("video_submit")
+    def submit(self, prompt: str, provider) -> jobs.Job:
+        """Submit video generation without waiting for it.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt
+        provider
+            TTS provider
+
+        Returns
+        -------
+        jobs.Job
+            Job that is updated in background, its result is url to video. Pass it to `forget` once its result is
+            used.
+        """
+        submit: Callable[[str], str] = None
+        match provider:
+            case "tavus.io":
+                submit = self.submit_tavus
+
+        with workers.slot(provider):
+            video_id = submit(prompt)
+        return self.poller(provider).track(video_id)
+
+    def forget(self, job: jobs.Job, provider) -> None:
+        """Stop tracking job returned by `submit`, so finished jobs don't pile up in the shared poller.
+
+        Parameters
+        ----------
+        job : jobs.Job
+            Submitted job.
+        provider
+            TTS provider it was submitted to.
+        """
+        self.poller(provider).forget(job.job_id)
+
+    @metrics.instrumented("video")
+    def execute(self, prompt: str, provider) -> str:
+        """Generate video and wait for it.
+
+        Parameters
+        ----------
+        prompt : str
+            Input prompt
+        provider
+            TTS provider
+
+        Returns
+        -------
+        str
+            Url to video.
+        """
+        generate: Callable[[str], str] = None
+        match provider:
+            case "tavus.io":
+                generate = self.video_generate_tavus
+
+        with workers.slot(provider):
+            url = generate(prompt)
+        # Provider's urls expire, local copy is downloaded once and replayed from disk
+        return media_cache.url(url)
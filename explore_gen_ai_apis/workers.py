@@ -0,0 +1,397 @@
+"""Shared pool of background workers that make provider calls for all Streamlit sessions.
+
+A page submits a call with `submit` and its script run finishes right away, instead of its thread waiting for the
+provider. The call's `Task` is shown by `show`, an `st.fragment` that reruns on its own while the task runs, so only
+the fragment is rerun, not the page:
+
+* at most `PROVIDER_CONCURRENCY` calls of a provider run at once, the rest wait in a queue of that provider, so a slow
+  provider doesn't take workers from the others. A call may also reach other providers than it was queued for, e.g.
+  one routed by ``auto``, comparing providers or chaining several. So every provider request made on behalf of a task
+  also holds a `slot` of its provider, and no more than `PROVIDER_CONCURRENCY` tasks hold slots of a provider at once.
+  Threads a task starts join it with `bind`;
+* a new call of a session under the same key cancels its previous one, and a reaper thread cancels calls of sessions
+  that disconnected;
+* a cancelled call that hasn't started never runs. A running one is stopped between streamed chunks, which closes
+  provider's response, and before any further request or retry made from its thread, see `check`. A request that is
+  already in flight can't be interrupted.
+"""
+import contextlib
+import functools
+import inspect
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Generator
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+MAX_WORKERS = int(os.environ.get("GEN_AI_WORKERS", 32))
+# Max calls of one provider running at once
+PROVIDER_CONCURRENCY = int(os.environ.get("GEN_AI_PROVIDER_CONCURRENCY", 4))
+# Seconds between checks for disconnected sessions
+REAP_SECONDS = 5.0
+
+_local = threading.local()
+
+
+class Cancelled(Exception):
+    """Task was cancelled."""
+
+
+@dataclass(eq=False)
+class Task:
+    """Call made by a worker, it is updated in place by worker thread.
+
+    Attributes
+    ----------
+    outputs : list
+        Chunks yielded so far, if call returned a generator.
+    result : Any
+        Return value of call, or of its generator.
+    """
+    task_id: str
+    session: str
+    key: str
+    provider: str
+    function: Callable[[], Any] = field(repr=False)
+    state: str = QUEUED
+    outputs: list = field(default_factory=list, repr=False)
+    result: Any = field(default=None, repr=False)
+    error: Exception | None = None
+    submitted: float = field(default_factory=time.monotonic)
+    finished: float | None = None
+    cancelled: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.submitted
+
+
+def current() -> Task | None:
+    """Task run by the current thread, None outside tasks."""
+    return getattr(_local, "task", None)
+
+
+def check() -> None:
+    """Raise `Cancelled` if the task run by the current thread was cancelled, called before provider requests."""
+    task = current()
+    if task is not None and task.cancelled.is_set():
+        raise Cancelled(f"Task {task.task_id} was cancelled")
+
+
+def bind(function: Callable) -> Callable:
+    """Function that runs as part of the current task in whatever thread calls it.
+
+    Threads started by a task use it, so their requests are cancelled with the task and hold its provider slots.
+    Outside tasks `function` is returned as is.
+    """
+    task = current()
+    if task is None:
+        return function
+
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        previous = current()
+        _local.task = task
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.task = previous
+
+    return bound
+
+
+def _streamlit_session_alive(session: str) -> bool:
+    from streamlit.runtime import Runtime
+
+    return not Runtime.exists() or Runtime.instance().is_active_session(session)
+
+
+@dataclass(eq=False)
+class _Slot:
+    """Slot of a provider held by a task, shared by all of its threads that call the provider."""
+    users: int = 0
+    acquired: threading.Event = field(default_factory=threading.Event)
+
+
+class WorkerPool:
+    """Pool of worker threads with a queue per provider.
+
+    Parameters
+    ----------
+    max_workers : int
+        Number of worker threads.
+    provider_concurrency : int
+        Max calls of one provider running at once.
+    is_alive : Callable[[str], bool]
+        Whether session is still connected, its tasks are cancelled otherwise.
+    """
+    def __init__(
+            self,
+            max_workers: int = MAX_WORKERS,
+            provider_concurrency: int = PROVIDER_CONCURRENCY,
+            is_alive: Callable[[str], bool] = _streamlit_session_alive
+    ):
+        self.provider_concurrency = provider_concurrency
+        self.is_alive = is_alive
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="worker")
+        self._lock = threading.Lock()
+        # (session, key) -> its latest unfinished task
+        self._current: dict[tuple[str, str], Task] = {}
+        self._queues: dict[str, deque[Task]] = defaultdict(deque)
+        self._running: dict[str, int] = defaultdict(int)
+        self._slots: dict[str, threading.Semaphore] = {}
+        # (task id, provider) -> slot
+        self._held: dict[tuple[str, str], _Slot] = {}
+        self._reaper: threading.Thread | None = None
+
+    def submit(self, function: Callable[[], Any], session: str, key: str, provider: str) -> Task:
+        """Queue call, cancelling unfinished call of the same session and key.
+
+        Parameters
+        ----------
+        function : Callable[[], Any]
+            Call to make, if it returns a generator, its chunks are collected in `Task.outputs` as they come.
+        session : str
+            Session id.
+        key : str
+            What the call is for within session, e.g. page name.
+        provider : str
+            Provider the call goes to, for its concurrency limit.
+
+        Returns
+        -------
+        Task
+            Queued task.
+        """
+        task = Task(uuid.uuid4().hex, session, key, provider, function)
+        with self._lock:
+            previous = self._current.get((session, key))
+            self._current[(session, key)] = task
+            self._queues[provider].append(task)
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name="worker-reaper", daemon=True)
+                self._reaper.start()
+        if previous is not None:
+            previous.cancelled.set()
+        self._dispatch(provider)
+        return task
+
+    def cancel(self, session: str, key: str | None = None) -> None:
+        """Cancel unfinished tasks of session, only the one of `key` if it is given."""
+        with self._lock:
+            tasks = [
+                task for (task_session, task_key), task in self._current.items()
+                if task_session == session and key in (None, task_key)
+            ]
+        for task in tasks:
+            task.cancelled.set()
+        for provider in {task.provider for task in tasks}:
+            # Frees queued tasks right away
+            self._dispatch(provider)
+
+    @contextlib.contextmanager
+    def slot(self, task: Task, provider: str) -> Generator[None, None, None]:
+        """Hold a slot of `provider` for `task`, waiting while `provider_concurrency` other tasks hold one.
+
+        A task holds at most one slot of a provider, however many of its threads call it at once, so calls nested in
+        each other, e.g. ``auto`` routing to a provider, don't wait for themselves. Waiting stops if task is
+        cancelled.
+        """
+        key = (task.task_id, provider)
+        with self._lock:
+            semaphore = self._slots.setdefault(provider, threading.Semaphore(self.provider_concurrency))
+            held = self._held.setdefault(key, _Slot())
+            held.users += 1
+            first = held.users == 1
+        try:
+            if first:
+                while not semaphore.acquire(timeout=0.1):
+                    check()
+                held.acquired.set()
+            else:
+                while not held.acquired.wait(0.1):
+                    check()
+            yield
+        finally:
+            with self._lock:
+                held.users -= 1
+                last = held.users == 0
+                if last:
+                    del self._held[key]
+            if last and held.acquired.is_set():
+                semaphore.release()
+
+    def _dispatch(self, provider: str) -> None:
+        with self._lock:
+            queue = self._queues[provider]
+            for task in [task for task in queue if task.cancelled.is_set()]:
+                queue.remove(task)
+                self._finish(task, CANCELLED)
+            while queue and self._running[provider] < self.provider_concurrency:
+                task = queue.popleft()
+                self._running[provider] += 1
+                task.state = RUNNING
+                self._executor.submit(self._run, task)
+
+    def _finish(self, task: Task, state: str) -> None:
+        task.state = state
+        task.finished = time.monotonic()
+        if self._current.get((task.session, task.key)) is task:
+            del self._current[(task.session, task.key)]
+
+    def _run(self, task: Task) -> None:
+        _local.task = task
+        state = DONE
+        try:
+            check()
+            output = task.function()
+            if inspect.isgenerator(output):
+                try:
+                    while True:
+                        check()
+                        try:
+                            task.outputs.append(next(output))
+                        except StopIteration as stop:
+                            task.result = stop.value
+                            break
+                finally:
+                    # Closes provider's response if stream was cancelled
+                    output.close()
+            else:
+                task.result = output
+        except Exception as error:
+            state = CANCELLED if task.cancelled.is_set() else FAILED
+            if state == FAILED:
+                task.error = error
+        finally:
+            _local.task = None
+            with self._lock:
+                self._running[task.provider] -= 1
+                self._finish(task, state)
+            self._dispatch(task.provider)
+
+    def _reap(self) -> None:
+        while True:
+            time.sleep(REAP_SECONDS)
+            with self._lock:
+                sessions = {session for session, __ in self._current}
+            for session in sessions:
+                try:
+                    alive = self.is_alive(session)
+                except Exception:
+                    alive = True
+                if not alive:
+                    self.cancel(session)
+
+    def stats(self) -> list[dict]:
+        """Running and queued calls per provider they were submitted for, and tasks calling each provider."""
+        with self._lock:
+            calling = defaultdict(int)
+            for (__, provider), held in self._held.items():
+                calling[provider] += held.acquired.is_set()
+            providers = sorted(set(self._running) | set(self._queues) | set(self._slots))
+            return [
+                {
+                    "provider": provider,
+                    "running": self._running[provider],
+                    "queued": len(self._queues[provider]),
+                    "calling": calling[provider],
+                }
+                for provider in providers
+            ]
+
+
+_default: WorkerPool | None = None
+_default_lock = threading.Lock()
+
+
+def get_default() -> WorkerPool:
+    """Process-wide pool, configured by `GEN_AI_WORKERS` and `GEN_AI_PROVIDER_CONCURRENCY` environment variables."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = WorkerPool()
+        return _default
+
+
+def _session_id() -> str:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    context = get_script_run_ctx()
+    return context.session_id if context is not None else "default"
+
+
+def submit(function: Callable[[], Any], key: str, provider: str) -> Task:
+    """Queue call of the current Streamlit session in the process-wide pool, see `WorkerPool.submit`."""
+    return get_default().submit(function, _session_id(), key, provider)
+
+
+@contextlib.contextmanager
+def slot(provider: str) -> Generator[None, None, None]:
+    """Hold a slot of `provider` in the process-wide pool while the current task calls it, see `WorkerPool.slot`.
+
+    Calls made outside tasks, e.g. by batch runs, are not limited.
+    """
+    task = current()
+    if task is None:
+        yield
+        return
+    with get_default().slot(task, provider):
+        yield
+
+
+def held(provider: str, chunks: Generator) -> Generator:
+    """Pass stream through, holding a slot of `provider` until it is done, its return value is kept."""
+    with slot(provider):
+        return (yield from chunks)
+
+
+def show(task: Task | None, render: Callable[[Task], None], every: float = 0.5) -> None:
+    """Render task in a fragment that reruns every `every` seconds while task runs, page reruns once it is done.
+
+    Parameters
+    ----------
+    task : Task, optional
+        Task, nothing is shown if it is None.
+    render : Callable[[Task], None]
+        Renders task, called on every rerun of the fragment, so it should show `Task.outputs` gathered so far.
+    every : float
+        Seconds between reruns.
+    """
+    if task is None:
+        return
+    import streamlit as st
+
+    polling = not task.done
+
+    @st.fragment(run_every=every if polling else None)
+    def fragment():
+        if polling and task.done:
+            # Rerun the page, so the fragment stops polling
+            st.rerun()
+        render(task)
+        if not task.done:
+            status, cancel = st.columns([4, 1])
+            status.caption(f"Waiting for {task.provider}, {task.elapsed:.0f}s")
+            if cancel.button("Cancel", key=f"cancel-{task.task_id}"):
+                get_default().cancel(task.session, task.key)
+        elif task.state == FAILED:
+            st.error(task.error)
+        elif task.state == CANCELLED:
+            st.caption("Cancelled")
+
+    fragment()
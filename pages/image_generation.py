@@ -1,16 +1,14 @@
 """Streamlit page for image generation."""
+import functools
+import time
 
-import os
-from typing import Callable
-
-import requests
 import streamlit as st
-from dotenv import load_dotenv
 
-import replicate
+from explore_gen_ai_apis import env, image_server, routing, workers
+from explore_gen_ai_apis.image_generation import Generator
 
 
-load_dotenv()
+env.load()
 
 st.set_page_config(page_title="Image generation demo")
 
@@ -19,126 +17,82 @@ st.sidebar.header("Image generation demo")
 st.markdown("Please select provider in a sidebar.")
 
 
-class Generator:
-    """Class that contains all generate methods."""
-    @staticmethod
-    def generate_stability(prompt: str) -> bytes:
-        """Generate image using Stability AI ultra model.
-
-        Parameters
-        ----------
-        prompt : str
-            Input prompt for Text to Image
-
-        Returns
-        -------
-        bytes
-            Output image
-        """
-        response = requests.post(
-            f"https://api.stability.ai/v2beta/stable-image/generate/ultra",
-            headers={
-                "authorization": f"Bearer {os.environ['STABILITY_AI_API_KEY']}",
-                "accept": "image/*"
-            },
-            files={"none": ''},
-            data={
-                "prompt": prompt,
-                "output_format": "webp",
-            },
-        )
-        return response.content
-
-    @staticmethod
-    def generate_replicate(prompt: str) -> bytes:
-        """Generate image using replicate.com and flux-1.1-pro
-
-        Parameters
-        ----------
-        prompt : str
-            Input prompt for Text to Image
-
-        Returns
-        -------
-        bytes
-            Output Image
-        """
-        client = replicate.Client(
-            api_token=os.environ["REPLICATE_API_TOKEN"],
-            headers={
-                "User-Agent": "my-app/1.0",
-            }
-        )
-        output = client.run(
-            "black-forest-labs/flux-1.1-pro",
-            input={"prompt": prompt}
-        )
-        return output.read()
-
-    @staticmethod
-    def generate_getimg_ai(prompt: str) -> bytes:
-        """Generate image using getimg.ai and flux-schnell
-
-        Parameters
-        ----------
-        prompt : str
-            Input prompt for Text to Image
-
-        Returns
-        -------
-        bytes
-            Output Image
-        """
-        url = "https://api.getimg.ai/v1/flux-schnell/text-to-image"
-
-        payload = {
-            "response_format": "url",
-            "output_format": "png",
-            "prompt": prompt
-        }
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": f"Bearer {os.environ["GETIMG_AI_API_KEY"]}"
-        }
-
-        response = requests.post(url, json=payload, headers=headers)
-
-        return response.json()['url']
-
-    def execute(self, prompt: str, provider) -> bytes:
-        """Generate image.
-
-        Parameters
-        ----------
-        prompt : str
-            Input prompt for Text to Image
-        provider
-            Provider for Image generation
-
-        Returns
-        -------
-        bytes
-            Output Image
-        """
-        generate: Callable[[str], bytes] = None
-        match provider:
-            case "Stability AI":
-                generate = self.generate_stability
-            case "replicate.com":
-                generate = self.generate_replicate
-            case "getimg.ai":
-                generate = self.generate_getimg_ai
-
-        return generate(prompt)
+image_generator = Generator()
 
 
-image_generator = Generator()
+def show(image: bytes) -> None:
+    """Show image from the image server, so Streamlit doesn't keep and resend its bytes, if it is cached."""
+    st.image(image_server.image_url(image, image_generator.cache) or image)
+
+
+with st.sidebar.expander("Image cache"):
+    st.json(image_generator.cache.stats())
+
+compare = st.sidebar.toggle("Compare providers")
+if compare:
+    providers = st.sidebar.multiselect(
+        "Select model providers",
+        tuple(Generator.MODELS),
+        default=tuple(Generator.MODELS)
+    )
+else:
+    provider = st.sidebar.selectbox(
+        "Select model provider",
+        (*Generator.MODELS, routing.AUTO)
+    )
+    budget = st.sidebar.number_input(
+        "Max cost per image, $", min_value=0.0, value=None, step=0.01, format="%.4f", placeholder="No limit",
+        help="Auto picks the fastest healthy provider whose estimated cost is within this budget."
+    ) if provider == routing.AUTO else None
+    over_budget = budget is not None and st.sidebar.toggle(
+        "Fail over past budget",
+        help="If every provider within budget fails, providers over it are tried too."
+    )
+    variants = st.sidebar.slider(
+        "Variants", 1, Generator.MAX_VARIANTS, 1,
+        help="Images generated at once from the same prompt, each with its own seed."
+    ) if provider != routing.AUTO else 1
+
+
+def generate(text: str, providers: list[str], budget: float | None, over_budget: bool, variants: int):
+    """Yield (caption, image or error, seconds) of images as they are done, returns total time and routing choice."""
+    start = time.perf_counter()
+    if len(providers) > 1:
+        yield from (
+            (f"{provider} - {seconds:.1f}s", image, seconds)
+            for provider, image, seconds in image_generator.compare(prompt=text, providers=providers)
+        )
+    elif variants > 1:
+        yield from (
+            (f"Seed {seed} - {seconds:.1f}s", image, seconds)
+            for seed, image, seconds in image_generator.variants(text, providers[0], variants)
+        )
+    else:
+        image = image_generator.execute(prompt=text, provider=providers[0], budget=budget, over_budget=over_budget)
+        yield None, image, None
+    # Routing choice is only known to the worker thread
+    routed = image_generator.ROUTER.last() if providers[0] == routing.AUTO else None
+    return {"total": time.perf_counter() - start, "routed": routed}
+
+
+def render(task: workers.Task, cells: int) -> None:
+    # Grid is filled in order of completion
+    columns = [column for row in range(0, cells, 4) for column in st.columns(min(cells, 4))][:cells]
+    for column, (caption, image, seconds) in zip(columns, task.outputs):
+        with column:
+            if caption is not None:
+                st.caption(caption)
+            if isinstance(image, Exception):
+                st.error(image)
+            else:
+                show(image)
+    if task.state != workers.DONE:
+        return
+    if cells > 1:
+        st.caption(f"Total: {task.result['total']:.1f}s")
+    if task.result["routed"] is not None:
+        st.caption(f"Routed to {task.result['routed']}")
 
-provider = st.sidebar.selectbox(
-    "Select model provider",
-    ("Stability AI", "replicate.com", "getimg.ai")
-)
 
 with st.form("my_form"):
     text = st.text_area(
@@ -146,5 +100,37 @@ with st.form("my_form"):
         "High quality purple crystal in a cave.",
     )
     submitted = st.form_submit_button("Submit")
-    if submitted:
-        st.image(image_generator.execute(prompt=text, provider=provider))
+    chosen = (providers if compare else [provider]) if submitted else []
+    if chosen:
+        count = 1 if compare else variants
+        st.session_state["image_generation"] = workers.submit(
+            functools.partial(generate, text, chosen, None if compare else budget, not compare and over_budget, count),
+            key="image_generation", provider=", ".join(chosen)
+        )
+        st.session_state["image_generation_cells"] = max(len(chosen), count)
+
+
+workers.show(
+    st.session_state.get("image_generation"),
+    functools.partial(render, cells=st.session_state.get("image_generation_cells", 1)),
+)
+
+if not compare and provider == routing.AUTO:
+    with st.expander("Provider routing"):
+        st.dataframe(image_generator.ROUTER.snapshot(), hide_index=True)
+
+with st.expander("Gallery"):
+    recent = image_generator.cache.recent()
+    if not recent:
+        st.write("No images yet.")
+    for row in range(0, len(recent), 4):
+        for column, entry in zip(st.columns(4), recent[row:row + 4]):
+            with column:
+                # Without the image server, e.g. its address isn't set, Streamlit serves the thumbnail file
+                thumbnail = image_server.url(entry["digest"], image_generator.cache, thumbnail=True)
+                thumbnail = thumbnail or image_generator.cache.thumbnail(entry["digest"])
+                if thumbnail:
+                    st.image(thumbnail, caption=f"{entry['provider']}: {entry['prompt']}")
+                full_size = image_server.url(entry["digest"], image_generator.cache)
+                if full_size:
+                    st.markdown(f"[Full size]({full_size})")
@@ -0,0 +1,85 @@
+"""Streamlit page with live latency percentiles of provider calls."""
+import streamlit as st
+
+from explore_gen_ai_apis import hedging, metrics, workers
+
+
+st.set_page_config(page_title="Metrics")
+
+st.markdown("# Metrics")
+st.sidebar.header("Metrics")
+st.markdown("Provider calls made by this server process since it started, percentiles of the last 1000 calls.")
+
+url = metrics.server_url()
+if url:
+    st.caption(f"Prometheus endpoint: {url}")
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+@st.fragment(run_every=2)
+def show_metrics():
+    calls = {}
+    for labels in metrics.CALL_SECONDS.series():
+        key = labels["operation"], labels["provider"]
+        row = calls.setdefault(key, {"operation": key[0], "provider": key[1], "calls": 0, "errors": 0})
+        count = metrics.CALL_SECONDS.count(**labels)
+        row["calls"] += count
+        if labels["status"] == "ok":
+            row["p50 ms"], row["p95 ms"], row["p99 ms"] = map(_ms, metrics.CALL_SECONDS.percentiles(**labels))
+        else:
+            row["errors"] += count
+    for (operation, provider), row in calls.items():
+        ttfb = metrics.CALL_TTFB_SECONDS.percentiles((0.5,), operation=operation, provider=provider)
+        row["TTFB p50 ms"] = _ms(ttfb[0])
+        row["retries"] = int(metrics.CALL_RETRIES.value(operation=operation, provider=provider))
+
+    st.subheader("Calls")
+    if calls:
+        st.dataframe(list(calls.values()), hide_index=True)
+    else:
+        st.info("No provider calls yet, use one of the demos.")
+
+    failed = {}
+    for sample in metrics.HTTP_RESPONSES.samples():
+        if not sample["code"].startswith("2"):
+            failed[sample["client"]] = failed.get(sample["client"], 0) + int(sample["value"])
+    clients = {}
+    for labels in metrics.HTTP_TTFB_SECONDS.series():
+        client = labels["client"]
+        p50, p95, p99 = map(_ms, metrics.HTTP_TTFB_SECONDS.percentiles(client=client))
+        clients[client] = {
+            "client": client,
+            "requests": metrics.HTTP_TTFB_SECONDS.count(client=client),
+            "TTFB p50 ms": p50,
+            "TTFB p95 ms": p95,
+            "TTFB p99 ms": p99,
+            "sent KiB": round(metrics.HTTP_SENT_BYTES.value(client=client) / 1024, 1),
+            "received KiB": round(metrics.HTTP_RECEIVED_BYTES.value(client=client) / 1024, 1),
+            "failed": failed.get(client, 0),
+            "retries": int(metrics.HTTP_RETRIES.value(client=client)),
+            "rate limited s": round(metrics.RATE_LIMIT_WAIT_SECONDS.value(client=client), 1),
+        }
+    if clients:
+        st.subheader("HTTP clients")
+        st.dataframe(list(clients.values()), hide_index=True)
+
+    running = workers.get_default().stats()
+    if running:
+        st.subheader("Workers")
+        st.dataframe(running, hide_index=True)
+
+    hedges = hedging.report()
+    if hedges:
+        st.subheader("Hedging")
+        st.dataframe(hedges, hide_index=True)
+
+    tokens = metrics.TOKENS.samples()
+    if tokens:
+        st.subheader("Tokens")
+        st.dataframe(tokens, hide_index=True)
+
+
+show_metrics()
@@ -0,0 +1,77 @@
+"""Streamlit page for summarize -> translate -> TTS -> video pipeline."""
+import functools
+
+import streamlit as st
+
+from explore_gen_ai_apis import env, media_cache, routing, workers
+from explore_gen_ai_apis.pipeline import Pipeline
+
+
+env.load()
+
+st.set_page_config(page_title="Pipeline demo")
+
+st.markdown("# Pipeline demo (summary -> Spanish -> speech -> video)")
+st.sidebar.header("Pipeline demo")
+st.markdown(
+    "Summary is translated and voiced sentence by sentence while it is still streamed. "
+    "Please select providers in a sidebar."
+)
+
+summarization_provider = st.sidebar.selectbox(
+    "Select LLM provider",
+    ("OpenAI", "Anthropic", "TogetherAI", routing.AUTO)
+)
+translation_provider = st.sidebar.selectbox(
+    "Select translation provider",
+    ("rapidapi", "deepl", routing.AUTO)
+)
+tts_provider = st.sidebar.selectbox(
+    "Select TTS provider",
+    ("elevenlabs", "lovo", "murf", routing.AUTO)
+)
+video = st.sidebar.toggle("Render video with tavus.io", help="Video of the whole translation, rendered in background")
+
+
+def render(task: workers.Task) -> None:
+    for segment in task.outputs:
+        st.markdown(f"**{segment.translation}**  \n{segment.summary}")
+        st.audio(segment.audio)
+        st.caption(f"Ready after {segment.ready:.2f}s")
+    if task.state != workers.DONE:
+        return
+    report = task.result
+    if report.video:
+        # Provider's url is shown until local copy is downloaded
+        local = media_cache.cached_url(report.video)
+        if local is None:
+            media_cache.get_default().prefetch(report.video)
+        st.video(local or report.video)
+    st.caption(f"End to end: {report.total:.2f}s, {report.sequential:.2f}s if stages ran back to back")
+    st.dataframe(
+        [{name: round(value, 2) if isinstance(value, float) else value for name, value in row.items()}
+         for row in report.rows()],
+        hide_index=True
+    )
+
+
+with st.form("my_form"):
+    text = st.text_area(
+        "Enter text:",
+        (
+            "Data science is an interdisciplinary field that combines techniques from statistics, computer science, "
+            "and domain expertise to extract meaningful insights from data. It involves various stages, including data "
+            "collection, cleaning, exploration, analysis, and visualization. Machine learning, a subset of artificial "
+            "intelligence, plays a crucial role in predictive modeling by enabling algorithms to learn patterns from "
+            "data and make informed decisions."
+        )
+    )
+    submitted = st.form_submit_button("Submit")
+    if submitted:
+        pipeline = Pipeline(summarization_provider, translation_provider, tts_provider, "tavus.io" if video else None)
+        st.session_state["pipeline"] = workers.submit(
+            functools.partial(pipeline.run, text), key="pipeline", provider=summarization_provider
+        )
+
+
+workers.show(st.session_state.get("pipeline"), render)
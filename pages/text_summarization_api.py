@@ -1,15 +1,13 @@
 """Streamlit page for text summarization using API."""
-from typing import Callable
+import functools
 
 import streamlit as st
-from dotenv import load_dotenv
 
-from together import Together
-from openai import OpenAI
-from anthropic import Anthropic
+from explore_gen_ai_apis import env, hedging, routing, streaming, workers
+from explore_gen_ai_apis.text_summarization_api import HEDGE_BACKUPS, ROUTER, Generator
 
 
-load_dotenv()
+env.load()
 
 st.set_page_config(page_title="Text summarization demo")
 
@@ -18,122 +16,59 @@ st.sidebar.header("Text summarization demo")
 st.markdown("Please select provider in a sidebar.")
 
 
-class Generator:
-    """Class that contains all generate methods."""
-    @staticmethod
-    def generate_openai(prompt: str) -> str:
-        """Generate summarization using OpenAI API and GPT-4o.
-
-        Parameters
-        ----------
-        prompt : str
-            Input prompt.
-
-        Returns
-        -------
-        str
-            Summarized text.
-        """
-        client = OpenAI()
-
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "developer", "content": "Imagine you are extremely proficient in summarization, summarize incoming text"},
-                {"role": "user", "content": f'Summarize this: "{prompt}"'}
-            ]
-        )
-
-        return completion.choices[0].message.content
-
-    @staticmethod
-    def generate_anhtropic(prompt: str) -> str:
-        """Generate summarization using Anthropic API and Claude-3.5-sonnet.
-
-        Parameters
-        ----------
-        prompt : str
-            Input prompt.
-
-        Returns
-        -------
-        str
-            Summarized text.
-        """
-        client = Anthropic()
-
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            temperature=0,
-            max_tokens=1000,
-            system="Imagine you are extremely proficient in summarization, summarize incoming text",
-            messages=[
-                {"role": "user", "content": f'Summarize this: "{prompt}"'}
-            ]
-        )
-
-        return message.content[0].text
-
-    @staticmethod
-    def generate_together(prompt: str) -> str:
-        """Generate summarization using TogetherAI and LLama 3.2 3B Instruct Turbo.
-
-        Parameters
-        ----------
-        prompt : str
-            Input prompt.
-
-        Returns
-        -------
-        str
-            Summarized text.
-        """
-        client = Together()
-
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.2-3B-Instruct-Turbo",
-            messages=[
-                {"role": "system", "content": "Imagine you are extremely proficient in summarization, summarize incoming text"},
-                {"role": "user", "content": f'Summarize this: "{prompt}"'}
-            ],
-        )
-
-        return response.choices[0].message.content
-
-    def execute(self, prompt: str, provider) -> bytes:
-        """Generate summarization.
-
-        Parameters
-        ----------
-        prompt : str
-            Input prompt
-        provider
-            LLM provider
-
-        Returns
-        -------
-        bytes
-            Output Image
-        """
-        generate: Callable[[str], str] = None
-        match provider:
-            case "OpenAI":
-                generate = self.generate_openai
-            case "Anthropic":
-                generate = self.generate_anhtropic
-            case "TogetherAI":
-                generate = self.generate_together
-
-        return generate(prompt)
-
-
 text_summarization = Generator()
 
+with st.sidebar.expander("Summary cache"):
+    st.json(text_summarization.cache.stats())
+
 provider = st.sidebar.selectbox(
     "Select LLM provider",
-    ("OpenAI", "Anthropic", "TogetherAI")
+    ("OpenAI", "Anthropic", "TogetherAI", routing.AUTO)
+)
+budget = st.sidebar.number_input(
+    "Max cost per request, $", min_value=0.0, value=None, step=0.01, format="%.4f", placeholder="No limit",
+    help="Auto picks the fastest healthy provider whose estimated cost is within this budget."
+) if provider == routing.AUTO else None
+over_budget = budget is not None and st.sidebar.toggle(
+    "Fail over past budget",
+    help="If every provider within budget fails, providers over it are tried too."
+)
+hedge = provider in HEDGE_BACKUPS and st.sidebar.toggle(
+    "Hedge with backup provider",
+    help=f"If {provider} hasn't started answering within its usual time (p95), "
+         f"{HEDGE_BACKUPS[provider]} is asked too and the faster one is shown."
 )
 
+
+def summarize(text: str, provider: str, hedge: bool, budget: float | None, over_budget: bool):
+    """Stream summary in a worker, returns details of the call, as they are only known to the worker thread."""
+    yield from text_summarization.execute_stream(
+        prompt=text, provider=provider, hedge=hedge, budget=budget, over_budget=over_budget
+    )
+    return {
+        "similarity": text_summarization.cache.last(),
+        "record": streaming.last(provider),
+        "hedge": hedging.last(provider) if hedge else None,
+        "routed": ROUTER.last() if provider == routing.AUTO else None,
+    }
+
+
+def render(task: workers.Task) -> None:
+    st.write("".join(task.outputs))
+    if task.state != workers.DONE:
+        return
+    details = task.result
+    if details["similarity"] is not None:
+        st.caption(f"From cache, text is {details['similarity']:.0%} similar to an earlier one")
+        return
+    record = details["record"]
+    st.caption(f"Time to first token: {record.ttft:.2f}s, {record.tokens_per_second:.1f} tokens/s")
+    if details["hedge"] is not None and details["hedge"].fired:
+        st.caption(f"Hedged: {details['hedge'].backup} was asked too, {details['hedge'].winner} answered first.")
+    if details["routed"] is not None:
+        st.caption(f"Routed to {details['routed']}")
+
+
 with st.form("my_form"):
     text = st.text_area(
         "Enter text:",
@@ -151,4 +86,21 @@ with st.form("my_form"):
     )
     submitted = st.form_submit_button("Submit")
     if submitted:
-        st.info(text_summarization.execute(prompt=text, provider=provider))
+        st.session_state["text_summarization_api"] = workers.submit(
+            functools.partial(summarize, text, provider, hedge, budget, over_budget),
+            key="text_summarization_api", provider=provider
+        )
+
+
+workers.show(st.session_state.get("text_summarization_api"), render)
+
+if hedge:
+    with st.expander("Hedging report"):
+        report = hedging.report("text_summarization")
+        if report:
+            st.dataframe(report, hide_index=True)
+        else:
+            st.write("No hedged calls yet.")
+if provider == routing.AUTO:
+    with st.expander("Provider routing"):
+        st.dataframe(ROUTER.snapshot(), hide_index=True)
@@ -1,18 +1,16 @@
 """Streamlit page for text summarization using LangChain."""
-import os
+import functools
+import io
 
 import streamlit as st
-from dotenv import load_dotenv
 
-from langchain_core.language_models import BaseChatModel
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_anthropic import ChatAnthropic
-from langchain_openai import ChatOpenAI
-from langchain_google_vertexai import ChatVertexAI
+from explore_gen_ai_apis import clients, env, streaming, summary_cache, workers
+from explore_gen_ai_apis.text_summarization_langchain import (
+    cached_response, get_chat_model, stream_response, summarize_long
+)
 
 
-load_dotenv()
+env.load()
 
 st.set_page_config(page_title="Text summarization demo")
 
@@ -20,49 +18,51 @@ st.markdown("# Text summarization demo")
 st.sidebar.header("Text summarization demo")
 st.markdown("Please select provider in a sidebar.")
 
+provider = st.sidebar.selectbox(
+    "Select LLM provider",
+    ("OpenAI", "Vertex", "Anthropic")
+)
 
-def generate_response(input_text: str, model: BaseChatModel) -> str:
-    """Generate LLM summarization response
+if st.sidebar.button("Reload models", help="Re-read .env and rebuild LLM clients, e.g. after API keys changed"):
+    env.reload()
+    clients.invalidate("langchain:")
 
-    Parameters
-    ----------
-    input_text : str
-        Input text
-    model : langchain_core.language_models.BaseChatModel
-        LangChain ChatModel to use for summarization.
+long_document = st.sidebar.toggle("Long document mode")
+if long_document:
+    chunk_tokens = st.sidebar.number_input("Tokens per chunk", min_value=500, value=3000, step=500)
+    max_concurrency = st.sidebar.number_input("Parallel requests", min_value=1, value=4)
 
-    Returns
-    -------
-    str
-        Summarized text.
-    """
-    prompt_template = ChatPromptTemplate.from_messages([
-        (
-            'system',
-            'Imagine you are extremely proficient in summarization, summarize incoming text'
-        ),
-        (
-            'human',
-            'Summarize this:\n{input_text}'
-        )
-    ])
-    chain = prompt_template | model | StrOutputParser()
-    return chain.invoke({'input_text': input_text})
 
+def summarize(text: str, provider: str, llm):
+    """Stream summary in a worker, returns details of the call, as they are only known to the worker thread."""
+    summary = cached_response(text, llm)
+    if summary is not None:
+        yield summary
+        return {"similarity": summary_cache.get_default().last()}
+    yield from streaming.record_stream(
+        provider, stream_response(text, model=llm), "text_summarization_langchain_stream"
+    )
+    return {"record": streaming.last(provider)}
+
+
+def summarize_document(source: io.TextIOBase, llm, chunk_tokens: int, max_concurrency: int) -> dict:
+    return {"summary": summarize_long(source, model=llm, chunk_tokens=chunk_tokens, max_concurrency=max_concurrency)}
 
-provider = st.sidebar.selectbox(
-    "Select LLM provider",
-    ("OpenAI", "Vertex", "Anthropic")
-)
 
-llm = None
-match provider:
-    case "OpenAI":
-        llm = ChatOpenAI(model='gpt-4o', temperature=0, api_key=os.environ['OPENAI_API_KEY'])
-    case "Vertex":
-        llm = ChatVertexAI(model="gemini-1.5-flash-001")
-    case "Anthropic":
-        llm = ChatAnthropic(model='claude-3-5-haiku-20241022')
+def render(task: workers.Task) -> None:
+    if task.outputs:
+        st.write("".join(task.outputs))
+    if task.state != workers.DONE:
+        return
+    details = task.result
+    if "summary" in details:
+        st.info(details["summary"])
+    elif "similarity" in details:
+        st.caption(f"From cache, text is {details['similarity']:.0%} similar to an earlier one")
+    else:
+        record = details["record"]
+        st.caption(f"Time to first token: {record.ttft:.2f}s, {record.tokens_per_second:.1f} tokens/s")
+
 
 with st.form("my_form"):
     text = st.text_area(
@@ -79,6 +79,23 @@ with st.form("my_form"):
             "importance of ongoing learning and adaptability in the field."
         )
     )
+    if long_document:
+        uploaded_file = st.file_uploader("Or upload text file:", type=["txt", "md"])
     submitted = st.form_submit_button("Submit")
-    if submitted:
-        st.info(generate_response(text, model=llm))
+    llm = get_chat_model(provider) if submitted else None
+    if submitted and long_document:
+        if uploaded_file is not None:
+            source = io.TextIOWrapper(uploaded_file, encoding="utf-8", errors="replace")
+        else:
+            source = io.StringIO(text)
+        st.session_state["text_summarization_langchain"] = workers.submit(
+            functools.partial(summarize_document, source, llm, chunk_tokens, max_concurrency),
+            key="text_summarization_langchain", provider=provider
+        )
+    elif submitted:
+        st.session_state["text_summarization_langchain"] = workers.submit(
+            functools.partial(summarize, text, provider, llm), key="text_summarization_langchain", provider=provider
+        )
+
+
+workers.show(st.session_state.get("text_summarization_langchain"), render)
@@ -1,14 +1,14 @@
 """Streamlit page for text translation."""
-import os
-from typing import Callable
+import functools
+import io
 
 import streamlit as st
-import requests
-import deepl
-from dotenv import load_dotenv
 
+from explore_gen_ai_apis import env, routing, workers
+from explore_gen_ai_apis.translation import Generator
 
-load_dotenv()
+
+env.load()
 
 st.set_page_config(page_title="Translation demo")
 
@@ -17,88 +17,55 @@ st.sidebar.header("Translation demo")
 st.markdown("Please select provider in a sidebar.")
 
 
-class Generator:
-    """Class that contains all generate methods."""
-    @staticmethod
-    def generate_rapidapi(prompt: str) -> str:
-        """Generate Spanish translation using rapidai.
-
-        Parameters
-        ----------
-        prompt : str
-            Input text.
-
-        Returns
-        -------
-        str
-            Spanish translation.
-        """
-        url = "https://nlp-translation.p.rapidapi.com/v1/translate"
-
-        payload = {
-            "text": prompt,
-            "to": "es",
-            "from": "en"
-        }
-
-        headers = {
-            "x-rapidapi-key": os.environ['RAPIDAPI_API_KEY'],
-            "x-rapidapi-host": "nlp-translation.p.rapidapi.com",
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-
-        response = requests.post(url, data=payload, headers=headers)
-
-        return response.json()['translated_text']['es']
-
-    @staticmethod
-    def generate_deepl(prompt: str) -> str:
-        """Generate Spanish translation using deepl.
-
-        Parameters
-        ----------
-        prompt : str
-            Input text.
-
-        Returns
-        -------
-        str
-            Spanish translation.
-        """
-        translator = deepl.Translator(os.environ['DEEPL_API_KEY'])
-        return translator.translate_text(prompt, target_lang="ES").text
-
-    def execute(self, prompt: str, provider) -> str:
-        """Generate summarization.
-
-        Parameters
-        ----------
-        prompt : str
-            Input text.
-        provider
-            Translation provider.
-
-        Returns
-        -------
-        str
-            Spanish translation.
-        """
-        generate: Callable[[str], str] = None
-        match provider:
-            case "rapidapi":
-                generate = self.generate_rapidapi
-            case "deepl":
-                generate = self.generate_deepl
-
-        return generate(prompt)
-
-
 translator = Generator()
 
 provider = st.sidebar.selectbox(
     "Select model provider",
-    ("rapidapi", "deepl")
+    ("rapidapi", "deepl", routing.AUTO)
+)
+budget = st.sidebar.number_input(
+    "Max cost per request, $", min_value=0.0, value=None, step=0.01, format="%.4f", placeholder="No limit",
+    help="Auto picks the fastest healthy provider whose estimated cost is within this budget."
+) if provider == routing.AUTO else None
+over_budget = budget is not None and st.sidebar.toggle(
+    "Fail over past budget",
+    help="If every provider within budget fails, providers over it are tried too."
 )
+batch = st.sidebar.toggle("Batch mode (one text per line)")
+
+with st.sidebar.expander("Translation memory"):
+    st.write(f"{len(translator.memory)} segments, {translator.memory.hits} hits, {translator.memory.misses} misses")
+    # Export is only built on request, it can be large
+    if st.button("Prepare export"):
+        st.download_button("Download", "".join(translator.memory.export_jsonl()), "translation_memory.jsonl")
+    memory_file = st.file_uploader("Import", type=["jsonl"])
+    if memory_file is not None and st.button("Import segments"):
+        st.write(f"Imported {translator.memory.import_jsonl(io.TextIOWrapper(memory_file, encoding='utf-8'))} segments")
+
+
+def translate(texts: list[str], provider: str, budget: float | None, over_budget: bool, batch: bool) -> dict:
+    if batch:
+        translations = translator.execute_batch(
+            prompts=texts, provider=provider, budget=budget, over_budget=over_budget
+        )
+    else:
+        translations = [translator.execute(prompt=texts[0], provider=provider, budget=budget, over_budget=over_budget)]
+    # Routing choice is only known to the worker thread
+    routed = translator.ROUTER.last() if provider == routing.AUTO else None
+    return {"texts": texts, "translations": translations, "routed": routed, "batch": batch}
+
+
+def render(task: workers.Task) -> None:
+    if task.state != workers.DONE:
+        return
+    details = task.result
+    if details["batch"]:
+        st.dataframe({"Text": details["texts"], "Translation": details["translations"]}, use_container_width=True)
+    else:
+        st.info(details["translations"][0])
+    if details["routed"] is not None:
+        st.caption(f"Routed to {details['routed']}")
+
 
 with st.form("my_form"):
     text = st.text_area(
@@ -107,4 +74,15 @@ with st.form("my_form"):
     )
     submitted = st.form_submit_button("Submit")
     if submitted:
-        st.info(translator.execute(prompt=text, provider=provider))
+        texts = [line for line in text.splitlines() if line.strip()] if batch else [text]
+        st.session_state["translation"] = workers.submit(
+            functools.partial(translate, texts, provider, budget, over_budget, batch),
+            key="translation", provider=provider
+        )
+
+
+workers.show(st.session_state.get("translation"), render)
+
+if provider == routing.AUTO:
+    with st.expander("Provider routing"):
+        st.dataframe(translator.ROUTER.snapshot(), hide_index=True)
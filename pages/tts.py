@@ -1,13 +1,13 @@
 """Streamlit page for TTS."""
-import os
-from typing import Callable
+import functools
 
-import requests
 import streamlit as st
-from dotenv import load_dotenv
 
+from explore_gen_ai_apis import env, media_cache, routing, workers
+from explore_gen_ai_apis.tts import LONG_SCRIPT, ROUTER, Generator
 
-load_dotenv()
+
+env.load()
 
 st.set_page_config(page_title="TTS demo")
 
@@ -16,132 +16,44 @@ st.sidebar.header("TTS demo")
 st.markdown("Please select provider in a sidebar.")
 
 
-class Generator:
-    """Class that contains all generate methods."""
-    @staticmethod
-    def generate_elevenlabs(prompt: str) -> str:
-        """TTS using elevenlabs.
-
-        Parameters
-        ----------
-        prompt : str
-            Inout text.
-
-        Returns
-        -------
-        str
-            Url to audio.
-        """
-        url = "https://api.elevenlabs.io/v1/text-to-speech/9BWtsMINqrJLrRacOk9x"
-
-        payload = {
-            "text": prompt,
-        }
-        headers = {
-            "xi-api-key": os.environ['ELEVENLABS_API_KEY'],
-            "Content-Type": "application/json"
-        }
-
-        response = requests.post(url, json=payload, headers=headers)
-
-        return response.content
-
-    @staticmethod
-    def generate_lovo(prompt: str) -> str:
-        """TTS using lovo.
-
-        Parameters
-        ----------
-        prompt : str
-            Input text.
-
-        Returns
-        -------
-        str
-            Url to audio.
-        """
-        url = "https://api.genny.lovo.ai/api/v1/tts/sync"
-
-        payload = {
-            "text": prompt,
-            "speaker": "62e8c3581ffadc3ff72832aa"
-        }
-        headers = {
-            "x-api-key": os.environ['LOVO_API_KEY'],
-            "Content-Type": "application/json"
-        }
-
-        # It has timeout of 90 seconds, after that you would need to retrieve the recording
-        response = requests.post(url, json=payload, headers=headers)
-
-        return response.json()['data']['urls'][0]
-
-    @staticmethod
-    def generate_murf(prompt: str) -> str:
-        """TTS using murf.ai.
-
-        Parameters
-        ----------
-        prompt : str
-            Input text.
-
-        Returns
-        -------
-        str
-            Url to audio.
-        """
-        url = "https://api.murf.ai/v1/speech/generate"
-
-        payload = {
-            "voiceId": "en-US-natalie",
-            "text": prompt,
-            "format": "MP3",
-            "channelType": "MONO",
-            "modelVersion": "GEN2",
-        }
-        headers = {
-            "api-key": os.environ['MURF_API_KEY'],
-            "Content-Type": "application/json"
-        }
-
-        # It has timeout of 90 seconds, after that you would need to retrieve the recording
-        response = requests.post(url, json=payload, headers=headers)
-
-        return response.json()['audioFile']
-
-    def execute(self, prompt: str, provider) -> str:
-        """TTS.
-
-        Parameters
-        ----------
-        prompt : str
-            Input text.
-        provider
-            Translation provider.
-
-        Returns
-        -------
-        str
-            Url to audio.
-        """
-        generate: Callable[[str], str] = None
-        match provider:
-            case "elevenlabs":
-                generate = self.generate_elevenlabs
-            case "lovo":
-                generate = self.generate_lovo
-            case "murf":
-                generate = self.generate_murf
-
-        return generate(prompt)
-
-
 tts_generator = Generator()
 
+with st.sidebar.expander("Media cache"):
+    st.json(media_cache.get_default().stats())
+
 provider = st.sidebar.selectbox(
     "Select model provider",
-    ("elevenlabs", "lovo", "murf")
+    ("elevenlabs", "lovo", "murf", routing.AUTO)
 )
+budget = st.sidebar.number_input(
+    "Max cost per request, $", min_value=0.0, value=None, step=0.01, format="%.4f", placeholder="No limit",
+    help="Auto picks the fastest healthy provider whose estimated cost is within this budget."
+) if provider == routing.AUTO else None
+over_budget = budget is not None and st.sidebar.toggle(
+    "Fail over past budget",
+    help="If every provider within budget fails, providers over it are tried too."
+)
+long_script = provider in LONG_SCRIPT and st.sidebar.toggle(
+    "Long script mode",
+    help="Synthesize script in parallel pieces split at sentence boundaries"
+)
+
+
+def synthesize(text: str, provider: str, budget: float | None, over_budget: bool, long_script: bool) -> dict:
+    if long_script:
+        return {"audio": tts_generator.execute_long(prompt=text, provider=provider), "routed": None}
+    audio = tts_generator.execute(prompt=text, provider=provider, budget=budget, over_budget=over_budget)
+    # Routing choice is only known to the worker thread
+    return {"audio": audio, "routed": ROUTER.last() if provider == routing.AUTO else None}
+
+
+def render(task: workers.Task) -> None:
+    if task.state != workers.DONE:
+        return
+    st.audio(task.result["audio"])
+    if task.result["routed"] is not None:
+        st.caption(f"Routed to {task.result['routed']}")
+
 
 with st.form("my_form"):
     text = st.text_area(
@@ -150,4 +62,14 @@ with st.form("my_form"):
     )
     submitted = st.form_submit_button("Submit")
     if submitted:
-        st.audio(tts_generator.execute(prompt=text, provider=provider))
+        st.session_state["tts"] = workers.submit(
+            functools.partial(synthesize, text, provider, budget, over_budget, long_script),
+            key="tts", provider=provider
+        )
+
+
+workers.show(st.session_state.get("tts"), render)
+
+if provider == routing.AUTO:
+    with st.expander("Provider routing"):
+        st.dataframe(ROUTER.snapshot(), hide_index=True)